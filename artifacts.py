@@ -1,29 +1,95 @@
+import asyncio
 import base64
+import gzip
+import hashlib
 import html
-import io
 import json
 import logging
 import os
+import re
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import UTC, datetime
 from functools import wraps
 from io import BytesIO
-from typing import Any
+from typing import IO, Any
 
 from jinja2 import Environment, FileSystemLoader
-from playwright.async_api import Browser, async_playwright
-from pypdf import PdfReader, PdfWriter
 
+import images
+import tracing
+from attachments import (
+    AttachmentFetcher,
+    UploadedAttachment,
+    close_attachments,
+    is_multipart,
+    read_multipart_params,
+    request_attachments,
+)
+from cache import LRUCache, hash_data
+from compression import decoded_etag
+from config import artifacts_config, images_config, render_config
+from deadline import CLIENT_CONNECTION, ClientDisconnected, Deadline, DeadlineExceeded, InvalidDeadline
+from render_cache import RenderCache
+from renderer import Renderer
 from s3utils import (
+    THUMBNAIL_PREFIX,
+    InvalidStorageURL,
+    check_storage_url,
     create_s3_client,
     generate_presigned_url,
     generate_private_link,
     get_bucket_for_storage,
+    invalidate_listings,
 )
+from scheduler import DEFAULT_TENANT, PRIORITIES, FairScheduler, UnknownPriority
+from spool import MemoryBudget, as_stream, buffer_size
 
 logger = logging.getLogger(__name__)
 
+
 # For a given key, specify any attachment templates associated with the main template
 ASSOCIATED_DOCUMENTS_MAP = {"blm-ce.html": []}
 
+# Shared assets that "linked" previews reference instead of inlining.
+# Maps the public asset name to (source template, content type).
+STATIC_ASSETS = {
+    "base-styles.css": ("base-styles.html", "text/css; charset=utf-8"),
+    "tailwind.js": ("tailwind.html", "text/javascript; charset=utf-8"),
+    "blm_logo.svg": ("blm_logo.svg", "image/svg+xml"),
+}
+
+# External references in templates that renders answer with the bundled copy of the asset
+RENDER_ASSET_URLS = {
+    "https://cdn.jsdelivr.net/npm/@tailwindcss/browser@4": "tailwind.js",
+}
+
+PREVIEW_MODES = ("inline", "linked")
+
+# Used when combining HTML documents into a single print document
+_HEAD_RE = re.compile(r"<head[^>]*>(.*?)</head>", re.DOTALL | re.IGNORECASE)
+_BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.DOTALL | re.IGNORECASE)
+_TITLE_RE = re.compile(r"<title[^>]*>.*?</title>", re.DOTALL | re.IGNORECASE)
+_SECTION_BREAK_STYLE = (
+    "<style>.render-section { position: relative; break-after: page; }"
+    " .render-section:last-child { break-after: auto; }</style>"
+)
+
+# Options for Chromium's page.pdf(); part of the render cache key
+PDF_OPTIONS = {"print_background": True}
+
+# Recorded in the metadata of every uploaded artifact
+ARTIFACT_GENERATOR = "spiffworkflow-connector"
+
+# Thumbnails are screenshots of a Letter page (page.pdf()'s default size) at 96 CSS pixels per inch
+THUMBNAIL_VIEWPORT = {"width": 816, "height": 1056}
+THUMBNAIL_FORMATS = ("png", "webp")
+
+# Matches a template partial that is nothing but a single <style> or <script> element
+_WRAPPED_ASSET_RE = re.compile(r"^\s*<(style|script)[^>]*>(.*)</\1>\s*$", re.DOTALL)
+
 
 def command_handler(error_context: str):
     """
@@ -38,6 +104,25 @@ def command_handler(error_context: str):
             try:
                 response, status = await func(self, req, resp, *args, **kwargs)
 
+            except DeadlineExceeded as e:
+                logger.warning(f"{error_context}: {e}")
+                response = "error"
+                status = 504
+                error = json.dumps({"error": str(e)})
+
+            except ClientDisconnected as e:
+                # Nobody is waiting for the response any more, which is not an error of ours
+                logger.info(f"{error_context}: {e}")
+                response = "error"
+                status = 499
+                error = json.dumps({"error": str(e)})
+
+            except (InvalidStorageURL, UnknownPriority, UnknownThumbnailFormat, InvalidDeadline) as e:
+                logger.warning(f"{error_context}: {e}")
+                response = "error"
+                status = 400
+                error = json.dumps({"error": str(e)})
+
             except Exception as e:
                 logger.error(f"{error_context}: {e}", exc_info=True)
                 response = "error"
@@ -60,16 +145,118 @@ def command_handler(error_context: str):
     return decorator
 
 
+class UnknownThumbnailFormat(ValueError):
+    """A request asked for a thumbnail format other than THUMBNAIL_FORMATS."""
+
+
+@dataclass
+class RenderOptions:
+    """Per-request options for the PDF render pipeline."""
+
+    # Deduplicate identical objects (fonts, images, the logo) and compress content streams
+    optimize_pdf: bool = False
+    # Linearize the merged PDF for fast web view (requires pikepdf)
+    linearize: bool = False
+    # Render consecutive HTML sections as one print document instead of one page.pdf() each
+    single_pass: bool = False
+    # Also take a thumbnail of the first page in this format ("png" or "webp")
+    thumbnail: str | None = None
+
+    @classmethod
+    def from_params(cls, params: dict[str, Any]) -> "RenderOptions":
+        return cls(
+            optimize_pdf=_param_bool(params, "optimize_pdf", artifacts_config.optimize_pdf),
+            linearize=_param_bool(params, "linearize", artifacts_config.linearize_pdf),
+            single_pass=_param_bool(params, "single_pass", artifacts_config.single_pass_render),
+            thumbnail=_thumbnail_format(params),
+        )
+
+
+@dataclass
+class RenderedPdf:
+    """A rendered artifact: the merged PDF, its page count and, if one was asked for, its thumbnail."""
+
+    pdf: bytes
+    page_count: int
+    # (content type, image)
+    thumbnail: tuple[str, bytes] | None = None
+
+
+def _param_bool(params: dict[str, Any], key: str, default: bool) -> bool:
+    value = params.get(key)
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def _thumbnail_format(params: dict[str, Any]) -> str | None:
+    """The thumbnail parameter: false (default), true for THUMBNAIL_FORMAT, or "png" or "webp"."""
+    value = params.get("thumbnail")
+    if isinstance(value, str) and value.strip().lower() in THUMBNAIL_FORMATS:
+        return value.strip().lower()
+    if isinstance(value, str) and value.strip().lower() not in ("", "0", "1", "true", "false", "yes", "no"):
+        raise UnknownThumbnailFormat(
+            f"Unknown thumbnail format '{value}'; expected one of: {', '.join(THUMBNAIL_FORMATS)}"
+        )
+    return artifacts_config.thumbnail_format if _param_bool(params, "thumbnail", False) else None
+
+
 def check_required_parameters(required_params: list[str], params: dict[str, Any]) -> None:
     if not all([params[key] for key in required_params]):
         errorMessage = "Missing required parameters: " + ", ".join(required_params) + " required"
         raise ValueError(errorMessage)
 
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check an If-None-Match value (possibly a list, possibly weak, possibly the ETag of a
+    compressed copy) against an etag.
+    """
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if decoded_etag(candidate.strip('"')) == etag:
+            return True
+
+    return False
+
+
 class v1_do_artifacts_connector:
-    def __init__(self):
+    def __init__(self, http_client=None, render_pool=None):
         self.template_path = os.path.abspath("./templates")
         self.env = Environment(loader=FileSystemLoader(self.template_path))
+        # Fetches attachments given as s3:// or https:// references
+        self.attachment_fetcher = AttachmentFetcher(http_client)
+        # The shared Chromium instance used for every render
+        self.renderer = Renderer(resolve_asset=self._render_asset)
+        # When set, renders run in separate worker processes instead (see render_workers)
+        self.render_pool = render_pool
+        # Shares render capacity fairly between tenants, interactive jobs ahead of bulk ones
+        self.scheduler = FairScheduler.from_config()
+        # Renders keyed by (template version, render options, HTML)
+        self.render_cache = (
+            RenderCache(
+                render_config.cache_memory_bytes,
+                render_config.cache_dir,
+                render_config.cache_max_bytes,
+                ttl=render_config.cache_ttl,
+            )
+            if render_config.cache_enabled
+            else None
+        )
+        # Rendered previews keyed by (template version, data hash)
+        self.preview_cache = LRUCache(maxsize=artifacts_config.preview_cache_size)
+        self._static_assets: dict[str, tuple[str, bytes, str]] = {}
+        self._static_assets_version: str | None = None
+        self._templates_version_cache: tuple[str, float] | None = None
 
     @command_handler("Error generating HTML Preview")
     async def on_post_generate_html_preview(self, req, resp):
@@ -80,65 +267,111 @@ class v1_do_artifacts_connector:
         template_name = params.get("template")
         template_data = params.get("data")
         task_data = params.get("spiff__task_data")
+        preview_mode = params.get("preview_mode") or "inline"
+        compress = bool(params.get("compress", False))
 
-        template_data = self._format_template_data(template_name, template_data, task_data)
+        if preview_mode not in PREVIEW_MODES:
+            raise ValueError(f"Unsupported preview_mode '{preview_mode}', expected one of: {', '.join(PREVIEW_MODES)}")
 
-        rendered_document = self._render_template_html(template_name, template_data)
+        # "linked" previews reference the shared stylesheet, script and logo served from
+        # /static instead of inlining ~500KB of assets into every payload.
+        asset_base_url = self._asset_base_url(req) if preview_mode == "linked" else None
 
-        # We escape and encode the HTML as base64 so it can more easily be used as a data URL in an iframe
-        rendered_document_base64 = base64.b64encode(rendered_document.encode()).decode()
-        rendered_document_escaped_base64 = html.escape(rendered_document_base64)
+        # Previews are requested repeatedly with unchanged data, so we key them by the
+        # template version and a canonical hash of the data and skip rendering when we can.
+        etag = self._preview_etag(template_name, template_data or task_data, preview_mode, compress, asset_base_url)
+        resp.etag = etag
 
-        # Generate response
-        response = {"previewData": rendered_document_escaped_base64}
-        status = 200
-        return response, status
+        if _etag_matches(req.get_header("If-None-Match") or params.get("etag"), etag):
+            return {"etag": etag, "notModified": True}, 304
 
-    @command_handler("Error generating artifact")
-    async def on_post_generate_artifact(self, req, resp):
-        """Handle the artifacts/GenerateArtifact command."""
-        params = await req.media
-        check_required_parameters(["id", "template"], params)
+        rendered_document_escaped_base64 = self.preview_cache.get(etag)
+        if rendered_document_escaped_base64 is None:
+            template_data = self._format_template_data(template_name, template_data, task_data)
+            if asset_base_url:
+                template_data["asset_base_url"] = asset_base_url
+                template_data["asset_version"] = self._templates_version()[:12]
 
-        # Extract parameters
-        artifact_id = params.get("id")
-        template_name = params.get("template")
-        template_data = params.get("data")
-        generate_links = params.get("generate_links", False)
-        storage = params.get("storage")
-        task_data = params.get("spiff__task_data")
-        attachments = template_data.get("attachments", [])
-
-        template_data = self._format_template_data(template_name, template_data, task_data)
+            rendered_document = self._render_template_html(template_name, template_data).encode()
+            if compress:
+                rendered_document = gzip.compress(rendered_document)
 
-        # Render the HTML for the main template
-        rendered_document = self._render_template_html(template_name, template_data)
-
-        # Render the HTML for any attachments associated with the main template
-        # These are attachments that are *always* added to the document, not attachments
-        # a user has uploaded.
-        associated_documents: list[str] = []
-        for associated_document_template in ASSOCIATED_DOCUMENTS_MAP.get(template_name, []):
-            associated_documents.append(self._render_template_html(associated_document_template, template_data))
-
-        pdf_buffer = await self._generate_pdf_with_attachments(rendered_document, associated_documents, attachments)
-
-        # Prepare for S3 upload
-        pdf_stream = io.BytesIO(pdf_buffer)
-        pdf_stream.seek(0)
-
-        # Get S3 client and bucket
-        s3_client = create_s3_client(storage)
-        bucket = get_bucket_for_storage(storage)
-
-        # Upload to S3
-        s3_client.put_object(Bucket=bucket, Key=artifact_id, Body=pdf_stream)
+            # We escape and encode the HTML as base64 so it can more easily be used as a data URL in an iframe
+            rendered_document_base64 = base64.b64encode(rendered_document).decode()
+            rendered_document_escaped_base64 = html.escape(rendered_document_base64)
+            self.preview_cache.set(etag, rendered_document_escaped_base64)
 
         # Generate response
-        response = self._generate_artifact_response(s3_client, bucket, artifact_id, generate_links)
+        response = {"previewData": rendered_document_escaped_base64, "etag": etag}
+        if compress:
+            response["previewEncoding"] = "gzip"
         status = 200
         return response, status
 
+    @command_handler("Error generating artifact")
+    async def on_post_generate_artifact(self, req, resp):
+        """Handle the artifacts/GenerateArtifact command."""
+        params = await self._read_generate_artifact_params(req)
+        try:
+            check_required_parameters(["id", "template"], params)
+
+            # Extract parameters
+            artifact_id = params.get("id")
+            template_name = params.get("template")
+            template_data = params.get("data")
+            generate_links = params.get("generate_links", False)
+            storage = params.get("storage")
+            task_data = params.get("spiff__task_data")
+            attachments = template_data.get("attachments", [])
+            render_options = RenderOptions.from_params(params)
+            check_storage_url(storage)
+            render_slot = self._render_slot(req, params)
+            deadline = Deadline.from_request(req, params)
+
+            template_data = self._format_template_data(template_name, template_data, task_data)
+
+            # Render the HTML for the main template
+            rendered_document = self._render_template_html(template_name, template_data)
+
+            # Render the HTML for any attachments associated with the main template
+            # These are attachments that are *always* added to the document, not attachments
+            # a user has uploaded.
+            associated_documents: list[str] = []
+            for associated_document_template in ASSOCIATED_DOCUMENTS_MAP.get(template_name, []):
+                associated_documents.append(self._render_template_html(associated_document_template, template_data))
+
+            budget = MemoryBudget.from_config()
+            try:
+                rendered = await self._render_artifact(
+                    req,
+                    deadline,
+                    render_slot,
+                    rendered_document,
+                    associated_documents,
+                    attachments,
+                    render_options,
+                    budget,
+                )
+            finally:
+                close_attachments(attachments)
+                resp.set_header("X-Artifact-Memory", budget.header_value())
+
+            # Get S3 client and bucket
+            s3_client = create_s3_client(storage)
+            bucket = get_bucket_for_storage(storage)
+
+            # Upload to S3, unless nobody is waiting for the result any more
+            deadline.check("upload")
+            preview = self._store_artifact(s3_client, bucket, artifact_id, rendered, template_name)
+
+            # Generate response
+            response = self._generate_artifact_response(s3_client, bucket, artifact_id, generate_links, preview)
+            status = 200
+            return response, status
+        finally:
+            # Uploads are spooled to disk, which must not outlive the request however it ends
+            close_attachments(request_attachments(params))
+
     @command_handler("Error generating link")
     async def on_post_get_link(self, req, resp):
         """Handle the artifacts/GetLinkToArtifact command."""
@@ -162,95 +395,550 @@ class v1_do_artifacts_connector:
         status = 200
         return response, status
 
+    async def _read_generate_artifact_params(self, req) -> dict[str, Any]:
+        """
+        GenerateArtifact accepts either a JSON body, with attachments as base64 data URLs,
+        or multipart/form-data, with attachments as file parts.
+        """
+        if is_multipart(req):
+            return await read_multipart_params(req)
+        return await req.media
+
+    def _render_slot(self, req, params: dict[str, Any]):
+        """
+        The scheduler slot a GenerateArtifact request renders in. The tenant is the tenant
+        header or else the artifact id's first segment (or the bucket, with RENDER_TENANT_KEY=bucket);
+        the priority is the X-Render-Priority header or the priority parameter.
+        """
+        tenant = req.get_header(render_config.tenant_header)
+        if not tenant:
+            if render_config.tenant_key == "bucket":
+                tenant = get_bucket_for_storage(params.get("storage"))
+            else:
+                # An id without a prefix names no tenant, rather than being a tenant of its own
+                prefix, separator, _ = str(params.get("id") or "").partition("/")
+                tenant = prefix if separator and prefix else DEFAULT_TENANT
+
+        priority = str(req.get_header("X-Render-Priority") or params.get("priority") or "interactive").lower()
+        if priority not in PRIORITIES:
+            raise UnknownPriority(f"Unknown priority '{priority}'; expected one of: {', '.join(PRIORITIES)}")
+        return self.scheduler.slot(tenant, priority)
+
     def _render_template_html(self, template_name, template_data) -> str:
         # Transform the data for rendering in the template
-        template = self.env.get_template(template_name)
-        return template.render(template_data)
+        with tracing.span("template.render", **{"template.name": template_name}):
+            template = self.env.get_template(template_name)
+            return template.render(template_data)
+
+    def _templates_version(self) -> str:
+        """
+        A cheap fingerprint of every template on disk (name, size and mtime), so that
+        cached renders are invalidated whenever a template or an included asset changes.
+        The templates are walked at most once every TEMPLATES_CHECK_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if self._templates_version_cache is not None:
+            version, checked_at = self._templates_version_cache
+            if now - checked_at < artifacts_config.templates_check_interval:
+                return version
+
+        digest = hashlib.sha256()
+        for search_path in self.env.loader.searchpath:
+            for root, dirs, files in os.walk(search_path):
+                dirs.sort()
+                for name in sorted(files):
+                    stat = os.stat(os.path.join(root, name))
+                    digest.update(
+                        f"{os.path.relpath(os.path.join(root, name), search_path)}:{stat.st_size}:{stat.st_mtime_ns};".encode()
+                    )
+        version = digest.hexdigest()
+        self._templates_version_cache = (version, now)
+        return version
+
+    def _asset_base_url(self, req) -> str:
+        if artifacts_config.public_asset_base_url:
+            return artifacts_config.public_asset_base_url.rstrip("/")
+        return f"{req.prefix}/static"
+
+    def static_assets(self) -> dict[str, tuple[str, bytes, str]]:
+        """
+        The shared assets served from /static, as name -> (content type, body, etag).
+        Rebuilt only when the templates change.
+        """
+        version = self._templates_version()
+        if version != self._static_assets_version:
+            assets = {}
+            for name, (source_template, content_type) in STATIC_ASSETS.items():
+                source, _, _ = self.env.loader.get_source(self.env, source_template)
+                # Partials like base-styles.html wrap their content in a <style> or <script> tag
+                match = _WRAPPED_ASSET_RE.match(source)
+                body = (match.group(2) if match else source).encode()
+                assets[name] = (content_type, body, hashlib.sha256(body).hexdigest()[:32])
+            self._static_assets = assets
+            self._static_assets_version = version
+        return self._static_assets
+
+    def _render_asset(self, url: str) -> tuple[str, bytes] | None:
+        """The (content type, body) of a static asset requested by a page being rendered."""
+        name = RENDER_ASSET_URLS.get(url)
+        if name is None and "/static/" in url:
+            # Linked-preview markup references assets as <base url>/static/<name>?v=<version>
+            name = url.split("?", 1)[0].rsplit("/static/", 1)[1]
+        asset = self.static_assets().get(name) if name else None
+        return (asset[0], asset[1]) if asset else None
+
+    def _preview_etag(self, template_name: str, data: Any, *variant: Any) -> str:
+        """Identify a preview by template, template version and data."""
+        return hash_data([template_name, self._templates_version(), data, *variant])[:32]
+
+    def metrics(self) -> dict[str, Any]:
+        """Cache counters for GET /metrics."""
+        return {
+            "preview_cache": {"hits": self.preview_cache.hits, "misses": self.preview_cache.misses},
+            "render_cache": self.render_cache.stats() if self.render_cache is not None else None,
+            "renderer": self.renderer.stats(),
+            "scheduler": self.scheduler.stats(),
+        }
 
     def _get_last_approval_date(self, approvers: list[dict[str, Any]]):
         return approvers[-1]["date"]
 
-    def _generate_artifact_response(self, s3_client, bucket: str, key: str, include_presigned: bool) -> dict[str, str]:
-        """Generate the response dictionary with appropriate links."""
-        response = {"private_link": generate_private_link(bucket, key)}
+    def _generate_artifact_response(
+        self, s3_client, bucket: str, key: str, include_presigned: bool, preview: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        """Generate the response dictionary with appropriate links, and the thumbnail's if one was stored."""
+        response: dict[str, Any] = {"private_link": generate_private_link(bucket, key)}
 
         if include_presigned:
             response["presigned_link"] = generate_presigned_url(s3_client, bucket, key)
 
+        if preview:
+            response["page_count"] = preview["page_count"]
+            response["thumbnail_private_link"] = generate_private_link(bucket, preview["thumbnail_key"])
+            if include_presigned:
+                response["thumbnail_presigned_link"] = generate_presigned_url(
+                    s3_client, bucket, preview["thumbnail_key"]
+                )
+
         return response
 
+    async def _render_thumbnail(self, html_content: str, image_format: str) -> tuple[str, bytes]:
+        """A thumbnail of html_content's first page, rendered on a page of its own."""
+        with tracing.span("thumbnail.render", **{"image.format": image_format}):
+            async with self.renderer.page() as page:
+                await page.set_viewport_size(THUMBNAIL_VIEWPORT)
+                await page.emulate_media(media="print")
+                await page.set_content(html_content, wait_until=render_config.wait_until)
+                screenshot = await page.screenshot(type="png")
+            return await images.thumbnail(screenshot, image_format, artifacts_config.thumbnail_width)
+
+    def _store_artifact(
+        self,
+        s3_client,
+        bucket: str,
+        artifact_id: str,
+        rendered: RenderedPdf,
+        template_name: str,
+    ) -> dict[str, Any] | None:
+        """
+        Upload a generated PDF, and its thumbnail if there is one, with a content type, the
+        ARTIFACT_CACHE_CONTROL policy and metadata describing the content and how it was
+        generated. Returns the thumbnail's key and the page count for the response, if any.
+        """
+        pdf = rendered.pdf
+        metadata = {
+            "sha256": hashlib.sha256(pdf).hexdigest(),
+            "generator": ARTIFACT_GENERATOR,
+            "template": template_name,
+            "generated-at": datetime.now(UTC).isoformat(timespec="seconds"),
+        }
+        preview = None
+        if rendered.thumbnail is not None:
+            content_type, image = rendered.thumbnail
+            metadata["page-count"] = str(rendered.page_count)
+            preview = {
+                "thumbnail_key": f"{THUMBNAIL_PREFIX}{artifact_id}.{content_type.removeprefix('image/')}",
+                "page_count": rendered.page_count,
+            }
+
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=artifact_id,
+            Body=BytesIO(pdf),
+            ContentType="application/pdf",
+            CacheControl=artifacts_config.artifact_cache_control,
+            Metadata=metadata,
+        )
+        if preview is not None:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=preview["thumbnail_key"],
+                Body=image,
+                ContentType=content_type,
+                CacheControl=artifacts_config.artifact_cache_control,
+                Metadata={**metadata, "sha256": hashlib.sha256(image).hexdigest()},
+            )
+        invalidate_listings(bucket, artifact_id)
+        return preview
+
+    async def _render_artifact(
+        self,
+        req,
+        deadline: Deadline,
+        render_slot,
+        document: str,
+        associated_documents: list[str],
+        attachments: list[str | UploadedAttachment],
+        options: RenderOptions,
+        budget: MemoryBudget,
+    ) -> RenderedPdf:
+        """
+        The PDF (and thumbnail) for a GenerateArtifact request, rendered in its scheduler slot.
+        The work is cancelled if the deadline passes or the client disconnects first.
+        """
+
+        async def render():
+            async with render_slot:
+                return await self._generate_pdf_with_attachments(
+                    document, associated_documents, attachments, options=options, budget=budget, deadline=deadline
+                )
+
+        connection = req.scope.get(CLIENT_CONNECTION) if artifacts_config.cancel_on_disconnect else None
+        return await deadline.run(render(), connection)
+
     async def _generate_pdf_with_attachments(
-        self, document: str, associated_documents: list[str], attachments: list[str]
-    ) -> bytes:
+        self,
+        document: str,
+        associated_documents: list[str],
+        attachments: list[str | UploadedAttachment],
+        options: RenderOptions | None = None,
+        budget: MemoryBudget | None = None,
+        deadline: Deadline | None = None,
+    ) -> RenderedPdf:
         """
         Generate a PDF: document is the main HTML to render, associated_documents is a list
         of other HTML documents to render afterwards, and attachments is a list of
-        use-uploaded documents to add as attachments.
+        use-uploaded documents (data URLs, uploaded files, or s3:// and https:// references)
+        to add as attachments. Intermediate data is counted against budget, and buffers are
+        spooled to disk beyond it. The deadline, if any, is checked between stages.
         """
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()  # Note: probably better to cache this at the class level?
-
-            # We will merge the form-data pdf with all attachments (which we render as separate pdfs).
-            form_data_pdf: bytes = await self._html_to_pdf(html_content=document, browser=browser)
-            attachment_pdfs: list[bytes] = []
-
-            async def add_attachment(attachment_pdf: bytes):
-                # We create a separate header page for each attachment so that we do not have
-                # to, e.g., add a header to an attachment that is already a pdf.
-                attachment_cover_page_template = self.env.get_template("attachment-cover.html")
-                attachment_cover_page_html = attachment_cover_page_template.render(
-                    {"attachmentNumber": len(attachment_pdfs) // 2 + 1}
+        options = options or RenderOptions()
+        budget = budget or MemoryBudget.from_config()
+        deadline = deadline or Deadline()
+        attachments = await self.attachment_fetcher.resolve(attachments)
+        # Data URLs stay in memory, as part of the request, until it is done
+        data_urls_size = sum(len(attachment) for attachment in attachments if isinstance(attachment, str))
+        try:
+            with budget.hold(data_urls_size):
+                deadline.check("image preparation")
+                attachments = await self._prepare_images(attachments, budget)
+                deadline.check("rendering")
+                return await self._render_pdf_with_attachments(
+                    document, associated_documents, attachments, options, budget
                 )
-                attachment_cover_page_pdf = await self._html_to_pdf(
-                    html_content=attachment_cover_page_html, browser=browser
+        finally:
+            close_attachments(attachments)
+            budget.close()
+            logger.info("Artifact memory: %s", budget.header_value())
+
+    async def _render_pdf_with_attachments(
+        self,
+        document: str,
+        associated_documents: list[str],
+        attachments: list[str | UploadedAttachment],
+        options: RenderOptions,
+        budget: MemoryBudget,
+    ) -> RenderedPdf:
+        sections = self._iter_sections(document, associated_documents, attachments, budget)
+
+        if self.render_pool is not None:
+            # The whole job goes to the worker in one message, so its sections are laid out up front
+            sections = list(sections)
+            html_size = sum(len(content) for kind, content in sections if kind == "html")
+            # Trace context isn't passed to the workers; the whole job is one span here
+            with budget.hold(html_size), tracing.span("render_worker.render", **{"sections.count": len(sections)}):
+                return await self.render_pool.render(sections, options)
+        return await self._render_sections(sections, options, budget)
+
+    async def _render_sections(
+        self, sections: Iterable[tuple[str, str | IO[bytes]]], options: RenderOptions, budget: MemoryBudget
+    ) -> RenderedPdf:
+        """
+        Render the HTML sections and merge them, with the PDF sections, into the final PDF.
+        The thumbnail, if any, is taken from the page the first HTML section is printed from.
+        """
+        if options.single_pass:
+            pdfs, thumbnail = await self._render_sections_single_pass(sections, budget, options.thumbnail)
+        else:
+            pdfs = []
+            thumbnail = None
+            thumbnail_format = options.thumbnail
+            for kind, content in sections:
+                if kind == "html":
+                    with budget.hold(len(content)):
+                        pdf, section_thumbnail = await self._html_to_pdf_with_thumbnail(content, thumbnail_format)
+                    content = budget.store(pdf)
+                    thumbnail = thumbnail or section_thumbnail
+                    thumbnail_format = None
+                pdfs.append(content)
+
+        pdf, page_count = self._merge_pdfs(pdfs, optimize=options.optimize_pdf, linearize=options.linearize)
+        return RenderedPdf(pdf, page_count, thumbnail)
+
+    async def _prepare_images(
+        self, attachments: list[str | UploadedAttachment], budget: MemoryBudget
+    ) -> list[str | UploadedAttachment]:
+        """
+        Downscale, reorient and recompress image attachments before rendering. Oversized phone
+        photos otherwise inflate Chromium's memory use, render time and the final PDF.
+        Only as many images are decoded at once as there are image workers, and the results
+        are kept in buffers from budget.
+        """
+        if not images.is_enabled():
+            return attachments
+
+        semaphore = asyncio.Semaphore(images_config.workers)
+
+        async def prepare(attachment):
+            if not (self._attachment_type(attachment) or "").startswith("image/"):
+                return attachment
+
+            async with semaphore:
+                file_type, payload_bytes = self._load_attachment(attachment)
+                if payload_bytes is None:
+                    return attachment
+
+                with budget.hold(len(payload_bytes)):
+                    prepared_type, prepared_bytes = await images.prepare_image(payload_bytes, file_type)
+                if prepared_bytes is payload_bytes:
+                    return attachment
+
+            close_attachments([attachment])
+            return UploadedAttachment(
+                prepared_type, getattr(attachment, "filename", None), budget.store(prepared_bytes)
+            )
+
+        return list(await asyncio.gather(*(prepare(attachment) for attachment in attachments)))
+
+    def _iter_sections(
+        self,
+        document: str,
+        associated_documents: list[str],
+        attachments: list[str | UploadedAttachment],
+        budget: MemoryBudget,
+    ) -> Iterator[tuple[str, str | IO[bytes]]]:
+        """
+        Lay out the artifact as ("html", html) sections to render and ("pdf", buffer) sections
+        that are already PDFs, held in buffers from budget. Sections are produced as they are
+        consumed, so each attachment is only decoded once the sections before it are rendered.
+        """
+        # We will merge the form-data pdf with all attachments (which we render as separate pdfs).
+        yield "html", document
+        attachment_cover_page_template = self.env.get_template("attachment-cover.html")
+        attachment_count = 0
+
+        def cover_page() -> tuple[str, str]:
+            # We create a separate header page for each attachment so that we do not have
+            # to, e.g., add a header to an attachment that is already a pdf.
+            nonlocal attachment_count
+            attachment_count += 1
+            return "html", attachment_cover_page_template.render({"attachmentNumber": attachment_count})
+
+        # We first render all of the associated documents as attachments
+        for associated_document in associated_documents:
+            yield cover_page()
+            yield "html", associated_document
+
+        # We then render all user-defined attachments
+        for index, attachment in enumerate(attachments):
+            file_type, payload_bytes = self._load_attachment(attachment)
+            if not file_type or payload_bytes is None:
+                # TODO: Better error handling!
+                logging.warning("Could not parse data URL for attachment %s", index + 1)
+                continue
+
+            if file_type.startswith("image/"):
+                # For images, we embed the image into a pdf.
+                template = self.env.get_template("image-attachment.html")
+                with budget.hold(len(payload_bytes)):
+                    rendered_image = template.render(
+                        {"image_data": self._to_data_url(attachment, file_type, payload_bytes)}
+                    )
+                del payload_bytes
+                yield cover_page()
+                yield "html", rendered_image
+            elif file_type == "application/pdf":
+                # If the image is a pdf, we already have the pdf bytes.
+                pdf_buffer = budget.store(payload_bytes)
+                del payload_bytes
+                yield cover_page()
+                yield "pdf", pdf_buffer
+            else:
+                logging.warning(
+                    "Unsupported attachment type %s for attachment %s",
+                    file_type,
+                    index + 1,
                 )
-                attachment_pdfs.append(attachment_cover_page_pdf)
-                attachment_pdfs.append(attachment_pdf)
-
-            # We first render all of the associated documents as attachments
-            for associated_document in associated_documents:
-                attachment_pdf = await self._html_to_pdf(html_content=associated_document, browser=browser)
-                await add_attachment(attachment_pdf)
-
-            # We then render all user-defined attachments
-            for index, data_url in enumerate(attachments):
-                file_type, payload_bytes = self._decode_data_url(data_url)
-                if not file_type or payload_bytes is None:
-                    # TODO: Better error handling!
-                    logging.warning("Could not parse data URL for attachment %s", index + 1)
-                    continue
 
-                # Now we get the attachment data itself as a pdf.
-                attachment_pdf: bytes | None = None
-
-                if file_type.startswith("image/"):
-                    # For images, we embed the image into a pdf.
-                    template = self.env.get_template("image-attachment.html")
-                    rendered_image = template.render({"image_data": data_url})
-                    attachment_pdf = await self._html_to_pdf(html_content=rendered_image, browser=browser)
-                elif file_type == "application/pdf":
-                    # If the image is a pdf, we already have the pdf bytes.
-                    attachment_pdf = payload_bytes
-                else:
-                    logging.warning(
-                        "Unsupported attachment type %s for attachment %s",
-                        file_type,
-                        index + 1,
+    async def _render_sections_single_pass(
+        self,
+        sections: Iterable[tuple[str, str | IO[bytes]]],
+        budget: MemoryBudget,
+        thumbnail_format: str | None = None,
+    ) -> tuple[list[IO[bytes]], tuple[str, bytes] | None]:
+        """
+        Render each run of consecutive HTML sections as one print document with CSS page
+        breaks, so that an artifact needs one page.pdf() call per pre-existing PDF
+        attachment rather than one per section. PDF attachments are spliced in between.
+        Returns the PDFs to merge and, with a thumbnail_format, the first run's thumbnail.
+        """
+        from pypdf import PdfReader
+
+        pdfs: list[IO[bytes]] = []
+        html_run: list[str] = []
+        splice_offsets: list[int] = []
+        page_count = 0
+        section_count = 0
+
+        # The sections of the current run count against the budget until the run is rendered
+        held_html = ExitStack()
+
+        thumbnail = None
+
+        async def flush_html_run():
+            nonlocal page_count, thumbnail
+            if html_run:
+                combined = self._combine_html_documents(html_run)
+                with budget.hold(len(combined)):
+                    pdf, run_thumbnail = await self._html_to_pdf_with_thumbnail(
+                        combined, thumbnail_format if not pdfs else None
                     )
-
-                if attachment_pdf:
-                    await add_attachment(attachment_pdf)
-
-            all_pdfs = [form_data_pdf] + attachment_pdfs
-            merged_pdf_bytes = self._merge_pdfs(all_pdfs)
-            await browser.close()
-            return merged_pdf_bytes
-
-    async def _html_to_pdf(self, html_content: str, browser: Browser) -> bytes:
-        page = await browser.new_page()
-        await page.set_content(html_content)
-        pdf_buffer = await page.pdf(print_background=True)
-        return pdf_buffer
+                thumbnail = thumbnail or run_thumbnail
+                page_count += len(PdfReader(BytesIO(pdf)).pages)
+                pdfs.append(budget.store(pdf))
+                html_run.clear()
+                held_html.close()
+
+        with held_html:
+            for kind, content in sections:
+                section_count += 1
+                if kind == "html":
+                    held_html.enter_context(budget.hold(len(content)))
+                    html_run.append(content)
+                    continue
+                await flush_html_run()
+                splice_offsets.append(page_count)
+                pdfs.append(content)
+                page_count += len(PdfReader(as_stream(content)).pages)
+            await flush_html_run()
+
+        logger.info(
+            "Rendered %d sections in %d pass(es); PDF attachments spliced at page offsets %s",
+            section_count,
+            len(pdfs) - len(splice_offsets),
+            splice_offsets,
+        )
+        return pdfs, thumbnail
+
+    def _combine_html_documents(self, documents: list[str]) -> str:
+        """
+        Combine full HTML documents into a single document, one page-broken section per
+        document. Identical head elements (styles, scripts) are only included once.
+        """
+        if len(documents) == 1:
+            return documents[0]
+
+        # Keep the first document's title, which becomes the PDF's title
+        title_match = _TITLE_RE.search(documents[0])
+        head_parts: list[str] = [title_match.group(0)] if title_match else []
+        bodies: list[str] = []
+        for document in documents:
+            head_match = _HEAD_RE.search(document)
+            head = _TITLE_RE.sub("", head_match.group(1)) if head_match else ""
+            if head.strip() and head not in head_parts:
+                head_parts.append(head)
+
+            body_match = _BODY_RE.search(document)
+            bodies.append(body_match.group(1) if body_match else document)
+
+        sections = "".join(f'<div class="render-section">{body}</div>' for body in bodies)
+        return (
+            "<!doctype html><html><head>"
+            + "".join(head_parts)
+            + _SECTION_BREAK_STYLE
+            + "</head><body>"
+            + sections
+            + "</body></html>"
+        )
+
+    async def _html_to_pdf(self, html_content: str) -> bytes:
+        pdf, _ = await self._render_page(html_content)
+        return pdf
+
+    async def _html_to_pdf_with_thumbnail(
+        self, html_content: str, image_format: str | None
+    ) -> tuple[bytes, tuple[str, bytes] | None]:
+        """
+        The PDF of html_content and, with an image_format, a thumbnail of its first page,
+        screenshotted from the page the PDF is printed from.
+        """
+        if image_format is None:
+            return await self._html_to_pdf(html_content), None
+
+        pdf, screenshot = await self._render_page(html_content, screenshot=True)
+        if screenshot is None:
+            # The PDF came from the render cache, so there was no page to take a screenshot of
+            return pdf, await self._render_thumbnail(html_content, image_format)
+        with tracing.span("thumbnail.render", **{"image.format": image_format}):
+            return pdf, await images.thumbnail(screenshot, image_format, artifacts_config.thumbnail_width)
+
+    async def _render_page(self, html_content: str, screenshot: bool = False) -> tuple[bytes, bytes | None]:
+        """Print html_content to PDF, taking a PNG screenshot of the same page if asked to (unless cached)."""
+        with tracing.span("pdf.render", **{"html.length": len(html_content)}) as span:
+            cache_key = None
+            if self.render_cache is not None:
+                # Templates and the CSS they inline are part of the version, so edits invalidate the cache
+                cache_key = self.render_cache.key(
+                    html_content, {**PDF_OPTIONS, "wait_until": render_config.wait_until}, self._templates_version()
+                )
+                cached = await self.render_cache.get(cache_key)
+                if span is not None:
+                    span.set_attribute("render_cache.hit", cached is not None)
+                if cached is not None:
+                    return cached, None
+
+            image = None
+            async with self.renderer.page() as page:
+                if screenshot:
+                    # page.pdf() prints at its own page size, so the viewport only affects the screenshot
+                    await page.set_viewport_size(THUMBNAIL_VIEWPORT)
+                    await page.emulate_media(media="print")
+                await page.set_content(html_content, wait_until=render_config.wait_until)
+                pdf_buffer = await page.pdf(**PDF_OPTIONS)
+                if screenshot:
+                    image = await page.screenshot(type="png")
+
+            if cache_key is not None:
+                await self.render_cache.set(cache_key, pdf_buffer)
+            return pdf_buffer, image
+
+    def _attachment_type(self, attachment: str | UploadedAttachment) -> str | None:
+        """An attachment's mime type, without decoding its content."""
+        if isinstance(attachment, UploadedAttachment):
+            return attachment.content_type
+        header = attachment[: attachment.find(",")] if "," in attachment else ""
+        return header[5:].split(";", 1)[0] if header.startswith("data:") else None
+
+    def _load_attachment(self, attachment: str | UploadedAttachment) -> tuple[str | None, bytes | None]:
+        """Returns (mime_type, raw_bytes) for an attachment, or (None, None) on failure."""
+        if isinstance(attachment, UploadedAttachment):
+            return attachment.content_type, attachment.read()
+        return self._decode_data_url(attachment)
+
+    def _to_data_url(self, attachment: str | UploadedAttachment, mime_type: str, payload_bytes: bytes) -> str:
+        if isinstance(attachment, str):
+            return attachment
+        return f"data:{mime_type};base64,{base64.b64encode(payload_bytes).decode()}"
 
     def _decode_data_url(self, data_url: str) -> tuple[str | None, bytes | None]:
         """
@@ -276,18 +964,61 @@ class v1_do_artifacts_connector:
 
         return mime_type, raw_bytes
 
-    def _merge_pdfs(self, pdf_buffers: list[bytes]) -> bytes:
-        """Merge multiple PDF byte blobs into a single PDF."""
-        writer = PdfWriter()
+    def _merge_pdfs(
+        self, pdf_buffers: list[bytes | IO[bytes]], optimize: bool = False, linearize: bool = False
+    ) -> tuple[bytes, int]:
+        """
+        Merge multiple PDFs, given as bytes or as (possibly disk-backed) buffers, into a single
+        PDF. Returns the PDF and its page count.
 
-        for pdf_bytes in pdf_buffers:
-            reader = PdfReader(BytesIO(pdf_bytes))
-            for page in reader.pages:
-                writer.add_page(page)
+        With optimize, identical objects shared between the inputs (Chromium embeds the same
+        fonts and images in every section) are stored once and content streams are compressed.
+        With linearize, the result is rewritten for fast web view.
+        """
+        from pypdf import PdfReader, PdfWriter
+
+        with tracing.span("pdf.merge", **{"pdf.count": len(pdf_buffers)}):
+            writer = PdfWriter()
+
+            for pdf_buffer in pdf_buffers:
+                reader = PdfReader(as_stream(pdf_buffer))
+                for page in reader.pages:
+                    writer.add_page(page)
+
+            if optimize:
+                for page in writer.pages:
+                    page.compress_content_streams()
+                writer.compress_identical_objects()
+
+            output = BytesIO()
+            writer.write(output)
+            output.seek(0)
+            merged = output.getvalue()
+
+            if linearize:
+                merged = self._linearize_pdf(merged)
+
+            logger.info(
+                "Merged %d PDFs: %d bytes in, %d bytes out (optimize=%s, linearize=%s)",
+                len(pdf_buffers),
+                sum(buffer_size(pdf_buffer) for pdf_buffer in pdf_buffers),
+                len(merged),
+                optimize,
+                linearize,
+            )
+            return merged, len(writer.pages)
+
+    def _linearize_pdf(self, pdf_bytes: bytes) -> bytes:
+        # pikepdf (qpdf) is optional and only needed to linearize merged PDFs
+        try:
+            import pikepdf
+        except ImportError:
+            logger.warning("pikepdf is not installed; skipping PDF linearization")
+            return pdf_bytes
 
         output = BytesIO()
-        writer.write(output)
-        output.seek(0)
+        with pikepdf.open(BytesIO(pdf_bytes)) as pdf:
+            pdf.save(output, linearize=True)
         return output.getvalue()
 
     def _format_template_data(self, template_name, template_data, task_data):
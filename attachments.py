@@ -0,0 +1,317 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+from typing import Any
+from urllib.parse import urlparse
+
+import orjson
+
+from cache import DiskLRU
+from config import artifacts_config
+from s3utils import create_s3_client, get_bucket_for_storage
+
+logger = logging.getLogger(__name__)
+
+# Multipart form fields whose values are JSON documents rather than plain strings
+JSON_FORM_FIELDS = ("data", "spiff__task_data")
+
+# Multipart form fields holding booleans
+BOOLEAN_FORM_FIELDS = ("generate_links",)
+
+
+# Attachment strings with these schemes are references to fetch rather than data URLs
+REFERENCE_SCHEMES = ("s3", "https")
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+class UploadedAttachment:
+    """
+    An attachment whose content lives in a temporary file: either uploaded as a multipart
+    file part or fetched by reference. The content is spooled as it arrives rather than
+    being held in the request body.
+    """
+
+    def __init__(self, content_type: str, filename: str | None, file):
+        self.content_type = content_type
+        self.filename = filename
+        self.file = file
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def is_multipart(req) -> bool:
+    return (req.content_type or "").lower().startswith("multipart/form-data")
+
+
+async def read_multipart_params(req) -> dict[str, Any]:
+    """
+    Read GenerateArtifact parameters from a multipart/form-data request.
+
+    Plain form fields map to parameters of the same name (`data` is a JSON document).
+    File parts are streamed into temporary files and appended to `data.attachments`.
+    """
+    params: dict[str, Any] = {}
+    uploads: list[UploadedAttachment] = []
+    form = await req.get_media()
+
+    try:
+        async for part in form:
+            if part.filename is None:
+                value = await part.get_text()
+                if part.name in JSON_FORM_FIELDS:
+                    value = orjson.loads(value) if value else None
+                elif part.name in BOOLEAN_FORM_FIELDS:
+                    value = value.strip().lower() in ("1", "true", "yes", "on")
+                params[part.name] = value
+                continue
+
+            uploads.append(await _spool_file_part(part))
+    except Exception:
+        for upload in uploads:
+            upload.close()
+        raise
+
+    if uploads:
+        data = params.get("data")
+        if data is None:
+            data = params["data"] = {}
+        data["attachments"] = [*data.get("attachments", []), *uploads]
+
+    return params
+
+
+def _new_spool():
+    return tempfile.SpooledTemporaryFile(max_size=artifacts_config.attachment_spool_size)
+
+
+def _check_size(name: str | None, size: int) -> None:
+    if size > artifacts_config.attachment_max_bytes:
+        raise AttachmentTooLarge(
+            f"Attachment '{name}' exceeds the maximum size of {artifacts_config.attachment_max_bytes} bytes"
+        )
+
+
+async def _spool_file_part(part) -> UploadedAttachment:
+    spool = _new_spool()
+    size = 0
+
+    try:
+        async for chunk in part.stream:
+            size += len(chunk)
+            _check_size(part.filename, size)
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return UploadedAttachment(part.content_type, part.filename, spool)
+
+
+def is_reference(attachment: Any) -> bool:
+    return isinstance(attachment, str) and urlparse(attachment).scheme in REFERENCE_SCHEMES
+
+
+class AttachmentFetcher:
+    """
+    Fetches attachments given by reference (s3://bucket/key or https:// URLs) concurrently,
+    with a bounded fan-out and a per-attachment size limit. References are end-user input,
+    so only allow-listed hosts and buckets are fetched. When a cache directory is configured,
+    fetched content is kept on disk, revalidated by ETag and trimmed to a size limit.
+    """
+
+    def __init__(self, http_client=None):
+        self.http_client = http_client
+        self.cache = (
+            DiskLRU(
+                artifacts_config.attachment_cache_dir,
+                artifacts_config.attachment_cache_max_bytes,
+                ".bin",
+                on_remove=self._forget_content,
+            )
+            if artifacts_config.attachment_cache_dir
+            else None
+        )
+
+    async def resolve(self, attachments: list[Any]) -> list[Any]:
+        """Return the attachments with every reference replaced by its fetched content."""
+        semaphore = asyncio.Semaphore(artifacts_config.attachment_fetch_concurrency)
+
+        async def resolve_one(attachment):
+            if not is_reference(attachment):
+                return attachment
+            async with semaphore:
+                return await self.fetch(attachment)
+
+        results = await asyncio.gather(*(resolve_one(a) for a in attachments), return_exceptions=True)
+
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            close_attachments([r for r in results if not isinstance(r, BaseException)])
+            raise errors[0]
+
+        return results
+
+    async def fetch(self, url: str) -> UploadedAttachment:
+        parsed = urlparse(url)
+        if parsed.scheme == "s3":
+            return await asyncio.to_thread(self._fetch_s3, url, parsed.netloc, parsed.path.lstrip("/"))
+        return await self._fetch_https(url, parsed.hostname)
+
+    def _fetch_s3(self, url: str, bucket: str, key: str) -> UploadedAttachment:
+        from botocore.exceptions import ClientError
+
+        default_bucket = get_bucket_for_storage(None)
+        if bucket not in (artifacts_config.attachment_fetch_allowed_buckets or [default_bucket]):
+            raise ValueError(f"Fetching attachments from bucket '{bucket}' is not allowed")
+
+        storage = None if bucket == default_bucket else f"s3://{bucket}"
+        s3_client = create_s3_client(storage)
+        cached = self._cache_lookup(url)
+
+        request = {"Bucket": bucket, "Key": key}
+        if cached:
+            request["IfNoneMatch"] = cached["etag"]
+
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as e:
+            if cached and e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                return self._cache_open(url, cached)
+            raise
+
+        _check_size(url, response.get("ContentLength", 0))
+        content_type = response.get("ContentType") or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+        spool = _new_spool()
+        size = 0
+        try:
+            for chunk in response["Body"].iter_chunks(64 * 1024):
+                size += len(chunk)
+                _check_size(url, size)
+                spool.write(chunk)
+        except Exception:
+            spool.close()
+            raise
+
+        return self._cache_store(url, response.get("ETag"), content_type, spool)
+
+    async def _fetch_https(self, url: str, hostname: str | None) -> UploadedAttachment:
+        if hostname not in artifacts_config.attachment_fetch_allowed_hosts:
+            raise ValueError(f"Fetching attachments from '{hostname}' is not allowed")
+
+        if self.http_client is None:
+            raise RuntimeError("No HTTP client configured for fetching attachments")
+
+        cached = self._cache_lookup(url)
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+
+        async with self.http_client.stream(
+            "GET", url, headers=headers, timeout=artifacts_config.attachment_fetch_timeout
+        ) as response:
+            if cached and response.status_code == 304:
+                return self._cache_open(url, cached)
+            response.raise_for_status()
+
+            _check_size(url, int(response.headers.get("Content-Length") or 0))
+            content_type = response.headers.get("Content-Type", "").split(";", 1)[0].strip()
+            content_type = content_type or mimetypes.guess_type(urlparse(url).path)[0] or "application/octet-stream"
+
+            spool = _new_spool()
+            size = 0
+            try:
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    _check_size(url, size)
+                    spool.write(chunk)
+            except Exception:
+                spool.close()
+                raise
+
+        return self._cache_store(url, response.headers.get("ETag"), content_type, spool)
+
+    def _meta_name(self, url: str) -> str:
+        return f"{_url_hash(url)}.json"
+
+    def _content_name(self, url: str, etag: str) -> str:
+        # Named by URL and ETag, so that a concurrent write of another version never
+        # replaces the content that a metadata file refers to
+        etag_hash = hashlib.sha256(etag.encode()).hexdigest()[:16]
+        return f"{_url_hash(url)}-{etag_hash}.bin"
+
+    def _cache_lookup(self, url: str) -> dict[str, str] | None:
+        if self.cache is None:
+            return None
+
+        try:
+            with open(self.cache.path(self._meta_name(url))) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not meta.get("etag") or not self.cache.touch(self._content_name(url, meta["etag"])):
+            return None
+        return meta
+
+    def _cache_open(self, url: str, meta: dict[str, str]) -> UploadedAttachment:
+        return UploadedAttachment(
+            meta["content_type"],
+            os.path.basename(urlparse(url).path) or None,
+            open(self.cache.path(self._content_name(url, meta["etag"])), "rb"),
+        )
+
+    def _cache_store(self, url: str, etag: str | None, content_type: str, spool) -> UploadedAttachment:
+        spool.seek(0)
+        filename = os.path.basename(urlparse(url).path) or None
+        if not (self.cache is not None and etag):
+            return UploadedAttachment(content_type, filename, spool)
+
+        previous = self._cache_lookup(url)
+        try:
+            self.cache.write(self._content_name(url, etag), spool)
+            self.cache.write(self._meta_name(url), json.dumps({"etag": etag, "content_type": content_type}).encode())
+            if previous and previous["etag"] != etag:
+                with contextlib.suppress(OSError):
+                    os.unlink(self.cache.path(self._content_name(url, previous["etag"])))
+        except OSError:
+            logger.warning("Could not cache attachment %s", url, exc_info=True)
+        finally:
+            spool.seek(0)
+
+        return UploadedAttachment(content_type, filename, spool)
+
+    def _forget_content(self, name: str) -> None:
+        """After trimming removed a URL's content, remove its metadata, which now refers to nothing."""
+        with contextlib.suppress(OSError):
+            os.unlink(self.cache.path(f"{name.split('-', 1)[0]}.json"))
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def request_attachments(params: dict[str, Any]) -> list[Any]:
+    """The attachments of GenerateArtifact parameters, before the parameters are validated."""
+    data = params.get("data")
+    attachments = data.get("attachments") if isinstance(data, dict) else None
+    return attachments if isinstance(attachments, list) else []
+
+
+def close_attachments(attachments: list[Any]) -> None:
+    """Release the temporary files behind any uploaded attachments."""
+    for attachment in attachments:
+        if isinstance(attachment, UploadedAttachment):
+            attachment.close()
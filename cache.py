@@ -0,0 +1,221 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import IO, Any
+
+import orjson
+
+
+class LRUCache:
+    """A small thread-safe, size-bounded least-recently-used cache."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """An LRUCache whose entries also expire ttl seconds after they were set."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 60.0):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        super().set(key, (time.monotonic() + self.ttl, value))
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop every entry whose key matches predicate."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+
+class BytesLRUCache(LRUCache):
+    """An LRUCache of bytes values, bounded by their total size rather than their number."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(maxsize=max_bytes)
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def set(self, key: Hashable, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+class DiskLRU:
+    """
+    A directory of cache files, trimmed least recently used first once the files named
+    with suffix exceed max_bytes (other files, such as metadata, aren't counted). Files are
+    written atomically, their access time is their last-used time and, with a ttl, files
+    written more than ttl seconds ago are expired. With private, the directory is readable
+    only by this user.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        suffix: str,
+        ttl: float | None = None,
+        private: bool = False,
+        on_remove: Callable[[str], None] | None = None,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.ttl = ttl
+        self.private = private
+        # Called with the name of every file trim() removes
+        self.on_remove = on_remove
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size or 0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def touch(self, name: str) -> bool:
+        """Mark a file as just used. False if it is missing, or expired (it is then removed)."""
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+            if self._expired(stat):
+                os.unlink(path)
+                return False
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            return False
+        return True
+
+    def write(self, name: str, content: bytes | IO[bytes]) -> None:
+        """Write bytes or the rest of a binary file object to name, then trim if needed."""
+        if self.private:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            # makedirs() leaves the mode of an existing directory alone
+            os.chmod(self.directory, 0o700)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first so that readers never see partial content
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(content, bytes):
+                    f.write(content)
+                else:
+                    while chunk := content.read(64 * 1024):
+                        f.write(chunk)
+                size = f.tell()
+            os.replace(tmp_path, self.path(name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        if not name.endswith(self.suffix):
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._trim()
+
+    def _entries(self) -> list[os.DirEntry]:
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(self.suffix)]
+
+    def _expired(self, stat: os.stat_result) -> bool:
+        # The modification time is when the file was written
+        return bool(self.ttl) and stat.st_mtime < time.time() - self.ttl
+
+    def _trim(self) -> None:
+        # Expired files go first, then the least recently used ones
+        entries = sorted(self._entries(), key=lambda entry: (not self._expired(entry.stat()), entry.stat().st_atime))
+        total = sum(entry.stat().st_size for entry in entries)
+        # Trim to 90% of the limit so that every write doesn't trigger another scan
+        while entries and (total > self.max_bytes * 0.9 or self._expired(entries[0].stat())):
+            entry = entries.pop(0)
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            total -= size
+            if self.on_remove is not None:
+                self.on_remove(entry.name)
+        self._size = total
+
+
+def hash_data(data: Any) -> str:
+    """Return a stable sha256 hex digest for JSON-serializable data, independent of key order."""
+    return hashlib.sha256(orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)).hexdigest()
@@ -0,0 +1,98 @@
+"""
+Sizing for multi-worker deployments: how many server workers to run, how many concurrent
+renders each worker may start, and the host-wide render budget they share.
+
+    python capacity.py --shell
+
+prints `export` lines for bin/boot_server_in_docker. Values already set in the
+environment are kept as they are.
+"""
+
+import argparse
+import math
+import os
+
+from config import render_config
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus(cgroup_root: str = CGROUP_ROOT) -> float:
+    """CPUs available to this container: the cgroup quota if there is one, otherwise the affinity mask."""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:  # pragma: no cover - not available on macOS
+        cpus = float(os.cpu_count() or 1)
+
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read(os.path.join(cgroup_root, "cpu.max"))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return min(cpus, int(quota) / int(period))
+        return cpus
+
+    # cgroup v1
+    quota = _read(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us"))
+    period = _read(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us"))
+    if quota and period and int(quota) > 0:
+        return min(cpus, int(quota) / int(period))
+
+    return cpus
+
+
+def available_memory(cgroup_root: str = CGROUP_ROOT) -> int:
+    """Bytes of memory available to this container: the cgroup limit if there is one, otherwise physical memory."""
+    total = 0
+    meminfo = _read("/proc/meminfo") or ""
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            total = int(line.split()[1]) * 1024
+            break
+
+    for path in (os.path.join(cgroup_root, "memory.max"), os.path.join(cgroup_root, "memory", "memory.limit_in_bytes")):
+        limit = _read(path)
+        if limit and limit.isdigit():
+            # cgroup v1 reports "no limit" as a huge number
+            return min(int(limit), total) if total else int(limit)
+
+    return total
+
+
+def plan(cpus: float, memory: int) -> dict[str, int]:
+    """
+    Split the host between workers and renderers. Every worker costs a fixed amount of
+    memory and every concurrent render roughly one Chromium renderer process; renders
+    are CPU-bound, so there is no point running more of them than there are CPUs.
+    """
+    worker_memory = render_config.worker_memory
+    render_memory = render_config.render_memory
+
+    workers = max(1, min(math.floor(cpus), memory // (worker_memory + render_memory) if memory else 1))
+    render_budget = max(1, min(math.ceil(cpus), (memory - workers * worker_memory) // render_memory if memory else 1))
+    pool_size = max(1, math.ceil(render_budget / workers))
+
+    return {"CONNECTOR_WORKERS": workers, "RENDER_POOL_SIZE": pool_size, "RENDER_BUDGET": render_budget}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shell", action="store_true", help="print export statements for a shell")
+    args = parser.parse_args()
+
+    sizing = plan(available_cpus(), available_memory())
+    for name, value in sizing.items():
+        value = os.environ.get(name) if os.environ.get(name) not in (None, "", "auto") else value
+        print(f"export {name}={value}" if args.shell else f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()
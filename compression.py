@@ -0,0 +1,144 @@
+import asyncio
+import gzip
+import logging
+from collections.abc import Callable
+
+from cache import LRUCache
+from config import compression_config
+
+logger = logging.getLogger(__name__)
+
+# brotli and zstandard are optional; gzip is always available.
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the installed extras
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the installed extras
+    zstandard = None
+
+
+def _compressors() -> dict[str, Callable[[bytes], bytes]]:
+    """The available encodings, in order of server preference."""
+    compressors: dict[str, Callable[[bytes], bytes]] = {}
+
+    if zstandard is not None:
+        compressors["zstd"] = lambda body: zstandard.ZstdCompressor(level=compression_config.zstd_level).compress(body)
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=compression_config.brotli_quality)
+    compressors["gzip"] = lambda body: gzip.compress(body, compresslevel=compression_config.gzip_level, mtime=0)
+
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+# Every encoding an ETag may have been suffixed with, including ones this install lacks
+ENCODINGS = ("zstd", "br", "gzip")
+
+# Compressed bodies of immutable responses (the /static assets), keyed by (ETag, encoding):
+# the ETag pins the content, so the bytes never need compressing twice
+_immutable_bodies = LRUCache(maxsize=32)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    The ETag of the encoded representation. A strong ETag promises identical bytes, so the
+    compressed body gets its own ('"abc"' becomes '"abc-gzip"'); weak ones are left alone.
+    """
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decoded_etag(etag: str) -> str:
+    """The bare ETag value an encoded_etag() was made from."""
+    for encoding in ENCODINGS:
+        if etag.endswith(f"-{encoding}"):
+            return etag.removesuffix(f"-{encoding}")
+    return etag
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """
+    Pick the best available encoding for an Accept-Encoding header, honoring q-values.
+    Returns None when the client accepts none of them.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in COMPRESSORS:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+
+    return best
+
+
+class CompressionMiddleware:
+    """Compress response bodies according to the client's Accept-Encoding header."""
+
+    async def process_response(self, req, resp, resource, req_succeeded):
+        if not compression_config.enabled or req.method == "HEAD":
+            return
+
+        # Streamed bodies (e.g. artifact downloads) and already-encoded bodies are left alone
+        if resp.stream is not None or resp.get_header("Content-Encoding"):
+            return
+
+        encoding = negotiate_encoding(req.get_header("Accept-Encoding"))
+        etag = resp.get_header("ETag")
+
+        if resp.status_code == 304 and etag and encoding:
+            # Revalidating a compressed copy: confirm it under the ETag it was stored with
+            if encoded_etag(etag, encoding) in (req.get_header("If-None-Match") or ""):
+                resp.set_header("ETag", encoded_etag(etag, encoding))
+            return
+
+        if resp.status_code in (204, 304) or resp.status_code < 200:
+            return
+
+        body = await resp.render_body()
+
+        # Whether we compress or not, the response depends on Accept-Encoding
+        resp.append_header("Vary", "Accept-Encoding")
+
+        if encoding is None or body is None or len(body) < compression_config.min_size:
+            return
+
+        immutable = etag is not None and "immutable" in (resp.get_header("Cache-Control") or "")
+        compressed = _immutable_bodies.get((etag, encoding)) if immutable else None
+        if compressed is None:
+            compress = COMPRESSORS[encoding]
+            if len(body) >= compression_config.thread_threshold:
+                compressed = await asyncio.to_thread(compress, body)
+            else:
+                compressed = compress(body)
+            if immutable:
+                _immutable_bodies.set((etag, encoding), compressed)
+
+        if len(compressed) >= len(body):
+            return
+
+        resp.text = None
+        resp.data = compressed
+        resp.set_header("Content-Encoding", encoding)
+        if etag:
+            resp.set_header("ETag", encoded_etag(etag, encoding))
@@ -1,11 +1,26 @@
 import json
 import logging
 import os
+import tempfile
+from functools import cache
 from typing import Any
 
 logger = logging.getLogger(__name__)
 
 
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean flag such as "true"/"false" or "1"/"0" from the environment."""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_list(name: str, default: str = "") -> list[str]:
+    """Read a comma-separated list from the environment, ignoring empty entries."""
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
 class S3Config:
     """Configuration for S3 access, supporting both environment variables and VCAP_SERVICES."""
 
@@ -19,7 +34,8 @@ class S3Config:
         self.secret_key = self._get_secret_key()
         self.endpoint_url = os.getenv("S3_ENDPOINT_URL")  # Internal URL for operations
         self.public_endpoint_url = os.getenv("S3_PUBLIC_ENDPOINT_URL")  # Public URL for presigned links
-        self.signed_link_expiration = int(os.getenv("SIGNED_LINK_EXPIRATION", "3600"))
+        # Connections each S3 client keeps open; bulk operations fan out up to this many requests
+        self.max_pool_connections = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "16"))
 
     def _get_vcap_credentials(self) -> dict[str, Any] | None:
         """Get S3 credentials from VCAP_SERVICES if available."""
@@ -78,5 +94,179 @@ class S3Config:
         return key
 
 
-# Global config instance
-s3_config = S3Config()
+class ArtifactsConfig:
+    """Tuning options for artifact rendering and previews."""
+
+    def __init__(self):
+        # Default storage: unset for the S3 settings, or e.g. s3://bucket or file:///var/lib/artifacts
+        self.storage_url = os.getenv("STORAGE_URL")
+        # Storage clients kept for the default and custom storage URLs, least recently used dropped first
+        self.storage_client_cache_size = int(os.getenv("STORAGE_CLIENT_CACHE_SIZE", "16"))
+        self.signed_link_expiration = int(os.getenv("SIGNED_LINK_EXPIRATION", "3600"))
+        # Link responses may be cached until this many seconds before their presigned URL expires
+        self.link_cache_margin = int(os.getenv("LINK_CACHE_MARGIN", "60"))
+        # Cache-Control stored with uploaded artifacts and thumbnails, and sent when serving their content
+        self.artifact_cache_control = os.getenv("ARTIFACT_CACHE_CONTROL", "private, no-cache")
+        # Signing key and public base URL for links to file:// storage (see localstorage)
+        self.local_storage_secret = os.getenv("LOCAL_STORAGE_SECRET")
+        self.local_storage_public_url = os.getenv("LOCAL_STORAGE_PUBLIC_URL", "").rstrip("/")
+        self.preview_cache_size = int(os.getenv("PREVIEW_CACHE_SIZE", "64"))
+        # Seconds between checks of the templates directory for changes, which invalidate cached renders
+        self.templates_check_interval = float(os.getenv("TEMPLATES_CHECK_INTERVAL", "2"))
+        # Base URL browsers use to reach the connector's /static routes in "linked" previews
+        self.public_asset_base_url = os.getenv("PUBLIC_ASSET_BASE_URL")
+        # Uploaded attachments larger than this are spooled to a temporary file on disk
+        self.attachment_spool_size = int(os.getenv("ATTACHMENT_SPOOL_SIZE", str(1024 * 1024)))
+        self.attachment_max_bytes = int(os.getenv("ATTACHMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+        # Attachments given by reference (s3:// or https://) are fetched with this fan-out
+        self.attachment_fetch_concurrency = int(os.getenv("ATTACHMENT_FETCH_CONCURRENCY", "8"))
+        self.attachment_fetch_timeout = float(os.getenv("ATTACHMENT_FETCH_TIMEOUT", "30"))
+        # Hosts https:// references may be fetched from (none unless listed), and buckets s3://
+        # references may be read from (default: the configured bucket)
+        self.attachment_fetch_allowed_hosts = env_list("ATTACHMENT_FETCH_ALLOWED_HOSTS")
+        self.attachment_fetch_allowed_buckets = env_list("ATTACHMENT_FETCH_ALLOWED_BUCKETS")
+        # Optional directory for caching fetched attachments, revalidated by ETag and trimmed
+        # least-recently-used first beyond ATTACHMENT_CACHE_MAX_MB
+        self.attachment_cache_dir = os.getenv("ATTACHMENT_CACHE_DIR")
+        self.attachment_cache_max_bytes = int(os.getenv("ATTACHMENT_CACHE_MAX_MB", "512")) * 1024 * 1024
+        # Defaults for the optimize_pdf and linearize GenerateArtifact parameters
+        self.optimize_pdf = env_bool("PDF_OPTIMIZE", False)
+        self.linearize_pdf = env_bool("PDF_LINEARIZE", False)
+        # Default for the single_pass GenerateArtifact parameter
+        self.single_pass_render = env_bool("PDF_SINGLE_PASS", False)
+        # GenerateArtifact thumbnails: the default format ("png", or "webp" with Pillow) and the width in pixels
+        self.thumbnail_format = os.getenv("THUMBNAIL_FORMAT", "png")
+        self.thumbnail_width = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+        # Bulk link resolution: the most ids per request and how many are looked up at once
+        self.resolve_links_max_ids = int(os.getenv("RESOLVE_LINKS_MAX_IDS", "200"))
+        self.resolve_links_concurrency = int(os.getenv("RESOLVE_LINKS_CONCURRENCY", "16"))
+        # Artifact listings are cached this many seconds, or until the service writes under their prefix
+        self.listing_cache_ttl = float(os.getenv("LISTING_CACHE_TTL", "30"))
+        # Artifact downloads through the connector are streamed in chunks of this many bytes
+        self.download_chunk_size = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+        # Seconds a GenerateArtifact request may take unless it sets its own timeout or deadline; 0 for no limit
+        self.request_timeout = float(os.getenv("ARTIFACT_REQUEST_TIMEOUT", "0"))
+        # Stop rendering a GenerateArtifact request when its client disconnects
+        self.cancel_on_disconnect = env_bool("ARTIFACT_CANCEL_ON_DISCONNECT", True)
+        # Intermediate PDFs (attachments and rendered sections) a request may hold in memory before
+        # the rest is spooled to disk, under spool_dir (default: the system temp directory)
+        self.request_memory_budget = int(os.getenv("ARTIFACT_MEMORY_BUDGET_MB", "64")) * 1024 * 1024
+        self.spool_dir = os.getenv("ARTIFACT_SPOOL_DIR")
+
+
+class CompressionConfig:
+    """Options for compressing HTTP responses."""
+
+    def __init__(self):
+        self.enabled = env_bool("COMPRESSION_ENABLED", True)
+        # Responses smaller than this are sent as-is
+        self.min_size = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+        # Responses at least this large are compressed in a worker thread, off the event loop
+        self.thread_threshold = int(os.getenv("COMPRESSION_THREAD_THRESHOLD", str(256 * 1024)))
+        self.gzip_level = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+        self.brotli_quality = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+        self.zstd_level = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+
+class ImagesConfig:
+    """Options for preprocessing image attachments before they are rendered."""
+
+    def __init__(self):
+        self.enabled = env_bool("IMAGE_DOWNSCALE", True)
+        # Images are downsampled to this resolution for the page size they are printed on
+        self.print_dpi = int(os.getenv("IMAGE_PRINT_DPI", "150"))
+        self.page_size = os.getenv("IMAGE_PAGE_SIZE", "Letter")
+        self.jpeg_quality = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+        self.workers = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.cache_size = int(os.getenv("IMAGE_CACHE_SIZE", "32"))
+
+
+class RenderConfig:
+    """Options for the Chromium renderer and how renders are shared between workers."""
+
+    def __init__(self):
+        # Concurrent renders (pages) per worker process
+        self.pool_size = int(os.getenv("RENDER_POOL_SIZE", "2"))
+        # Concurrent renders across all workers on the host; 0 disables the shared budget
+        self.budget = int(os.getenv("RENDER_BUDGET", "0"))
+        self.budget_dir = os.getenv("RENDER_BUDGET_DIR", os.path.join(tempfile.gettempdir(), "connector-render-budget"))
+        # Estimates used to size workers and renderers from available memory
+        self.worker_memory = int(os.getenv("WORKER_MEMORY_MB", "256")) * 1024 * 1024
+        self.render_memory = int(os.getenv("RENDER_MEMORY_MB", "512")) * 1024 * 1024
+        # Render in this many separate worker processes instead of the API process; 0 renders in-process
+        self.workers = int(os.getenv("RENDER_WORKERS", "0"))
+        # Recycle a render worker after this many renders or once it (with its Chromium) uses this much memory
+        self.worker_max_renders = int(os.getenv("RENDER_WORKER_MAX_RENDERS", "200"))
+        self.worker_max_rss = int(os.getenv("RENDER_WORKER_MAX_RSS_MB", "1024")) * 1024 * 1024
+        # Seconds a render job may take before its worker is considered hung
+        self.worker_timeout = float(os.getenv("RENDER_WORKER_TIMEOUT", "120"))
+        # Retries, on a fresh worker, for jobs whose worker crashed
+        self.worker_retries = int(os.getenv("RENDER_WORKER_RETRIES", "1"))
+        # Requests from rendered pages for known assets are served from memory; block all others (no network)
+        self.block_external_requests = env_bool("RENDER_BLOCK_EXTERNAL_REQUESTS", True)
+        # When a page counts as loaded before printing: "load", "domcontentloaded", "networkidle" or "commit"
+        self.wait_until = os.getenv("RENDER_WAIT_UNTIL", "load")
+        # GenerateArtifact jobs rendering at once per process, shared fairly between tenants; 0 uses
+        # RENDER_WORKERS, or RENDER_POOL_SIZE when rendering in-process
+        self.scheduler_slots = int(os.getenv("RENDER_SCHEDULER_SLOTS", "0"))
+        # What identifies a tenant without a tenant header: "prefix" (of the artifact id) or "bucket"
+        self.tenant_key = os.getenv("RENDER_TENANT_KEY", "prefix")
+        self.tenant_header = os.getenv("RENDER_TENANT_HEADER", "X-Tenant")
+        # Relative share of render slots for interactive and bulk jobs
+        self.interactive_weight = float(os.getenv("RENDER_INTERACTIVE_WEIGHT", "8"))
+        self.bulk_weight = float(os.getenv("RENDER_BULK_WEIGHT", "1"))
+        # Idle tenants whose queue stats are still reported by GET /metrics
+        self.scheduler_idle_tenants = int(os.getenv("RENDER_SCHEDULER_IDLE_TENANTS", "100"))
+        # Cache of HTML-to-PDF renders: recent ones in memory and, only when a directory is
+        # configured, all of them on disk up to a size limit and an age
+        self.cache_enabled = env_bool("RENDER_CACHE_ENABLED", True)
+        self.cache_memory_bytes = int(os.getenv("RENDER_CACHE_MEMORY_MB", "64")) * 1024 * 1024
+        self.cache_dir = os.getenv("RENDER_CACHE_DIR") or None
+        self.cache_max_bytes = int(os.getenv("RENDER_CACHE_MAX_MB", "512")) * 1024 * 1024
+        self.cache_ttl = float(os.getenv("RENDER_CACHE_TTL", "86400"))
+
+
+class ServiceConfig:
+    """Options for the connector process as a whole."""
+
+    def __init__(self):
+        # Which command families to serve, e.g. "http" for an HTTP-proxy-only instance
+        self.connector_families = env_list("CONNECTOR_FAMILIES", "http,artifacts")
+        # Launch Chromium, compile templates and warm S3 connections at startup
+        self.warmup = env_bool("CONNECTOR_WARMUP", True)
+        # How long a readiness probe waits before retrying failed warm-up checks
+        self.readiness_retry_interval = float(os.getenv("READINESS_RETRY_INTERVAL", "10"))
+        # http/BatchRequest: the most requests per batch, how many run at once, and each one's timeout
+        self.http_batch_max_requests = int(os.getenv("HTTP_BATCH_MAX_REQUESTS", "100"))
+        self.http_batch_concurrency = int(os.getenv("HTTP_BATCH_CONCURRENCY", "10"))
+        self.http_batch_timeout = float(os.getenv("HTTP_BATCH_TIMEOUT", "30"))
+
+
+class TracingConfig:
+    """Options for request tracing."""
+
+    def __init__(self):
+        # Where spans go: "none", "stdout", "file", or "module:attribute" of an exporter factory
+        self.exporter = os.getenv("TRACING_EXPORTER", "none").strip()
+        # The JSON-lines file for the "file" exporter
+        self.file = os.getenv("TRACING_FILE", "traces.jsonl")
+        # Reported as the service.name resource attribute of every span
+        self.service_name = os.getenv("TRACING_SERVICE_NAME", "spiffworkflow-connector")
+
+
+@cache
+def get_s3_config() -> S3Config:
+    """
+    The S3 configuration, read on first use so that instances which never touch
+    storage (e.g. HTTP-only deployments) don't require S3 settings.
+    """
+    return S3Config()
+
+
+# Global config instances
+artifacts_config = ArtifactsConfig()
+compression_config = CompressionConfig()
+images_config = ImagesConfig()
+render_config = RenderConfig()
+service_config = ServiceConfig()
+tracing_config = TracingConfig()
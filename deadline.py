@@ -0,0 +1,129 @@
+"""
+Deadlines for GenerateArtifact requests, so that render and upload capacity goes to
+requests somebody is still waiting for.
+
+A request's deadline comes from an X-Request-Timeout header or timeout parameter (seconds
+from now), an X-Request-Deadline header or deadline parameter (a Unix timestamp), or else
+ARTIFACT_REQUEST_TIMEOUT. The pipeline checks it between stages, and Deadline.run cancels
+the outstanding work (Chromium pages, render worker jobs, queued scheduler slots) once it
+passes or the client disconnects.
+"""
+
+import asyncio
+import contextlib
+import time
+from typing import Any
+
+import falcon.asgi
+
+from config import artifacts_config
+
+# The request scope key under which ConnectorApp exposes the client connection
+CLIENT_CONNECTION = "connector.client_connection"
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before the work was done."""
+
+
+class ClientDisconnected(ConnectionError):
+    """The client went away before the work was done."""
+
+
+class InvalidDeadline(ValueError):
+    """A request's timeout or deadline is not a number."""
+
+
+class ClientConnection:
+    """
+    Wraps an ASGI receive callable to notice the client disconnecting. Once the request
+    body has been read, wait() listens for the disconnect.
+    """
+
+    def __init__(self, receive):
+        self._receive = receive
+        self.disconnected = False
+
+    async def __call__(self) -> dict[str, Any]:
+        event = await self._receive()
+        if event["type"] == "http.disconnect":
+            self.disconnected = True
+        return event
+
+    async def wait(self) -> None:
+        while not self.disconnected:
+            await self()
+
+
+class ConnectorApp(falcon.asgi.App):
+    """Falcon's ASGI app, with each HTTP request's ClientConnection in req.scope[CLIENT_CONNECTION]."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            receive = ClientConnection(receive)
+            scope = {**scope, CLIENT_CONNECTION: receive}
+        await super().__call__(scope, receive, send)
+
+
+class Deadline:
+    def __init__(self, expires_at: float | None = None):
+        # A time.monotonic() value, or None for no deadline
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float | None) -> "Deadline":
+        return cls(time.monotonic() + seconds if seconds else None)
+
+    @classmethod
+    def from_request(cls, req, params: dict[str, Any]) -> "Deadline":
+        timeout = req.get_header("X-Request-Timeout") or params.get("timeout")
+        deadline = req.get_header("X-Request-Deadline") or params.get("deadline")
+        try:
+            if timeout is not None:
+                return cls.after(float(timeout))
+            if deadline is not None:
+                return cls(time.monotonic() + float(deadline) - time.time())
+        except (TypeError, ValueError):
+            raise InvalidDeadline(
+                f"Invalid timeout or deadline: {timeout if timeout is not None else deadline}"
+            ) from None
+        return cls.after(artifacts_config.request_timeout)
+
+    def remaining(self) -> float | None:
+        """Seconds left, or None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded if the deadline has passed before the given stage."""
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+    async def run(self, coro, connection: ClientConnection | None = None):
+        """
+        Await coro, cancelling it when the deadline passes (DeadlineExceeded) or the client
+        disconnects (ClientDisconnected).
+        """
+        task = asyncio.ensure_future(coro)
+        watcher = asyncio.ensure_future(connection.wait()) if connection is not None else None
+        try:
+            done, _ = await asyncio.wait(
+                [task, watcher] if watcher else [task], timeout=self.remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+        except BaseException:
+            task.cancel()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+        if task in done:
+            return task.result()
+
+        task.cancel()
+        with contextlib.suppress(BaseException):
+            await task
+        if watcher is not None and watcher in done:
+            raise ClientDisconnected("The client disconnected")
+        raise DeadlineExceeded("Deadline exceeded")
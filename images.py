@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import importlib.util
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from io import BytesIO
+
+from cache import LRUCache
+from config import images_config
+
+logger = logging.getLogger(__name__)
+
+# Printable page sizes in inches, matching Chromium's page.pdf() formats
+PAGE_SIZES = {
+    "Letter": (8.5, 11.0),
+    "Legal": (8.5, 14.0),
+    "Tabloid": (11.0, 17.0),
+    "A3": (11.69, 16.54),
+    "A4": (8.27, 11.69),
+    "A5": (5.83, 8.27),
+}
+
+EXIF_ORIENTATION = 0x0112
+
+# Pillow releases the GIL while decoding, resampling and encoding, so a thread pool
+# keeps this work off the event loop without the overhead of separate processes.
+_executor = ThreadPoolExecutor(max_workers=images_config.workers, thread_name_prefix="image")
+
+# Downscaled images keyed by a hash of the original content and the settings used
+_cache = LRUCache(maxsize=images_config.cache_size)
+
+
+@cache
+def _has_pillow() -> bool:
+    # Pillow is optional; without it images are embedded as uploaded
+    return importlib.util.find_spec("PIL") is not None
+
+
+def is_enabled() -> bool:
+    return images_config.enabled and _has_pillow()
+
+
+def max_dimensions() -> tuple[int, int]:
+    """The largest pixel size worth embedding on a page at the configured print DPI."""
+    width, height = PAGE_SIZES.get(images_config.page_size, PAGE_SIZES["Letter"])
+    return round(width * images_config.print_dpi), round(height * images_config.print_dpi)
+
+
+def downscale_image(payload: bytes, mime_type: str) -> tuple[str, bytes]:
+    """
+    Correct orientation, downsample to fit the page at the print DPI, strip metadata and
+    recompress. Returns the original image when it needs none of that and re-encoding
+    would not make it smaller.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(payload)) as original:
+        exif = original.getexif()
+        # Phone cameras record rotation in EXIF rather than rotating the pixels
+        transposed = exif.get(EXIF_ORIENTATION, 1) != 1
+        image = ImageOps.exif_transpose(original) if transposed else original
+
+        # Images may be placed on either orientation of the page, so bound the long side by the long side
+        max_width, max_height = max_dimensions()
+        bound = (max_width, max_height) if image.width <= image.height else (max_height, max_width)
+        resized = image.width > bound[0] or image.height > bound[1]
+        if resized:
+            image.thumbnail(bound, Image.Resampling.LANCZOS)
+
+        # Only the color profile is kept; EXIF (including GPS location) and other metadata are dropped
+        output = BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image.save(output, format="PNG", icc_profile=image.info.get("icc_profile"), optimize=True)
+            output_type = "image/png"
+        else:
+            rgb_image, icc_profile = _to_rgb(image)
+            rgb_image.save(
+                output,
+                format="JPEG",
+                quality=images_config.jpeg_quality,
+                progressive=True,
+                icc_profile=icc_profile,
+                optimize=True,
+            )
+            output_type = "image/jpeg"
+
+    result = output.getvalue()
+    if not (resized or transposed or exif) and len(result) >= len(payload):
+        return mime_type, payload
+
+    return output_type, result
+
+
+def _to_rgb(image):
+    """The image in RGB mode for JPEG, with an ICC profile that describes the converted pixels (or None)."""
+    icc_profile = image.info.get("icc_profile")
+    if image.mode in ("RGB", "P"):
+        # A palette image's profile describes its RGB palette entries
+        return image.convert("RGB"), icc_profile
+
+    if icc_profile and image.mode == "CMYK":
+        from PIL import ImageCms
+
+        try:
+            srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+            source = ImageCms.ImageCmsProfile(BytesIO(icc_profile))
+            return ImageCms.profileToProfile(image, source, srgb, outputMode="RGB"), srgb.tobytes()
+        except (OSError, ImageCms.PyCMSError):
+            logger.debug("Could not apply the image's CMYK profile", exc_info=True)
+
+    # The source profile describes another color space (CMYK, grayscale), so it no longer applies
+    return image.convert("RGB"), None
+
+
+async def prepare_image(payload: bytes, mime_type: str) -> tuple[str, bytes]:
+    """Downscale an image attachment in the worker pool, reusing earlier results for identical content."""
+    if not is_enabled():
+        return mime_type, payload
+
+    key = (hashlib.sha256(payload).hexdigest(), max_dimensions(), images_config.jpeg_quality)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_executor, downscale_image, payload, mime_type)
+    except Exception:
+        logger.warning("Could not downscale %s image; embedding it as-is", mime_type, exc_info=True)
+        return mime_type, payload
+
+    logger.info("Prepared %s image: %d bytes in, %d bytes out", mime_type, len(payload), len(result[1]))
+    _cache.set(key, result)
+    return result
+
+
+def make_thumbnail(screenshot: bytes, image_format: str, width: int) -> tuple[str, bytes]:
+    """
+    Scale a PNG screenshot down to width pixels and encode it as PNG or WebP. Without
+    Pillow the screenshot is returned as it is, as a PNG.
+    """
+    if not _has_pillow():
+        return "image/png", screenshot
+
+    from PIL import Image
+
+    with Image.open(BytesIO(screenshot)) as image:
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        if image_format == "webp":
+            image.save(output, format="WEBP", quality=images_config.jpeg_quality)
+            return "image/webp", output.getvalue()
+        image.save(output, format="PNG", optimize=True)
+        return "image/png", output.getvalue()
+
+
+async def thumbnail(screenshot: bytes, image_format: str, width: int) -> tuple[str, bytes]:
+    """make_thumbnail in the worker pool."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, make_thumbnail, screenshot, image_format, width)
@@ -0,0 +1,329 @@
+"""
+A storage backend on the local filesystem, selected with a file:// storage URL, for
+single-node installs and for measuring the pipeline without network noise.
+
+LocalStorageClient implements the subset of the boto3 S3 client the connector uses, so
+create_s3_client can return it wherever an S3 client is expected. Writes are atomic,
+reads are served from memory-mapped files, and "presigned" URLs point at the connector's
+/api/local-storage route, signed with an HMAC.
+"""
+
+import hashlib
+import hmac
+import json
+import mimetypes
+import mmap
+import os
+import secrets
+import tempfile
+import time
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from typing import Any
+from urllib.parse import urlencode, urlparse
+
+from config import artifacts_config
+
+# Per-object metadata (content type, cache control, user metadata) lives next to the object
+METADATA_SUFFIX = ".metadata.json"
+# The connector's own files inside the storage directory (the generated signing key). The
+# directory is never listed and no key can reach into it.
+_INTERNAL_DIR = ".connector"
+# Keys of this name are never served either, should an older install have left a signing key there
+_SIGNING_KEY_FILE = ".signing-key"
+
+
+class LocalStorageError(Exception):
+    """Shaped like botocore's ClientError, so callers can inspect e.response["Error"]["Code"]."""
+
+    def __init__(self, code: str, message: str, headers: dict[str, str] | None = None):
+        super().__init__(f"An error occurred ({code}): {message}")
+        self.response = {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPHeaders": headers or {}},
+        }
+
+
+class NoSuchKey(LocalStorageError):
+    def __init__(self, key: str):
+        super().__init__("NoSuchKey", f"The specified key does not exist: {key}")
+
+
+def storage_root(storage_url: str) -> str:
+    """The directory of a file:// storage URL."""
+    parsed = urlparse(storage_url)
+    return os.path.abspath(os.path.join(parsed.netloc, parsed.path) if parsed.netloc else parsed.path)
+
+
+class MappedBody:
+    """A read-only view of (part of) a file through mmap, with the read()/close() API of a botocore body."""
+
+    def __init__(self, path: str, start: int, end: int):
+        self._position = start
+        self._end = end
+        self._map = None
+        if end > start:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, size: int = -1) -> bytes:
+        if self._map is None:
+            return b""
+        end = self._end if size is None or size < 0 else min(self._end, self._position + size)
+        chunk = self._map[self._position : end]
+        self._position = end
+        return chunk
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        while chunk := self.read(chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class LocalStorageClient:
+    """
+    The S3 client subset used by the connector, on a directory. Bucket parameters are
+    accepted for compatibility but every object lives under root.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.storage_url = f"file://{self.root}"
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body: Any,
+        ContentType: str | None = None,
+        CacheControl: str | None = None,
+        Metadata: dict[str, str] | None = None,
+        **kwargs,
+    ) -> dict[str, Any]:
+        path = self._path(Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file in the same directory and rename it into place, so
+        # readers see either the old object or the new one, never a partial write
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(Body, bytes | bytearray | memoryview):
+                    f.write(Body)
+                else:
+                    while chunk := Body.read(1024 * 1024):
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        metadata = {"ContentType": ContentType, "CacheControl": CacheControl, "Metadata": Metadata or {}}
+        self._write_metadata(path, metadata)
+        return {"ETag": self._etag(os.stat(path))}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> dict[str, Any]:
+        path = self._path(Key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise NoSuchKey(Key) from None
+        return self._describe(Key, path, stat)
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: str | None = None,
+        IfNoneMatch: str | None = None,
+        IfModifiedSince: datetime | None = None,
+        **kwargs,
+    ) -> dict[str, Any]:
+        response = self.head_object(Bucket, Key)
+        etag = response["ETag"]
+
+        if IfNoneMatch is not None:
+            if etag in [candidate.strip().removeprefix("W/") for candidate in IfNoneMatch.split(",")] or (
+                IfNoneMatch.strip() == "*"
+            ):
+                raise LocalStorageError("304", "Not Modified", {"etag": etag})
+        elif IfModifiedSince is not None:
+            if IfModifiedSince.tzinfo is None:
+                IfModifiedSince = IfModifiedSince.replace(tzinfo=UTC)
+            if response["LastModified"].replace(microsecond=0) <= IfModifiedSince:
+                raise LocalStorageError("304", "Not Modified", {"etag": etag})
+
+        size = response["ContentLength"]
+        start, end = 0, size
+        if Range:
+            start, end = _parse_range(Range, size)
+            response["ContentRange"] = f"bytes {start}-{end - 1}/{size}"
+            response["ContentLength"] = end - start
+
+        response["Body"] = MappedBody(self._path(Key), start, end)
+        return response
+
+    def head_bucket(self, Bucket: str, **kwargs) -> dict[str, Any]:
+        os.makedirs(self.root, exist_ok=True)
+        return {}
+
+    def list_objects_v2(
+        self,
+        Bucket: str,
+        Prefix: str = "",
+        MaxKeys: int = 1000,
+        ContinuationToken: str | None = None,
+        **kwargs,
+    ) -> dict[str, Any]:
+        # The continuation token is simply the last key of the previous page
+        keys = [
+            key for key in self._keys() if key.startswith(Prefix) and (not ContinuationToken or key > ContinuationToken)
+        ]
+        page = keys[:MaxKeys]
+
+        contents = []
+        for key in page:
+            stat = os.stat(self._path(key))
+            contents.append(
+                {
+                    "Key": key,
+                    "Size": stat.st_size,
+                    "LastModified": datetime.fromtimestamp(stat.st_mtime, UTC),
+                    "ETag": self._etag(stat),
+                }
+            )
+
+        response = {"Contents": contents, "KeyCount": len(contents), "IsTruncated": len(keys) > MaxKeys}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def generate_presigned_url(self, ClientMethod: str, Params: dict[str, Any], ExpiresIn: int = 3600) -> str:
+        """
+        A link to the connector's /api/local-storage route, valid for ExpiresIn seconds. The
+        route serves the default storage (STORAGE_URL) only.
+        """
+        key = Params["Key"]
+        expires = int(time.time()) + ExpiresIn
+        query = urlencode({"expires": expires, "signature": self.sign(key, expires)})
+        return f"{artifacts_config.local_storage_public_url}/api/local-storage/{key}?{query}"
+
+    def sign(self, key: str, expires: int) -> str:
+        message = f"{self.storage_url}\n{key}\n{expires}".encode()
+        return hmac.new(self._signing_key(), message, hashlib.sha256).hexdigest()
+
+    def verify(self, key: str, expires: int, signature: str) -> bool:
+        return expires >= time.time() and hmac.compare_digest(self.sign(key, expires), signature)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if (
+            not path.startswith(self.root + os.sep)
+            or path.startswith(os.path.join(self.root, _INTERNAL_DIR, ""))
+            or _is_internal_file(os.path.basename(path))
+        ):
+            raise LocalStorageError("InvalidKey", f"Invalid key: {key}")
+        return path
+
+    def _keys(self) -> list[str]:
+        keys = []
+        for directory, directories, files in os.walk(self.root):
+            if directory == self.root and _INTERNAL_DIR in directories:
+                directories.remove(_INTERNAL_DIR)
+            for name in files:
+                if _is_internal_file(name):
+                    continue
+                keys.append(os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/"))
+        return sorted(keys)
+
+    def _describe(self, key: str, path: str, stat: os.stat_result) -> dict[str, Any]:
+        metadata = self._read_metadata(path)
+        response = {
+            "ContentLength": stat.st_size,
+            "ContentType": metadata.get("ContentType") or mimetypes.guess_type(key)[0] or "binary/octet-stream",
+            "ETag": self._etag(stat),
+            "LastModified": datetime.fromtimestamp(stat.st_mtime, UTC),
+            "Metadata": metadata.get("Metadata") or {},
+        }
+        if metadata.get("CacheControl"):
+            response["CacheControl"] = metadata["CacheControl"]
+        return response
+
+    def _etag(self, stat: os.stat_result) -> str:
+        # Cheap and changes with every write, unlike an MD5 of the content
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def _read_metadata(self, path: str) -> dict[str, Any]:
+        try:
+            with open(path + METADATA_SUFFIX) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_metadata(self, path: str, metadata: dict[str, Any]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, path + METADATA_SUFFIX)
+
+    def _signing_key(self) -> bytes:
+        if artifacts_config.local_storage_secret:
+            return artifacts_config.local_storage_secret.encode()
+
+        # Without a configured secret, one is generated once and kept with the data, so that
+        # every worker process (and restarts) can verify links the others issued
+        path = self._signing_key_path()
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            # mkstemp() creates the file readable only by this user
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            try:
+                # link() fails if another process got there first, and never exposes a partial key
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp_path)
+        with open(path) as f:
+            return f.read().strip().encode()
+
+    def _signing_key_path(self) -> str:
+        """
+        The generated signing key's file, in the storage directory itself, which must be
+        writable anyway (unlike its parent, e.g. a mounted volume's mount point).
+        """
+        return os.path.join(self.root, _INTERNAL_DIR, "signing-key")
+
+
+def _is_internal_file(name: str) -> bool:
+    """Whether a file name is the connector's own (metadata, partial writes, the signing key) rather than an object."""
+    return name.endswith((METADATA_SUFFIX, ".tmp")) or name == _SIGNING_KEY_FILE
+
+
+def _parse_range(range_header: str, size: int) -> tuple[int, int]:
+    """The [start, end) byte offsets of a single "bytes=" range."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise LocalStorageError("InvalidRange", f"Unsupported range: {range_header}")
+
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+    except ValueError:
+        raise LocalStorageError("InvalidRange", f"Invalid range: {range_header}") from None
+
+    if start >= end:
+        raise LocalStorageError("InvalidRange", f"Range not satisfiable: {range_header}")
+    return start, end
@@ -1,17 +1,39 @@
+import asyncio
 import logging
-from io import BytesIO
+import time
 
 import falcon.asgi
 import falcon.media
 import httpx
 import orjson
 
-from artifacts import ASSOCIATED_DOCUMENTS_MAP, v1_do_artifacts_connector
-from s3utils import (
-    create_s3_client,
-    generate_presigned_url,
-    get_bucket_for_storage,
-)
+import tracing
+from compression import CompressionMiddleware
+from config import service_config
+from deadline import ConnectorApp
+
+HTTP_ENABLED = "http" in service_config.connector_families
+ARTIFACTS_ENABLED = "artifacts" in service_config.connector_families
+
+if ARTIFACTS_ENABLED:
+    # The artifacts family brings in templates, storage and the renderer; instances that
+    # only proxy HTTP requests never import it.
+    from artifacts import ASSOCIATED_DOCUMENTS_MAP, RenderOptions, _etag_matches, v1_do_artifacts_connector
+    from attachments import close_attachments, request_attachments
+    from cache import hash_data
+    from config import artifacts_config, render_config
+    from deadline import ClientDisconnected, Deadline, DeadlineExceeded
+    from render_workers import RenderWorkerPool
+    from s3utils import (
+        InvalidStorageURL,
+        check_storage_url,
+        create_s3_client,
+        generate_presigned_url,
+        get_bucket_for_storage,
+        list_objects,
+    )
+    from spool import MemoryBudget
+    from warmup import LifespanMiddleware, Warmup
 
 # TODO: change this for prod
 logging.basicConfig(level=logging.INFO)
@@ -29,57 +51,172 @@ class liveness:
         resp.media = {"status": "ok"}
 
 
+class readiness:
+    async def on_get(self, req, resp):
+        if warmup is None:
+            resp.media = {"status": "ready", "checks": {}}
+            return
+
+        report = warmup.report()
+        resp.status = falcon.HTTP_200 if report["status"] == "ready" else falcon.HTTP_503
+        resp.media = report
+
+
+class metrics:
+    async def on_get(self, req, resp):
+        resp.media = artifacts.metrics() if artifacts is not None else {}
+
+
+class static_asset:
+    async def on_get(self, req, resp, name):
+        asset = artifacts.static_assets().get(name)
+        if asset is None:
+            resp.status = falcon.HTTP_404
+            resp.media = {"error": "not_found", "detail": f"Asset '{name}' not found"}
+            return
+
+        content_type, body, etag = asset
+        # Asset URLs are versioned by linked previews, so they can be cached indefinitely
+        resp.cache_control = ["public", "max-age=31536000", "immutable"]
+        resp.etag = etag
+
+        if _etag_matches(req.get_header("If-None-Match"), etag):
+            resp.status = falcon.HTTP_304
+            return
+
+        resp.content_type = content_type
+        resp.data = body
+
+
 class v1_commands:
     async def on_get(self, req, resp):
-        resp.media = embedded_connectors
+        resp.media = enabled_connectors
 
 
-class v1_do_http_connector:
-    def __init__(self, request_method):
-        self.request_method = request_method
+HTTP_METHODS = ("DELETE", "GET", "HEAD", "PATCH", "POST", "PUT")
 
-    async def on_post(self, req, resp):
-        params = await req.media
-        auth = None
-        error = None
-        status = 0
-        url = params.get("url")
 
-        basic_auth_username = params.get("basic_auth_username")
-        basic_auth_password = params.get("basic_auth_password")
+def _command_media(body, status: int, error: str | None = None) -> dict:
+    return {
+        "command_response": {
+            "body": body,
+            "mimetype": "application/json",
+            "http_status": status,
+        },
+        "command_response_version": 2,
+        "error": error,
+        "spiff__logs": [],
+    }
 
-        if basic_auth_username and basic_auth_password:
-            auth = (basic_auth_username, basic_auth_password)
 
-        # TODO: add better error handling
+async def _send_http_request(method: str, params: dict) -> tuple[dict, int]:
+    """Make one request for the http/* commands; returns the response body and status."""
+    auth = None
+    url = params.get("url")
+
+    basic_auth_username = params.get("basic_auth_username")
+    basic_auth_password = params.get("basic_auth_password")
+
+    if basic_auth_username and basic_auth_password:
+        auth = (basic_auth_username, basic_auth_password)
+
+    with tracing.span("http.request", **{"http.method": method, "http.url": tracing.url_attribute(url)}) as span:
         http_response = await http_client.request(
-            self.request_method,
+            method,
             url,
-            headers=params.get("headers"),
+            headers=tracing.inject(params.get("headers")),
             params=params.get("params"),
             json=params.get("data"),
             auth=auth,
         )
-        status = http_response.status_code
+        if span is not None:
+            span.set_attribute("http.status_code", http_response.status_code)
 
-        content_type = http_response.headers.get("Content-Type", "")
-        raw_response = http_response.text
+    content_type = http_response.headers.get("Content-Type", "")
+    raw_response = http_response.text
 
-        if "application/json" in content_type:
-            command_response = orjson.loads(raw_response)
-        else:
-            command_response = {"raw_response": raw_response}
+    if "application/json" in content_type:
+        command_response = orjson.loads(raw_response)
+    else:
+        command_response = {"raw_response": raw_response}
 
-        resp.media = {
-            "command_response": {
-                "body": command_response,
-                "mimetype": "application/json",
-                "http_status": status,
-            },
-            "command_response_version": 2,
-            "error": error,
-            "spiff__logs": [],
-        }
+    return command_response, http_response.status_code
+
+
+class v1_do_http_connector:
+    def __init__(self, request_method):
+        self.request_method = request_method
+
+    async def on_post(self, req, resp):
+        params = await req.media
+
+        # TODO: add better error handling
+        command_response, status = await _send_http_request(self.request_method, params)
+
+        resp.media = _command_media(command_response, status)
+
+
+class v1_do_http_batch_connector:
+    """
+    Run many requests concurrently on the shared client and return their results in
+    order, so a workflow needing data from N endpoints makes one service call instead of N.
+    """
+
+    async def on_post(self, req, resp):
+        params = await req.media
+        requests = params.get("requests")
+
+        if not isinstance(requests, list) or not requests or not all(isinstance(spec, dict) for spec in requests):
+            error = "requests must be a non-empty list of request specs"
+            resp.media = _command_media({"error": error}, 400, error=error)
+            return
+        if len(requests) > service_config.http_batch_max_requests:
+            error = f"At most {service_config.http_batch_max_requests} requests can be batched"
+            resp.media = _command_media({"error": error}, 400, error=error)
+            return
+
+        try:
+            concurrency = int(params.get("concurrency") or service_config.http_batch_concurrency)
+            timeout = float(params.get("timeout") or service_config.http_batch_timeout)
+        except (TypeError, ValueError):
+            error = "concurrency must be an integer and timeout a number of seconds"
+            resp.media = _command_media({"error": error}, 400, error=error)
+            return
+        if not timeout > 0:
+            error = "timeout must be a positive number of seconds"
+            resp.media = _command_media({"error": error}, 400, error=error)
+            return
+
+        # The concurrency and timeout parameters can lower the configured limits but not raise them
+        concurrency = max(1, min(concurrency, service_config.http_batch_concurrency))
+        timeout = min(timeout, service_config.http_batch_timeout)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(spec: dict) -> dict:
+            method = str(spec.get("method") or "GET").upper()
+            if method not in HTTP_METHODS:
+                return {"body": None, "http_status": None, "error": f"Unsupported method '{method}'"}
+            if not isinstance(spec.get("url"), str) or not spec["url"]:
+                return {"body": None, "http_status": None, "error": "url must be a non-empty string"}
+
+            async with semaphore:
+                try:
+                    async with asyncio.timeout(timeout):
+                        body, status = await _send_http_request(method, spec)
+                except TimeoutError:
+                    return {"body": None, "http_status": None, "error": f"Timed out after {timeout}s"}
+                except (httpx.HTTPError, httpx.InvalidURL, TypeError, ValueError) as e:
+                    return {"body": None, "http_status": None, "error": str(e) or type(e).__name__}
+
+            return {"body": body, "http_status": status, "error": None}
+
+        # One request failing in an unexpected way must not abandon the others mid-flight
+        results = await asyncio.gather(*(run(spec) for spec in requests), return_exceptions=True)
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logger.error("Batched request failed", exc_info=result)
+                results[index] = {"body": None, "http_status": None, "error": str(result) or type(result).__name__}
+        resp.media = _command_media({"results": results}, 200)
 
 
 #
@@ -92,21 +229,40 @@ extra_handlers = {
     ),
 }
 
-app = falcon.asgi.App(
+app = ConnectorApp(
     cors_enable=True,
+    middleware=[tracing.TracingMiddleware(), CompressionMiddleware()],
 )
 
 
 ## ASTRO / DIRECT ROUTES
+def _s3_error_code(error: Exception) -> str | None:
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+
+async def _iter_body(body, chunk_size: int):
+    """Stream a botocore response body without holding more than one chunk in memory."""
+    try:
+        while chunk := await asyncio.to_thread(body.read, chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+
 class DirectArtifactLink:
     async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, artifact_id):
         import urllib.parse
 
         artifact_id = urllib.parse.unquote(artifact_id)
+        # The path converter has to come last, so /content is recognized here
+        if artifact_id.endswith("/content"):
+            await _stream_artifact(req, resp, artifact_id.removesuffix("/content"))
+            return
+
         s3_client = create_s3_client(None)
         bucket = get_bucket_for_storage(None)
         try:
-            s3_client.head_object(Bucket=bucket, Key=artifact_id)
+            head = s3_client.head_object(Bucket=bucket, Key=artifact_id)
         except s3_client.exceptions.NoSuchKey:
             resp.status = falcon.HTTP_404
             resp.media = {
@@ -120,6 +276,19 @@ class DirectArtifactLink:
             resp.media = {"error": "s3_error", "detail": str(e)}
             return
 
+        # Links are handed out per window of max-age seconds. A link issued in a window is valid
+        # until at least LINK_CACHE_MARGIN seconds after it ends, so every response in the window
+        # can be cached until its end, and shares an ETag that revalidates the link a client has
+        max_age = max(0, artifacts_config.signed_link_expiration - artifacts_config.link_cache_margin)
+        now = int(time.time())
+        window_end = (now // max_age + 1) * max_age if max_age else now
+        etag = hash_data([str(head.get("ETag")), window_end])[:32]
+        if max_age and _etag_matches(req.get_header("If-None-Match"), etag):
+            resp.status = falcon.HTTP_304
+            resp.cache_control = ["private", f"max-age={window_end - now}"]
+            resp.etag = f'W/"{etag}"'
+            return
+
         try:
             url = generate_presigned_url(s3_client, bucket, artifact_id)
         except Exception as e:
@@ -129,93 +298,335 @@ class DirectArtifactLink:
             return
 
         resp.status = falcon.HTTP_200
+        resp.cache_control = ["private", f"max-age={window_end - now}"]
+        resp.etag = f'W/"{etag}"'
         resp.media = {"url": url}
 
 
-# artifact_id shape: {projectId}/{processId}/{artifactId}
-app.add_route("/api/artifacts/{artifact_id:path}", DirectArtifactLink())
-
+async def _stream_artifact(req: falcon.asgi.Request, resp: falcon.asgi.Response, artifact_id: str):
+    """
+    Proxy the artifact itself, for clients that can't reach the presigned URL's endpoint.
+    Range and conditional headers are passed through to S3.
+    """
+    kwargs = {"Bucket": get_bucket_for_storage(None), "Key": artifact_id}
+    if range_header := req.get_header("Range"):
+        kwargs["Range"] = range_header
+    if if_none_match := req.get_header("If-None-Match"):
+        kwargs["IfNoneMatch"] = if_none_match
+    try:
+        if if_modified_since := req.get_header_as_datetime("If-Modified-Since"):
+            kwargs["IfModifiedSince"] = if_modified_since
+    except falcon.HTTPError:
+        # Invalid dates are ignored, as HTTP requires
+        pass
+
+    s3_client = create_s3_client(None)
+    try:
+        obj = await asyncio.to_thread(s3_client.get_object, **kwargs)
+    except Exception as e:
+        code = _s3_error_code(e)
+        if code in ("304", "NotModified"):
+            resp.status = falcon.HTTP_304
+            headers = getattr(e, "response", {}).get("ResponseMetadata", {}).get("HTTPHeaders", {})
+            if headers.get("etag"):
+                resp.etag = headers["etag"]
+            return
+        if _is_missing_object(s3_client, e):
+            resp.status = falcon.HTTP_404
+            resp.media = {"error": "not_found", "detail": f"Artifact '{artifact_id}' not found"}
+            return
+        if code in ("416", "InvalidRange"):
+            resp.status = falcon.HTTP_416
+            resp.media = {"error": "invalid_range", "detail": str(e)}
+            return
+        logger.exception("Error fetching artifact content")
+        resp.status = falcon.HTTP_500
+        resp.media = {"error": "s3_error", "detail": str(e)}
+        return
+
+    resp.status = falcon.HTTP_206 if obj.get("ContentRange") else falcon.HTTP_200
+    resp.content_type = obj.get("ContentType") or "application/pdf"
+    resp.content_length = obj.get("ContentLength")
+    resp.accept_ranges = "bytes"
+    if obj.get("ContentRange"):
+        resp.set_header("Content-Range", obj["ContentRange"])
+    if obj.get("ETag"):
+        resp.etag = obj["ETag"]
+    if obj.get("LastModified"):
+        resp.last_modified = obj["LastModified"]
+    if obj.get("CacheControl"):
+        resp.set_header("Cache-Control", obj["CacheControl"])
+    resp.stream = _iter_body(obj["Body"], artifacts_config.download_chunk_size)
+
+
+def _is_missing_object(s3_client, error: Exception) -> bool:
+    if isinstance(error, s3_client.exceptions.NoSuchKey):
+        return True
+    # head_object reports a missing key as a bare 404 ClientError, and local storage refuses
+    # keys that can't name an object (its own metadata and key files) with InvalidKey
+    return _s3_error_code(error) in ("404", "NoSuchKey", "InvalidKey")
+
+
+def _resolve_link(s3_client, bucket: str, artifact_id: str) -> dict:
+    try:
+        s3_client.head_object(Bucket=bucket, Key=artifact_id)
+    except Exception as e:
+        if _is_missing_object(s3_client, e):
+            return {"id": artifact_id, "error": "not_found", "detail": f"Artifact '{artifact_id}' not found"}
+        logger.exception("Error checking artifact existence")
+        return {"id": artifact_id, "error": "s3_error", "detail": str(e)}
+
+    try:
+        url = generate_presigned_url(s3_client, bucket, artifact_id)
+    except Exception as e:
+        logger.exception("Error generating presigned URL")
+        return {"id": artifact_id, "error": "presign_failed", "detail": str(e)}
+
+    return {"id": artifact_id, "url": url}
+
+
+class DirectArtifactResolveLinks:
+    """Resolve many artifact ids at once, so a page listing artifacts makes one request instead of one per id."""
 
-class DirectArtifactPost:
     async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
         try:
-            params = await req.media
+            params = await req.get_media()
         except Exception as e:
             resp.status = falcon.HTTP_400
             resp.media = {"error": "invalid_request", "detail": str(e)}
             return
 
-        artifact_id = params.get("id")
-        template_name = params.get("template")
-        template_data = params.get("data")
-        generate_links = params.get("generate_links", False)
-        storage = params.get("storage", None)
+        artifact_ids = params.get("ids") if isinstance(params, dict) else None
+        if not artifact_ids or not isinstance(artifact_ids, list) or not all(isinstance(i, str) for i in artifact_ids):
+            resp.status = falcon.HTTP_400
+            resp.media = {"error": "missing_params", "detail": "ids must be a non-empty list of artifact ids"}
+            return
 
-        if not artifact_id or not template_name or not template_data:
+        if len(artifact_ids) > artifacts_config.resolve_links_max_ids:
             resp.status = falcon.HTTP_400
             resp.media = {
-                "error": "missing_params",
-                "detail": "id, template, and data are required",
+                "error": "too_many_ids",
+                "detail": f"At most {artifacts_config.resolve_links_max_ids} ids can be resolved per request",
             }
             return
 
-        attachments = template_data.get("attachments", [])
-
+        storage = params.get("storage")
         try:
-            template_data = artifacts._format_template_data(template_name, template_data, [])
-            rendered_document = artifacts._render_template_html(template_name, template_data)
+            s3_client = create_s3_client(storage)
+            bucket = get_bucket_for_storage(storage)
+        except InvalidStorageURL as e:
+            resp.status = falcon.HTTP_400
+            resp.media = {"error": "invalid_request", "detail": str(e)}
+            return
         except Exception as e:
-            logger.exception("Error rendering template")
+            logger.exception("Error creating S3 client")
             resp.status = falcon.HTTP_500
-            resp.media = {"error": "template_error", "detail": str(e)}
+            resp.media = {"error": "s3_error", "detail": str(e)}
             return
 
-        associated_documents: list[str] = []
-        for associated_document_template in ASSOCIATED_DOCUMENTS_MAP.get(template_name, []):
-            associated_documents.append(artifacts._render_template_html(associated_document_template, template_data))
+        # boto3 calls block, so they run in threads; the semaphore bounds the fan-out
+        semaphore = asyncio.Semaphore(artifacts_config.resolve_links_concurrency)
+
+        async def resolve(artifact_id: str) -> dict:
+            async with semaphore:
+                return await asyncio.to_thread(_resolve_link, s3_client, bucket, artifact_id)
+
+        # Duplicate ids are looked up once
+        unique_ids = list(dict.fromkeys(artifact_ids))
+        resolved = dict(zip(unique_ids, await asyncio.gather(*(resolve(i) for i in unique_ids)), strict=True))
+
+        resp.status = falcon.HTTP_200
+        resp.media = {"results": [resolved[artifact_id] for artifact_id in artifact_ids]}
 
-        try:
-            pdf_buffer = await artifacts._generate_pdf_with_attachments(
-                rendered_document, associated_documents, attachments
-            )
-        except Exception as e:
-            logger.exception("Error generating PDF")
-            resp.status = falcon.HTTP_500
-            resp.media = {"error": "pdf_generation_failed", "detail": str(e)}
-            return
 
-        pdf_stream = BytesIO(pdf_buffer)
-        pdf_stream.seek(0)
+def _list_artifacts(s3_client, bucket: str, prefix: str, limit: int, cursor: str | None, presign: bool) -> dict:
+    page = list_objects(s3_client, bucket, prefix, max_keys=limit, continuation_token=cursor)
+    artifacts = page["objects"]
+    if presign:
+        # The cached page is shared, so presigned URLs go on copies
+        artifacts = [{**obj, "url": generate_presigned_url(s3_client, bucket, obj["id"])} for obj in artifacts]
+    return {"artifacts": artifacts, "next_cursor": page["next_cursor"]}
 
-        s3_client = create_s3_client(storage)
-        bucket = get_bucket_for_storage(storage)
 
+class DirectArtifactList:
+    """List artifacts under a {projectId}/ or {projectId}/{processId}/ prefix, a page at a time."""
+
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
         try:
-            s3_client.put_object(
-                Bucket=bucket,
-                Key=artifact_id,
-                Body=pdf_stream,
-                ContentType="application/pdf",
-            )
-        except Exception as e:
-            logger.exception("Error uploading artifact to S3")
-            resp.status = falcon.HTTP_500
-            resp.media = {"error": "upload_failed", "detail": str(e)}
+            prefix = req.get_param("prefix", required=True)
+            limit = req.get_param_as_int("limit", default=100, min_value=1, max_value=1000)
+            presign = req.get_param_as_bool("presign", default=False)
+        except falcon.HTTPError as e:
+            resp.status = falcon.HTTP_400
+            resp.media = {"error": "invalid_request", "detail": e.description or e.title}
             return
 
+        cursor = req.get_param("cursor")
+        storage = req.get_param("storage")
+
         try:
-            response = artifacts._generate_artifact_response(s3_client, bucket, artifact_id, generate_links)
+            s3_client = create_s3_client(storage)
+            bucket = get_bucket_for_storage(storage)
+            result = await asyncio.to_thread(_list_artifacts, s3_client, bucket, prefix, limit, cursor, presign)
+        except InvalidStorageURL as e:
+            resp.status = falcon.HTTP_400
+            resp.media = {"error": "invalid_request", "detail": str(e)}
+            return
         except Exception as e:
-            logger.exception("Error generating artifact response links")
+            logger.exception("Error listing artifacts")
             resp.status = falcon.HTTP_500
-            resp.media = {"error": "response_generation_failed", "detail": str(e)}
+            resp.media = {"error": "s3_error", "detail": str(e)}
             return
 
         resp.status = falcon.HTTP_200
-        resp.media = response
+        resp.media = result
+
+
+class LocalStorageObject:
+    """Serves the signed links LocalStorageClient hands out for file:// storage."""
+
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, key):
+        s3_client = create_s3_client(None)
+        try:
+            expires = req.get_param_as_int("expires", default=0)
+        except falcon.HTTPError:
+            expires = 0
+        signature = req.get_param("signature", default="")
+
+        if not hasattr(s3_client, "verify") or not s3_client.verify(key, expires, signature):
+            resp.status = falcon.HTTP_403
+            resp.media = {"error": "invalid_signature", "detail": "Link is invalid or has expired"}
+            return
+
+        await _stream_artifact(req, resp, key)
+
+
+# artifact_id shape: {projectId}/{processId}/{artifactId}
+if ARTIFACTS_ENABLED:
+    app.add_route("/api/local-storage/{key:path}", LocalStorageObject())
+    app.add_route("/api/artifacts", DirectArtifactList())
+    app.add_route("/api/artifacts/ResolveLinks", DirectArtifactResolveLinks())
+    app.add_route("/api/artifacts/{artifact_id:path}", DirectArtifactLink())
 
 
-app.add_route("/api/artifacts/GenerateArtifact", DirectArtifactPost())
+class DirectArtifactPost:
+    async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        try:
+            params = await artifacts._read_generate_artifact_params(req)
+        except Exception as e:
+            resp.status = falcon.HTTP_400
+            resp.media = {"error": "invalid_request", "detail": str(e)}
+            return
+
+        try:
+            artifact_id = params.get("id")
+            template_name = params.get("template")
+            template_data = params.get("data")
+            generate_links = params.get("generate_links", False)
+            storage = params.get("storage", None)
+
+            if not artifact_id or not template_name or not template_data:
+                resp.status = falcon.HTTP_400
+                resp.media = {
+                    "error": "missing_params",
+                    "detail": "id, template, and data are required",
+                }
+                return
+
+            try:
+                render_slot = artifacts._render_slot(req, params)
+                render_options = RenderOptions.from_params(params)
+                deadline = Deadline.from_request(req, params)
+                check_storage_url(storage)
+            except ValueError as e:
+                resp.status = falcon.HTTP_400
+                resp.media = {"error": "invalid_request", "detail": str(e)}
+                return
+
+            attachments = template_data.get("attachments", [])
+
+            try:
+                template_data = artifacts._format_template_data(template_name, template_data, [])
+                rendered_document = artifacts._render_template_html(template_name, template_data)
+            except Exception as e:
+                logger.exception("Error rendering template")
+                resp.status = falcon.HTTP_500
+                resp.media = {"error": "template_error", "detail": str(e)}
+                return
+
+            associated_documents: list[str] = []
+            for associated_document_template in ASSOCIATED_DOCUMENTS_MAP.get(template_name, []):
+                associated_documents.append(
+                    artifacts._render_template_html(associated_document_template, template_data)
+                )
+
+            budget = MemoryBudget.from_config()
+            try:
+                rendered = await artifacts._render_artifact(
+                    req,
+                    deadline,
+                    render_slot,
+                    rendered_document,
+                    associated_documents,
+                    attachments,
+                    render_options,
+                    budget,
+                )
+            except DeadlineExceeded as e:
+                resp.status = falcon.HTTP_504
+                resp.media = {"error": "deadline_exceeded", "detail": str(e)}
+                return
+            except ClientDisconnected as e:
+                logger.info("Client disconnected; stopped generating %s", artifact_id)
+                resp.status = 499
+                resp.media = {"error": "client_disconnected", "detail": str(e)}
+                return
+            except Exception as e:
+                logger.exception("Error generating PDF")
+                resp.status = falcon.HTTP_500
+                resp.media = {"error": "pdf_generation_failed", "detail": str(e)}
+                return
+            finally:
+                close_attachments(attachments)
+                resp.set_header("X-Artifact-Memory", budget.header_value())
+
+            try:
+                deadline.check("upload")
+            except DeadlineExceeded as e:
+                resp.status = falcon.HTTP_504
+                resp.media = {"error": "deadline_exceeded", "detail": str(e)}
+                return
+
+            s3_client = create_s3_client(storage)
+            bucket = get_bucket_for_storage(storage)
+
+            try:
+                preview = artifacts._store_artifact(s3_client, bucket, artifact_id, rendered, template_name)
+            except Exception as e:
+                logger.exception("Error uploading artifact to S3")
+                resp.status = falcon.HTTP_500
+                resp.media = {"error": "upload_failed", "detail": str(e)}
+                return
+
+            try:
+                response = artifacts._generate_artifact_response(
+                    s3_client, bucket, artifact_id, generate_links, preview
+                )
+            except Exception as e:
+                logger.exception("Error generating artifact response links")
+                resp.status = falcon.HTTP_500
+                resp.media = {"error": "response_generation_failed", "detail": str(e)}
+                return
+
+            resp.status = falcon.HTTP_200
+            resp.media = response
+        finally:
+            # Uploads are spooled to disk, which must not outlive the request however it ends
+            close_attachments(request_attachments(params))
+
+
+if ARTIFACTS_ENABLED:
+    app.add_route("/api/artifacts/GenerateArtifact", DirectArtifactPost())
 
 
 ## SPIFF ROUTES
@@ -224,20 +635,34 @@ app.req_options.media_handlers.update(extra_handlers)
 app.resp_options.media_handlers.update(extra_handlers)
 
 app.add_route("/liveness", liveness())
+app.add_route("/readiness", readiness())
+app.add_route("/metrics", metrics())
 app.add_route("/v1/commands", v1_commands())
 
-app.add_route("/v1/do/http/DeleteRequest", v1_do_http_connector("DELETE"))
-app.add_route("/v1/do/http/GetRequest", v1_do_http_connector("GET"))
-app.add_route("/v1/do/http/HeadRequest", v1_do_http_connector("HEAD"))
-app.add_route("/v1/do/http/PatchRequest", v1_do_http_connector("PATCH"))
-app.add_route("/v1/do/http/PostRequest", v1_do_http_connector("POST"))
-app.add_route("/v1/do/http/PutRequest", v1_do_http_connector("PUT"))
-
-# Add new artifact routes
-artifacts = v1_do_artifacts_connector()
-app.add_route("/v1/do/artifacts/GenerateArtifact", artifacts, suffix="generate_artifact")
-app.add_route("/v1/do/artifacts/GenerateHtmlPreview", artifacts, suffix="generate_html_preview")
-app.add_route("/v1/do/artifacts/GetLinkToArtifact", artifacts, suffix="get_link")
+if HTTP_ENABLED:
+    app.add_route("/v1/do/http/DeleteRequest", v1_do_http_connector("DELETE"))
+    app.add_route("/v1/do/http/GetRequest", v1_do_http_connector("GET"))
+    app.add_route("/v1/do/http/HeadRequest", v1_do_http_connector("HEAD"))
+    app.add_route("/v1/do/http/PatchRequest", v1_do_http_connector("PATCH"))
+    app.add_route("/v1/do/http/PostRequest", v1_do_http_connector("POST"))
+    app.add_route("/v1/do/http/PutRequest", v1_do_http_connector("PUT"))
+    app.add_route("/v1/do/http/BatchRequest", v1_do_http_batch_connector())
+
+artifacts = None
+warmup = None
+if ARTIFACTS_ENABLED:
+    # Add new artifact routes
+    # Optionally isolate Chromium and pypdf in separate worker processes
+    render_pool = RenderWorkerPool.from_config() if render_config.workers else None
+    artifacts = v1_do_artifacts_connector(http_client=http_client, render_pool=render_pool)
+    app.add_route("/static/{name}", static_asset())
+    app.add_route("/v1/do/artifacts/GenerateArtifact", artifacts, suffix="generate_artifact")
+    app.add_route("/v1/do/artifacts/GenerateHtmlPreview", artifacts, suffix="generate_html_preview")
+    app.add_route("/v1/do/artifacts/GetLinkToArtifact", artifacts, suffix="get_link")
+
+    # Warm up templates, storage and the renderer at startup; see /readiness
+    warmup = Warmup(artifacts)
+    app.add_middleware(LifespanMiddleware(warmup))
 
 #
 # Static Data
@@ -249,12 +674,22 @@ generate_artifact_params = [
     {"id": "data", "type": "dict", "required": True},
     {"id": "generate_links", "type": "bool", "required": False},
     {"id": "storage", "type": "str", "required": False},
+    {"id": "optimize_pdf", "type": "bool", "required": False},
+    {"id": "linearize", "type": "bool", "required": False},
+    {"id": "single_pass", "type": "bool", "required": False},
+    {"id": "priority", "type": "str", "required": False},
+    {"id": "thumbnail", "type": "any", "required": False},
+    {"id": "timeout", "type": "float", "required": False},
+    {"id": "deadline", "type": "float", "required": False},
 ]
 
 generate_html_preview_params = [
     {"id": "id", "type": "str", "required": True},
     {"id": "template", "type": "str", "required": True},
     {"id": "data", "type": "dict", "required": True},
+    {"id": "etag", "type": "str", "required": False},
+    {"id": "preview_mode", "type": "str", "required": False},
+    {"id": "compress", "type": "bool", "required": False},
 ]
 
 get_link_params = [
@@ -284,7 +719,15 @@ http_rw_params = [
     *http_basic_auth_params,
 ]
 
+http_batch_params = [
+    # Each request spec takes a "method" (default GET) and the http_rw_params fields
+    {"id": "requests", "type": "any", "required": True},
+    {"id": "concurrency", "type": "int", "required": False},
+    {"id": "timeout", "type": "float", "required": False},
+]
+
 embedded_connectors = [
+    {"id": "http/BatchRequest", "parameters": http_batch_params},
     {"id": "http/DeleteRequest", "parameters": http_rw_params},
     {"id": "http/GetRequest", "parameters": http_ro_params},
     {"id": "http/HeadRequest", "parameters": http_ro_params},
@@ -295,3 +738,8 @@ embedded_connectors = [
     {"id": "artifacts/GenerateHtmlPreview", "parameters": generate_html_preview_params},
     {"id": "artifacts/GetLinkToArtifact", "parameters": get_link_params},
 ]
+
+# Only advertise the commands this instance serves
+enabled_connectors = [
+    connector for connector in embedded_connectors if connector["id"].split("/")[0] in service_config.connector_families
+]
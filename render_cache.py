@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Any
+
+from cache import BytesLRUCache, DiskLRU, hash_data
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """
+    Caches HTML-to-PDF renders by a hash of the HTML, the render options and the template
+    version, so that unchanged sections (associated documents, image attachments, drafts
+    that are regenerated after a small edit) skip Chromium entirely.
+
+    Recent renders are kept in memory, up to memory_bytes. With a directory, every render is
+    also written to disk, readable only by this user since the PDFs hold personal data.
+    Entries older than ttl seconds are ignored and removed, and the directory is trimmed
+    least-recently-used first once it exceeds max_disk_bytes. The disk tier is shared by
+    every process on the host that uses the same directory.
+    """
+
+    def __init__(self, memory_bytes: int, directory: str | None, max_disk_bytes: int, ttl: float | None = None):
+        self.memory = BytesLRUCache(max_bytes=memory_bytes)
+        self.disk = DiskLRU(directory, max_disk_bytes, ".pdf", ttl=ttl, private=True) if directory else None
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, html_content: str, options: dict[str, Any], version: str) -> str:
+        return hash_data([version, options, html_content])
+
+    async def get(self, key: str) -> bytes | None:
+        pdf = self.memory.get(key)
+        if pdf is not None:
+            return pdf
+
+        if self.disk is not None:
+            pdf = await asyncio.to_thread(self._read, key)
+            if pdf is not None:
+                self.disk_hits += 1
+                self.memory.set(key, pdf)
+                return pdf
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, pdf: bytes) -> None:
+        self.memory.set(key, pdf)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.write, f"{key}.pdf", pdf)
+            except OSError:
+                logger.warning("Could not write render cache entry %s", key, exc_info=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "disk_bytes": self.disk.size if self.disk is not None else 0,
+        }
+
+    def _read(self, key: str) -> bytes | None:
+        if not self.disk.touch(f"{key}.pdf"):
+            return None
+        try:
+            with open(self.disk.path(f"{key}.pdf"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
@@ -0,0 +1,267 @@
+"""
+An optional pool of render worker processes. Chromium and pypdf run in the workers, so a
+leaking or crashing render can't take the API process (and its liveness probe and HTTP
+connector traffic) down with it.
+
+The API process lays out the sections to render and sends them to an idle worker over a
+pipe; the worker renders and merges them and sends back the PDF (and its thumbnail, if one
+was asked for). Workers are recycled after a number of renders or once their process tree
+(the worker plus its Chromium processes) exceeds a memory threshold, and jobs whose worker
+crashed are retried on a fresh worker.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Any
+
+from config import render_config
+from spool import MemoryBudget, read_buffer
+
+if TYPE_CHECKING:
+    from artifacts import RenderedPdf, RenderOptions
+
+logger = logging.getLogger(__name__)
+
+
+class RenderError(RuntimeError):
+    """The worker ran the job, but rendering failed."""
+
+
+class RenderWorkerCrashed(RuntimeError):
+    """The job's worker died or timed out on every attempt."""
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident memory of a process and all of its descendants, in bytes (0 where /proc is unavailable)."""
+    children: dict[int, list[int]] = {}
+    rss: dict[int, int] = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return 0
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so fields are counted from its closing parenthesis
+        fields = stat[stat.rindex(")") + 2 :].split()
+        rss[int(entry)] = int(fields[21]) * page_size
+        children.setdefault(int(fields[1]), []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+def serve(conn) -> None:
+    """Worker process entry point: render jobs from the pipe until told to stop."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(conn))
+
+
+async def _serve(conn) -> None:
+    from artifacts import RenderOptions, v1_do_artifacts_connector
+
+    connector = v1_do_artifacts_connector()
+    try:
+        while True:
+            job = await asyncio.to_thread(conn.recv)
+            if job is None:
+                break
+
+            sections, options = job
+            budget = MemoryBudget.from_config()
+            try:
+                result = await connector._render_sections(sections, RenderOptions(**options), budget)
+            except Exception as e:
+                logger.exception("Render job failed")
+                conn.send(("error", str(e)))
+            else:
+                conn.send(("ok", result))
+            finally:
+                budget.close()
+                logger.info("Render worker memory: %s", budget.header_value())
+    except EOFError:
+        # The API process went away
+        pass
+    finally:
+        await connector.renderer.stop()
+
+
+class RenderWorker:
+    """One worker process and the API process's end of its pipe."""
+
+    def __init__(self, context, target):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=target, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.pid = self.process.pid
+        self.renders = 0
+
+    def call(self, job: Any, timeout: float) -> tuple[str, Any]:
+        self.conn.send(job)
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"Render worker {self.pid} did not answer within {timeout}s")
+        return self.conn.recv()
+
+    def rss(self) -> int:
+        return process_tree_rss(self.pid)
+
+    def stop(self) -> None:
+        """Ask the worker to finish (closing Chromium), killing it if it doesn't."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(10)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self._close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self._close()
+
+    def _close(self) -> None:
+        self.conn.close()
+        # Release the process's pipes now rather than whenever it is garbage collected
+        self.process.close()
+
+
+class RenderWorkerPool:
+    def __init__(
+        self,
+        size: int,
+        max_renders: int = 0,
+        max_rss: int = 0,
+        timeout: float = 120,
+        retries: int = 1,
+        target=serve,
+    ):
+        self.size = size
+        # Recycle a worker after this many renders or once its process tree uses this many bytes; 0 disables
+        self.max_renders = max_renders
+        self.max_rss = max_rss
+        self.timeout = timeout
+        # How often a job is retried on a fresh worker after its worker crashed
+        self.retries = retries
+        self.target = target
+        # Spawned workers don't inherit the API process's event loop, threads or connections
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: asyncio.Queue[RenderWorker] = asyncio.Queue()
+        self._workers: set[RenderWorker] = set()
+        self._spawning = 0
+        self.recycled = 0
+        self.crashed = 0
+
+    @classmethod
+    def from_config(cls) -> "RenderWorkerPool":
+        return cls(
+            size=render_config.workers,
+            max_renders=render_config.worker_max_renders,
+            max_rss=render_config.worker_max_rss,
+            timeout=render_config.worker_timeout,
+            retries=render_config.worker_retries,
+        )
+
+    async def start(self) -> None:
+        """Spawn every worker up front rather than on first use."""
+        while len(self._workers) + self._spawning < self.size:
+            self._idle.put_nowait(await self._spawn())
+
+    async def render(self, sections: list[tuple[str, str | bytes]], options: "RenderOptions") -> "RenderedPdf":
+        # Spooled PDF sections are read back to be sent over the pipe
+        sections = [(kind, read_buffer(content) if kind == "pdf" else content) for kind, content in sections]
+        return await self._run((sections, asdict(options)))
+
+    async def _run(self, job: tuple[list, dict[str, Any]]) -> Any:
+        attempt = 0
+        while True:
+            worker = await self._acquire()
+            try:
+                status, payload = await asyncio.to_thread(worker.call, job, self.timeout)
+            except (EOFError, OSError, TimeoutError) as e:
+                self.crashed += 1
+                self._discard(worker)
+                attempt += 1
+                if attempt > self.retries:
+                    raise RenderWorkerCrashed(f"Render failed after {attempt} attempt(s): {e}") from e
+                logger.warning("Render worker %s failed (%s); retrying on a fresh worker", worker.pid, e)
+                continue
+            except BaseException:
+                # Cancelled mid-job: the worker's answer would be read by the next job
+                self._discard(worker)
+                raise
+
+            await self._release(worker)
+            if status == "error":
+                raise RenderError(payload)
+            return payload
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize(),
+            "recycled": self.recycled,
+            "crashed": self.crashed,
+        }
+
+    async def stop(self) -> None:
+        workers, self._workers = self._workers, set()
+        self._idle = asyncio.Queue()
+        await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in workers))
+
+    async def _spawn(self) -> RenderWorker:
+        self._spawning += 1
+        try:
+            worker = await asyncio.to_thread(RenderWorker, self._context, self.target)
+        finally:
+            self._spawning -= 1
+        self._workers.add(worker)
+        logger.info("Started render worker %s", worker.pid)
+        return worker
+
+    async def _acquire(self) -> RenderWorker:
+        if self._idle.empty() and len(self._workers) + self._spawning < self.size:
+            return await self._spawn()
+        return await self._idle.get()
+
+    async def _release(self, worker: RenderWorker) -> None:
+        worker.renders += 1
+        reason = None
+        if self.max_renders and worker.renders >= self.max_renders:
+            reason = f"{worker.renders} renders"
+        elif self.max_rss and (rss := await asyncio.to_thread(worker.rss)) >= self.max_rss:
+            reason = f"{rss // (1024 * 1024)}MB resident"
+
+        if reason is None:
+            self._idle.put_nowait(worker)
+            return
+
+        logger.info("Recycling render worker %s after %s", worker.pid, reason)
+        self.recycled += 1
+        self._workers.discard(worker)
+        await asyncio.to_thread(worker.stop)
+        # Keep the pool at full size so the next job doesn't pay for the spawn
+        self._idle.put_nowait(await self._spawn())
+
+    def _discard(self, worker: RenderWorker) -> None:
+        self._workers.discard(worker)
+        worker.kill()
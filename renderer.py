@@ -0,0 +1,152 @@
+import asyncio
+import fcntl
+import logging
+import os
+import random
+from collections.abc import Callable
+from contextlib import asynccontextmanager, nullcontext
+from typing import TYPE_CHECKING
+
+from config import render_config
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, Playwright, Route
+
+logger = logging.getLogger(__name__)
+
+
+class HostRenderBudget:
+    """
+    A counting semaphore shared by every worker process on the host, so that N workers
+    with M concurrent renders each don't run N x M Chromium renders at once. Each slot is
+    an flock()ed file; the OS releases a slot if the worker holding it dies.
+    """
+
+    def __init__(self, slots: int, directory: str, poll_interval: float = 0.05):
+        self.slots = slots
+        self.directory = directory
+        self.poll_interval = poll_interval
+
+    def _try_acquire(self) -> int | None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Start at a random slot so workers don't all contend for slot 0
+        offset = random.randrange(self.slots)
+        for i in range(self.slots):
+            fd = os.open(os.path.join(self.directory, f"slot-{(offset + i) % self.slots}.lock"), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    @asynccontextmanager
+    async def slot(self):
+        delay = self.poll_interval
+        while (fd := self._try_acquire()) is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class Renderer:
+    """
+    A Chromium instance shared by every render in the process. It is launched on first
+    use (or during warm-up) and relaunched if the browser goes away.
+
+    At most RENDER_POOL_SIZE pages render at once in this process and, when RENDER_BUDGET
+    is set, at most RENDER_BUDGET across all worker processes on the host.
+
+    Every network request a page makes is intercepted: URLs that resolve_asset knows are
+    answered from memory, and with RENDER_BLOCK_EXTERNAL_REQUESTS everything else is
+    refused, so renders never wait on the network.
+    """
+
+    def __init__(self, resolve_asset: Callable[[str], tuple[str, bytes] | None] | None = None):
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+        self._lock = asyncio.Lock()
+        self._pool = asyncio.Semaphore(render_config.pool_size)
+        self.budget = HostRenderBudget(render_config.budget, render_config.budget_dir) if render_config.budget else None
+        # Maps a URL requested by a page to (content type, body), or None if it isn't a known asset
+        self.resolve_asset = resolve_asset
+        self.served_assets = 0
+        self.blocked_requests = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def start(self) -> "Browser":
+        # Playwright is only loaded once something is actually rendered
+        from playwright.async_api import async_playwright
+
+        async with self._lock:
+            if self.is_running:
+                return self._browser
+
+            if self._browser is not None:
+                logger.warning("Chromium disconnected; relaunching")
+                await self._close()
+
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch()
+            logger.info("Launched Chromium %s", self._browser.version)
+            return self._browser
+
+    async def browser(self) -> "Browser":
+        if self.is_running:
+            return self._browser
+        return await self.start()
+
+    @asynccontextmanager
+    async def page(self):
+        """A fresh page that is always closed afterwards, so pages never accumulate in the browser."""
+        async with self._pool, self.budget.slot() if self.budget else nullcontext():
+            browser = await self.browser()
+            page = await browser.new_page()
+            try:
+                if self.resolve_asset is not None or render_config.block_external_requests:
+                    await page.route("**/*", self._route)
+                yield page
+            finally:
+                await page.close()
+
+    def stats(self) -> dict[str, int]:
+        return {"served_assets": self.served_assets, "blocked_requests": self.blocked_requests}
+
+    async def _route(self, route: "Route") -> None:
+        url = route.request.url
+        asset = self.resolve_asset(url) if self.resolve_asset is not None else None
+        if asset is not None:
+            content_type, body = asset
+            self.served_assets += 1
+            await route.fulfill(status=200, content_type=content_type, body=body)
+        elif render_config.block_external_requests:
+            self.blocked_requests += 1
+            logger.info("Blocked a request from a rendered page: %s", url)
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    async def stop(self) -> None:
+        async with self._lock:
+            await self._close()
+
+    async def _close(self) -> None:
+        browser, playwright = self._browser, self._playwright
+        self._browser = self._playwright = None
+
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                logger.warning("Error closing Chromium", exc_info=True)
+        if playwright is not None:
+            await playwright.stop()
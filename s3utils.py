@@ -1,13 +1,62 @@
+import threading
 from urllib.parse import urlparse
 
-import boto3
-from botocore.config import Config
+from cache import LRUCache, TTLCache
+from config import artifacts_config, get_s3_config
+from tracing import TracedClient
 
-from config import s3_config
+# boto3 clients are thread-safe but expensive to build, so we keep one per recently used
+# storage URL. Creating them is not thread-safe (it uses boto3's default session), hence the lock.
+_s3_clients = LRUCache(maxsize=artifacts_config.storage_client_cache_size)
+_s3_clients_lock = threading.Lock()
+
+# Pages of list_objects keyed by (bucket, prefix, max_keys, continuation token)
+_listings = TTLCache(maxsize=256, ttl=artifacts_config.listing_cache_ttl)
+
+# Artifact thumbnails are stored under their own prefix, which listings leave out
+THUMBNAIL_PREFIX = "_thumbnails/"
+
+
+class InvalidStorageURL(ValueError):
+    """A storage URL a request may not use."""
+
+
+def check_storage_url(storage_url: str | None) -> None:
+    """
+    Reject a custom storage URL for a local directory. Those are only for the configured
+    STORAGE_URL: from a request, they would let callers read and write any file the
+    connector can.
+    """
+    if storage_url and urlparse(storage_url).scheme == "file":
+        raise InvalidStorageURL("Local storage can only be configured with STORAGE_URL, not requested")
 
 
 def create_s3_client(storage_url: str | None = None):
+    """Get the (cached) S3 client for either environment config or a custom storage URL."""
+    check_storage_url(storage_url)
+    with _s3_clients_lock:
+        s3_client = _s3_clients.get(storage_url)
+        if s3_client is None:
+            # Every storage operation is recorded as a span when tracing is enabled
+            s3_client = TracedClient(_build_s3_client(storage_url))
+            _s3_clients.set(storage_url, s3_client)
+        return s3_client
+
+
+def _build_s3_client(storage_url: str | None = None):
     """Create an S3 client using either environment config or custom storage URL."""
+    storage_url = storage_url or artifacts_config.storage_url
+    if storage_url and storage_url.startswith("file://"):
+        # A directory on this host, behind the same client API
+        from localstorage import LocalStorageClient, storage_root
+
+        return LocalStorageClient(storage_root(storage_url))
+
+    # boto3 is slow to import, so it is only loaded once storage is actually used
+    import boto3
+    from botocore.config import Config
+
+    s3_config = get_s3_config()
     if storage_url:
         # Parse s3:// URL for custom storage
         parsed = urlparse(storage_url)
@@ -31,6 +80,7 @@ def create_s3_client(storage_url: str | None = None):
             signature_version="s3v4",
             request_checksum_calculation="when_required",
             response_checksum_validation="when_required",
+            max_pool_connections=s3_config.max_pool_connections,
         ),
     }
 
@@ -68,14 +118,22 @@ def create_s3_client(storage_url: str | None = None):
 
 def get_bucket_for_storage(storage_url: str | None = None) -> str:
     """Get the S3 bucket name from either storage URL or config."""
+    check_storage_url(storage_url)
+    storage_url = storage_url or artifacts_config.storage_url
+    if storage_url and storage_url.startswith("file://"):
+        from localstorage import storage_root
+
+        return storage_root(storage_url)
     if storage_url:
         parsed = urlparse(storage_url)
         return parsed.netloc
-    return s3_config.bucket
+    return get_s3_config().bucket
 
 
 def generate_private_link(bucket: str, key: str) -> str:
-    """Generate a private s3:// URL for an object."""
+    """Generate a private s3:// URL for an object (file:// for local storage, whose bucket is a directory)."""
+    if bucket.startswith("/"):
+        return f"file://{bucket}/{key}"
     return f"s3://{bucket}/{key}"
 
 
@@ -84,5 +142,43 @@ def generate_presigned_url(s3_client, bucket: str, key: str) -> str:
     return s3_client.generate_presigned_url(
         "get_object",
         Params={"Bucket": bucket, "Key": key},
-        ExpiresIn=s3_config.signed_link_expiration,
+        ExpiresIn=artifacts_config.signed_link_expiration,
     )
+
+
+def list_objects(s3_client, bucket: str, prefix: str, max_keys: int = 100, continuation_token: str | None = None):
+    """
+    One page of the objects under prefix, as {"objects": [...], "next_cursor": token or None},
+    leaving out thumbnails (see THUMBNAIL_PREFIX).
+    Pages are cached briefly; writes through the service invalidate them (see invalidate_listings).
+    """
+    cache_key = (bucket, prefix, max_keys, continuation_token)
+    page = _listings.get(cache_key)
+    if page is not None:
+        return page
+
+    kwargs = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": max_keys}
+    if continuation_token:
+        kwargs["ContinuationToken"] = continuation_token
+    response = s3_client.list_objects_v2(**kwargs)
+
+    page = {
+        "objects": [
+            {
+                "id": obj["Key"],
+                "size": obj["Size"],
+                "last_modified": obj["LastModified"].isoformat(),
+                "etag": obj.get("ETag", "").strip('"'),
+            }
+            for obj in response.get("Contents", [])
+            if not obj["Key"].startswith(THUMBNAIL_PREFIX)
+        ],
+        "next_cursor": response.get("NextContinuationToken"),
+    }
+    _listings.set(cache_key, page)
+    return page
+
+
+def invalidate_listings(bucket: str, key: str) -> None:
+    """Forget cached listings that would include key, after it has been written."""
+    _listings.invalidate(lambda cache_key: cache_key[0] == bucket and key.startswith(cache_key[1]))
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from config import render_config
+
+PRIORITIES = ("interactive", "bulk")
+# The tenant for jobs that name none (e.g. an artifact id without a "/" prefix)
+DEFAULT_TENANT = "default"
+
+
+class UnknownPriority(ValueError):
+    """A job asked for a priority class the scheduler doesn't have."""
+
+
+@dataclass
+class _Flow:
+    """One tenant's jobs of one priority class."""
+
+    weight: float
+    last_finish: float = 0.0
+    queued: int = 0
+
+
+@dataclass
+class _TenantStats:
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+
+@dataclass(order=True)
+class _Job:
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    flow_key: tuple[str, str] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of render jobs between tenants and priority classes.
+
+    At most `slots` jobs run at once. When they're all busy, waiting jobs are started in
+    order of their virtual finish time: each (tenant, priority) flow advances its own
+    clock by 1/weight per job, so a tenant with hundreds of queued bulk jobs takes turns
+    with everybody else instead of holding everyone up, and an interactive job (weight 8
+    by default, against 1 for bulk) jumps ahead of a tenant's backlog.
+
+    Per-tenant stats are kept for every tenant with queued or running jobs and for the
+    idle_tenants most recently active others.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        weights: dict[str, float] | None = None,
+        wait_samples: int = 1000,
+        idle_tenants: int = 100,
+    ):
+        self.slots = max(1, slots)
+        self.weights = weights or {"interactive": 8.0, "bulk": 1.0}
+        self.idle_tenants = idle_tenants
+        self._running = 0
+        self._virtual_time = 0.0
+        self._queue: list[_Job] = []
+        self._seq = itertools.count()
+        self._flows: dict[tuple[str, str], _Flow] = {}
+        self._tenants: dict[str, _TenantStats] = {}
+        # Recent queue waits per priority class, for percentiles
+        self._waits = {priority: deque(maxlen=wait_samples) for priority in self.weights}
+
+    @classmethod
+    def from_config(cls) -> "FairScheduler":
+        slots = render_config.scheduler_slots or render_config.workers or render_config.pool_size
+        return cls(
+            slots,
+            {"interactive": render_config.interactive_weight, "bulk": render_config.bulk_weight},
+            idle_tenants=render_config.scheduler_idle_tenants,
+        )
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, priority: str = "interactive"):
+        """Wait for this tenant's turn, then hold a render slot for the block."""
+        if priority not in self.weights:
+            raise UnknownPriority(f"Unknown priority '{priority}'; expected one of: {', '.join(self.weights)}")
+
+        flow_key = (tenant, priority)
+        flow = self._flows.get(flow_key)
+        if flow is None:
+            flow = self._flows[flow_key] = _Flow(weight=self.weights[priority])
+        # Most recently active tenants last, so that the longest idle ones are forgotten first
+        stats = self._tenants.pop(tenant, None) or _TenantStats()
+        self._tenants[tenant] = stats
+
+        # An idle flow starts at the current virtual time, so it can't bank credit while idle
+        start = max(self._virtual_time, flow.last_finish)
+        flow.last_finish = start + 1 / flow.weight
+        enqueued = time.monotonic()
+
+        if self._running < self.slots and not self._queue:
+            self._running += 1
+            self._virtual_time = start
+        else:
+            job = _Job(flow.last_finish, next(self._seq), start, flow_key, asyncio.get_running_loop().create_future())
+            heapq.heappush(self._queue, job)
+            flow.queued += 1
+            stats.queued += 1
+            try:
+                await job.future
+            except asyncio.CancelledError:
+                if job.future.done() and not job.future.cancelled():
+                    # The slot was handed over just as the wait was cancelled
+                    self._release()
+                else:
+                    flow.queued -= 1
+                    stats.queued -= 1
+                raise
+            finally:
+                self._forget_idle_flows()
+                self._forget_idle_tenants()
+
+        wait = time.monotonic() - enqueued
+        self._waits[priority].append(wait)
+        stats.wait_seconds += wait
+        stats.max_wait_seconds = max(stats.max_wait_seconds, wait)
+        stats.running += 1
+        try:
+            yield
+        finally:
+            stats.running -= 1
+            stats.completed += 1
+            self._release()
+            self._forget_idle_tenants()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "running": self._running,
+            "queued": sum(stats.queued for stats in self._tenants.values()),
+            "priorities": {priority: _wait_percentiles(waits) for priority, waits in self._waits.items()},
+            "tenants": {
+                tenant: {
+                    "queued": stats.queued,
+                    "running": stats.running,
+                    "completed": stats.completed,
+                    "wait_ms_avg": round(stats.wait_seconds / stats.completed * 1000, 1) if stats.completed else 0.0,
+                    "wait_ms_max": round(stats.max_wait_seconds * 1000, 1),
+                }
+                for tenant, stats in self._tenants.items()
+            },
+        }
+
+    def _release(self) -> None:
+        self._running -= 1
+        while self._queue and self._running < self.slots:
+            job = heapq.heappop(self._queue)
+            if job.future.cancelled():
+                continue
+            flow = self._flows[job.flow_key]
+            flow.queued -= 1
+            self._tenants[job.flow_key[0]].queued -= 1
+            self._virtual_time = job.start
+            self._running += 1
+            job.future.set_result(None)
+        self._forget_idle_flows()
+
+    def _forget_idle_flows(self) -> None:
+        # A flow whose clock is behind virtual time would restart from it anyway
+        for key, flow in list(self._flows.items()):
+            if not flow.queued and flow.last_finish <= self._virtual_time:
+                del self._flows[key]
+
+    def _forget_idle_tenants(self) -> None:
+        idle = [tenant for tenant, stats in self._tenants.items() if not stats.queued and not stats.running]
+        for tenant in idle[: max(0, len(idle) - self.idle_tenants)]:
+            del self._tenants[tenant]
+
+
+def _wait_percentiles(waits: deque) -> dict[str, float]:
+    if not waits:
+        return {"samples": 0, "wait_ms_p50": 0.0, "wait_ms_p99": 0.0}
+    ordered = sorted(waits)
+    return {
+        "samples": len(ordered),
+        "wait_ms_p50": round(ordered[len(ordered) // 2] * 1000, 1),
+        "wait_ms_p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 1),
+    }
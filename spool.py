@@ -0,0 +1,96 @@
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+from typing import IO
+
+from config import artifacts_config
+
+
+class MemoryBudget:
+    """
+    Per-request accounting for intermediate render data. Buffers (decoded PDF attachments,
+    downscaled images and the PDFs rendered for each section) are kept in memory until the
+    request's budget is used up; after that they are spooled to local disk, and the merge
+    reads them back from there. Data that has to stay in memory while it is used (data URL
+    strings, decoded image bytes, HTML sections waiting to be rendered) is counted with
+    hold(), so that buffers stored meanwhile spill to disk sooner.
+    """
+
+    def __init__(self, limit: int, spool_dir: str | None = None):
+        self.limit = limit
+        self.spool_dir = spool_dir
+        self.in_memory = 0
+        self.peak = 0
+        self.spilled = 0
+        self.spilled_buffers = 0
+        self._buffers: list[IO[bytes]] = []
+
+    @classmethod
+    def from_config(cls) -> "MemoryBudget":
+        return cls(artifacts_config.request_memory_budget, artifacts_config.spool_dir)
+
+    def store(self, data: bytes) -> IO[bytes]:
+        """A readable file holding data, in memory if it still fits the budget and on disk otherwise."""
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.limit, dir=self.spool_dir)
+        if self.in_memory + len(data) <= self.limit:
+            self.in_memory += len(data)
+            self.peak = max(self.peak, self.in_memory)
+        else:
+            buffer.rollover()
+            self.spilled += len(data)
+            self.spilled_buffers += 1
+
+        buffer.write(data)
+        buffer.seek(0)
+        self._buffers.append(buffer)
+        return buffer
+
+    @contextmanager
+    def hold(self, size: int):
+        """Count size bytes held in memory against the budget for the duration of the block."""
+        self.in_memory += size
+        self.peak = max(self.peak, self.in_memory)
+        try:
+            yield
+        finally:
+            self.in_memory -= size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "limit": self.limit,
+            "peak": self.peak,
+            "spilled": self.spilled,
+            "spilled_buffers": self.spilled_buffers,
+        }
+
+    def header_value(self) -> str:
+        """The stats as an X-Artifact-Memory response header, e.g. "limit=67108864, peak=1024, ..."."""
+        return ", ".join(f"{key}={value}" for key, value in self.stats().items())
+
+    def close(self) -> None:
+        for buffer in self._buffers:
+            buffer.close()
+        self._buffers.clear()
+        self.in_memory = 0
+
+
+def as_stream(content: bytes | IO[bytes]) -> IO[bytes]:
+    """A readable stream for a section, e.g. for PdfReader."""
+    return BytesIO(content) if isinstance(content, bytes) else content
+
+
+def read_buffer(content: bytes | IO[bytes]) -> bytes:
+    """The bytes of a section: either bytes already or a buffer from MemoryBudget.store."""
+    if isinstance(content, bytes):
+        return content
+    content.seek(0)
+    return content.read()
+
+
+def buffer_size(content: bytes | IO[bytes]) -> int:
+    if isinstance(content, bytes):
+        return len(content)
+    position = content.tell()
+    size = content.seek(0, 2)
+    content.seek(position)
+    return size
@@ -7,6 +7,13 @@ os.environ.setdefault("S3_REGION", "us-east-1")
 os.environ.setdefault("S3_ENDPOINT_URL", "http://localhost:9000")
 os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
 os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+# The test client runs the ASGI lifespan for every request; don't launch Chromium each time.
+os.environ.setdefault("CONNECTOR_WARMUP", "false")
+# Renders are mocked, so cached PDFs would only leak between tests
+os.environ.setdefault("RENDER_CACHE_ENABLED", "false")
+# The test client disconnects as soon as it has sent a request, which would cancel every render;
+# tests/test_deadline.py turns it back on to check cancellation with a client that really goes away
+os.environ.setdefault("ARTIFACT_CANCEL_ON_DISCONNECT", "false")
 
 from unittest.mock import patch
 
@@ -15,6 +22,7 @@ from falcon import testing
 from jinja2 import Environment, FileSystemLoader
 from pyfakefs.fake_filesystem_unittest import Patcher
 
+from artifacts import RenderedPdf
 from main import app, artifacts
 
 
@@ -87,7 +95,7 @@ def mock_artifacts_generate_pdf_with_attachments():
     A fixture for mocking artifacts._generate_pdf_with_attachments
     """
     with patch.object(artifacts, "_generate_pdf_with_attachments") as mock:
-        mock.return_value = b"fake_pdf_content"  # default, override in test if needed
+        mock.return_value = RenderedPdf(b"fake_pdf_content", 1)  # default, override in test if needed
         yield mock
 
 
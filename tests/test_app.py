@@ -1,5 +1,15 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
+
 from falcon import testing
 
+from warmup import Warmup
+
 
 class TestFalconApp:
     def test_liveness_endpoint(self, client: testing.TestClient):
@@ -32,3 +42,92 @@ class TestFalconApp:
         result = client.simulate_options("/liveness")
         # CORS should be handled by Falcon's built-in CORS support
         assert result.status_code in [200, 204]
+
+    def test_readiness_endpoint_without_warmup(self, client: testing.TestClient):
+        """With warm-up disabled everything loads lazily, so the app is ready immediately"""
+        result = client.simulate_get("/readiness")
+        assert result.status_code == 200
+        assert result.json["status"] == "ready"
+        assert result.json["renderer"] == {"running": False}
+
+    def test_readiness_endpoint_reports_failed_warmup(self, client: testing.TestClient):
+        degraded = Warmup(MagicMock())
+        degraded.artifacts.renderer.is_running = False
+        degraded.artifacts.render_pool = None
+        degraded.status = "degraded"
+        degraded.checks = {"storage": {"ok": False, "error": "bucket not found", "duration_ms": 1.0}}
+        degraded._last_run = time.monotonic()
+
+        with patch("main.warmup", degraded):
+            result = client.simulate_get("/readiness")
+
+        assert result.status_code == 503
+        assert result.json["checks"]["storage"]["error"] == "bucket not found"
+
+
+class TestWarmup:
+    def test_warmup_runs_every_step(self):
+        warmup = Warmup(MagicMock())
+        steps = {"templates": AsyncMock(), "storage": AsyncMock(), "renderer": AsyncMock()}
+
+        with patch.object(Warmup, "steps", steps):
+            asyncio.run(warmup.run())
+
+        assert warmup.status == "ready"
+        assert set(warmup.checks) == {"templates", "storage", "renderer"}
+        assert all(step.await_count == 1 for step in steps.values())
+
+    def test_warmup_retries_only_failed_steps(self):
+        warmup = Warmup(MagicMock())
+        steps = {
+            "templates": AsyncMock(),
+            "storage": AsyncMock(side_effect=[RuntimeError("no bucket"), None]),
+            "renderer": AsyncMock(),
+        }
+
+        with patch.object(Warmup, "steps", steps):
+            asyncio.run(warmup.run())
+            assert warmup.status == "degraded"
+            assert warmup.checks["storage"] == {"ok": False, "error": "no bucket", "duration_ms": ANY}
+
+            asyncio.run(warmup.run(only=["storage"]))
+
+        assert warmup.status == "ready"
+        assert steps["templates"].await_count == 1
+        assert steps["storage"].await_count == 2
+
+    def test_templates_step_compiles_templates(self, mock_artifacts_env):
+        asyncio.run(Warmup(mock_artifacts_env)._warm_templates())
+
+        assert "base-styles.css" in mock_artifacts_env.static_assets()
+
+
+class TestConnectorFamilies:
+    def test_http_only_instance_skips_artifacts(self):
+        """An HTTP-only instance starts without S3 settings and never imports the heavy artifact dependencies"""
+        env = {k: v for k, v in os.environ.items() if not k.startswith(("S3_", "AWS_"))}
+        env["CONNECTOR_FAMILIES"] = "http"
+        probe = (
+            "import json, sys\n"
+            "from falcon import testing\n"
+            "import main\n"
+            "client = testing.TestClient(main.app)\n"
+            "ids = [c['id'] for c in client.simulate_get('/v1/commands').json]\n"
+            "heavy = [m for m in ('artifacts', 'boto3', 'playwright', 'pypdf') if m in sys.modules]\n"
+            "status = client.simulate_post('/v1/do/artifacts/GenerateArtifact', json={}).status_code\n"
+            "print(json.dumps({'ids': ids, 'heavy': heavy, 'status': status}))\n"
+        )
+
+        output = subprocess.run(
+            [sys.executable, "-c", probe],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        assert result["heavy"] == []
+        assert result["status"] == 404
+        assert result["ids"] and all(command_id.startswith("http/") for command_id in result["ids"])
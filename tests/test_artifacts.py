@@ -1,5 +1,21 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import html
+import io
 import json
-from unittest.mock import patch
+import sys
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+
+from artifacts import RenderedPdf, RenderOptions
+from attachments import UploadedAttachment
+from main import artifacts
+from spool import MemoryBudget
 
 API_ENDPOINT = "/v1/do/artifacts/"
 
@@ -34,7 +50,7 @@ class TestArtifactsService:
             "storage": "s3",
         }
 
-        mock_artifacts_generate_pdf_with_attachments.return_value = b"fake_pdf_content"
+        mock_artifacts_generate_pdf_with_attachments.return_value = RenderedPdf(b"fake_pdf_content", 1)
         result = client.simulate_post(f"{API_ENDPOINT}GenerateArtifact", json=test_data)
 
         # assert command returns valid status & response
@@ -80,7 +96,7 @@ class TestArtifactsService:
             "storage": "s3",
         }
 
-        mock_artifacts_generate_pdf_with_attachments.return_value = b"fake_pdf_content"
+        mock_artifacts_generate_pdf_with_attachments.return_value = RenderedPdf(b"fake_pdf_content", 1)
         mock_artifacts_generate_response_mock.return_value = {
             "private_link": "s3://test-bucket/invoice-123",
             "presigned_link": "https://example.com/presigned-url",
@@ -166,7 +182,7 @@ class TestBLMSpecificFlows:
             "storage": "s3",
         }
 
-        mock_artifacts_generate_pdf_with_attachments.return_value = b"fake_pdf_content"
+        mock_artifacts_generate_pdf_with_attachments.return_value = RenderedPdf(b"fake_pdf_content", 1)
         result = client.simulate_post(f"{API_ENDPOINT}GenerateArtifact", json=test_data)
 
         # assert command returns valid status & response
@@ -185,3 +201,387 @@ class TestBLMSpecificFlows:
             ]:
                 assert f"{item}_val" in html_content
         assert "2023-09-29" in html_content
+
+
+class TestHtmlPreview:
+    preview_data = {
+        "template": "test-template.html",
+        "data": {
+            "name": "John Doe",
+            "email": "john@example.com",
+            "exclusionsText": "Fake NEPA Compliance Text",
+            "approvers": [{"name": "Approver 1", "date": "2023-09-29"}],
+            "responsibleOfficial": "responsibleOfficial_val",
+        },
+    }
+
+    def test_generate_html_preview_returns_etag(self, client, mock_artifacts_env):
+        mock_artifacts_env.preview_cache.clear()
+        result = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=self.preview_data)
+
+        body = result.json["command_response"]["body"]
+        assert result.json["command_response"]["http_status"] == 200
+        assert body["etag"]
+        assert result.headers["ETag"] == f'"{body["etag"]}"'
+        assert "John Doe" in base64.b64decode(html.unescape(body["previewData"])).decode()
+
+    def test_generate_html_preview_is_cached(self, client, mock_artifacts_env):
+        mock_artifacts_env.preview_cache.clear()
+        first = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=self.preview_data)
+
+        with patch.object(mock_artifacts_env, "_render_template_html") as mock_render:
+            second = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=self.preview_data)
+
+        mock_render.assert_not_called()
+        assert second.json["command_response"]["body"] == first.json["command_response"]["body"]
+
+    def test_generate_html_preview_not_modified(self, client, mock_artifacts_env):
+        first = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=self.preview_data)
+        etag = first.json["command_response"]["body"]["etag"]
+
+        by_header = client.simulate_post(
+            f"{API_ENDPOINT}GenerateHtmlPreview", json=self.preview_data, headers={"If-None-Match": f'"{etag}"'}
+        )
+        by_param = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json={**self.preview_data, "etag": etag})
+
+        for result in (by_header, by_param):
+            assert result.json["command_response"]["http_status"] == 304
+            assert result.json["command_response"]["body"] == {"etag": etag, "notModified": True}
+
+    def test_generate_html_preview_etag_changes_with_data(self, client, mock_artifacts_env):
+        first = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=self.preview_data)
+        changed = {**self.preview_data, "data": {**self.preview_data["data"], "name": "Jane Doe"}}
+        second = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=changed)
+
+        assert first.json["command_response"]["body"]["etag"] != second.json["command_response"]["body"]["etag"]
+
+    def test_generate_html_preview_linked_mode_is_smaller(self, client, mock_artifacts_env):
+        blm_data = {**self.preview_data, "template": "blm-ce.html"}
+        inline = client.simulate_post(f"{API_ENDPOINT}GenerateHtmlPreview", json=blm_data)
+        linked = client.simulate_post(
+            f"{API_ENDPOINT}GenerateHtmlPreview", json={**blm_data, "preview_mode": "linked", "compress": True}
+        )
+
+        inline_body = inline.json["command_response"]["body"]
+        linked_body = linked.json["command_response"]["body"]
+        assert linked_body["previewEncoding"] == "gzip"
+        assert len(linked_body["previewData"]) * 10 < len(inline_body["previewData"])
+
+        linked_html = gzip.decompress(base64.b64decode(html.unescape(linked_body["previewData"]))).decode()
+        assert "/static/base-styles.css" in linked_html
+        assert "/static/blm_logo.svg" in linked_html
+        assert "<svg" not in linked_html
+
+    def test_templates_version_is_checked_at_most_once_per_interval(self, mock_artifacts_env):
+        mock_artifacts_env._templates_version_cache = None
+        version = mock_artifacts_env._templates_version()
+
+        with patch("artifacts.os.walk") as mock_walk:
+            assert mock_artifacts_env._templates_version() == version
+        mock_walk.assert_not_called()
+
+        with patch("artifacts.artifacts_config.templates_check_interval", 0):
+            assert mock_artifacts_env._templates_version() == version
+
+    def test_generate_html_preview_rejects_unknown_mode(self, client, mock_artifacts_env):
+        result = client.simulate_post(
+            f"{API_ENDPOINT}GenerateHtmlPreview", json={**self.preview_data, "preview_mode": "bogus"}
+        )
+
+        assert result.json["command_response"]["http_status"] == 500
+        assert "preview_mode" in result.json["error"]
+
+
+class TestStaticAssets:
+    def test_static_asset_is_served_with_cache_headers(self, client, mock_artifacts_env):
+        result = client.simulate_get("/static/base-styles.css")
+
+        assert result.status_code == 200
+        assert result.headers["Content-Type"].startswith("text/css")
+        assert "immutable" in result.headers["Cache-Control"]
+        assert "<style>" not in result.text
+        assert "list-upper-alpha" in result.text
+
+        cached = client.simulate_get("/static/base-styles.css", headers={"If-None-Match": result.headers["ETag"]})
+        assert cached.status_code == 304
+
+    def test_static_asset_revalidates_against_any_matching_etag(self, client, mock_artifacts_env):
+        etag = client.simulate_get("/static/base-styles.css").headers["ETag"]
+
+        for if_none_match in (f'"other", {etag}', f"W/{etag}", "*"):
+            result = client.simulate_get("/static/base-styles.css", headers={"If-None-Match": if_none_match})
+            assert result.status_code == 304
+
+    def test_unknown_static_asset(self, client, mock_artifacts_env):
+        result = client.simulate_get("/static/nope.css")
+
+        assert result.status_code == 404
+
+
+class TestAttachmentLoading:
+    def test_load_data_url_attachment(self):
+        data_url = "data:image/png;base64," + base64.b64encode(b"png-bytes").decode()
+
+        assert artifacts._load_attachment(data_url) == ("image/png", b"png-bytes")
+        assert artifacts._to_data_url(data_url, "image/png", b"png-bytes") == data_url
+
+    def test_load_uploaded_attachment(self):
+        upload = UploadedAttachment("image/jpeg", "photo.jpg", io.BytesIO(b"jpeg-bytes"))
+
+        assert artifacts._load_attachment(upload) == ("image/jpeg", b"jpeg-bytes")
+        assert artifacts._to_data_url(upload, "image/jpeg", b"jpeg-bytes") == (
+            "data:image/jpeg;base64," + base64.b64encode(b"jpeg-bytes").decode()
+        )
+
+
+def _pdf_with_content(content: bytes, pages: int = 1) -> bytes:
+    writer = PdfWriter()
+    for _ in range(pages):
+        page = writer.add_blank_page(612, 792)
+        stream = DecodedStreamObject()
+        stream.set_data(content)
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _png(width: int, height: int) -> bytes:
+    # Pillow comes with the optional "images" extra, so tests that need it skip without it
+    Image = pytest.importorskip("PIL.Image")
+
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="PNG")
+    return output.getvalue()
+
+
+class TestUploadMetadata:
+    @patch("artifacts.create_s3_client")
+    @patch("artifacts.get_bucket_for_storage", return_value="test-bucket")
+    def test_generated_artifacts_carry_cache_and_content_metadata(
+        self, _, mock_create_s3_client, client, mock_artifacts_env, mock_artifacts_generate_pdf_with_attachments
+    ):
+        mock_artifacts_generate_pdf_with_attachments.return_value = RenderedPdf(b"%PDF-content", 1)
+
+        client.simulate_post(
+            f"{API_ENDPOINT}GenerateArtifact",
+            json={
+                "id": "proj/doc.pdf",
+                "template": "test-template.html",
+                "data": {
+                    "exclusionsText": "",
+                    "lupDecisions": "",
+                    "approvers": [{"date": ""}],
+                    "responsibleOfficial": "",
+                },
+            },
+        )
+
+        upload = mock_create_s3_client.return_value.put_object.call_args.kwargs
+        assert upload["Key"] == "proj/doc.pdf"
+        assert upload["Body"].read() == b"%PDF-content"
+        assert upload["ContentType"] == "application/pdf"
+        assert upload["CacheControl"] == "private, no-cache"
+        assert upload["Metadata"]["sha256"] == hashlib.sha256(b"%PDF-content").hexdigest()
+        assert upload["Metadata"]["generator"] == "spiffworkflow-connector"
+        assert upload["Metadata"]["template"] == "test-template.html"
+        assert "generated-at" in upload["Metadata"]
+
+
+class TestThumbnails:
+    def test_thumbnail_parameter(self):
+        assert RenderOptions.from_params({}).thumbnail is None
+        assert RenderOptions.from_params({"thumbnail": False}).thumbnail is None
+        assert RenderOptions.from_params({"thumbnail": True}).thumbnail == "png"
+        assert RenderOptions.from_params({"thumbnail": "WebP"}).thumbnail == "webp"
+        with pytest.raises(ValueError, match="gif"):
+            RenderOptions.from_params({"thumbnail": "gif"})
+
+    @pytest.mark.parametrize("path", ["/api/artifacts/GenerateArtifact", f"{API_ENDPOINT}GenerateArtifact"])
+    def test_unknown_thumbnail_format_is_a_bad_request(self, client, path):
+        result = client.simulate_post(
+            path, json={"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}, "thumbnail": "gif"}
+        )
+
+        assert 400 in (result.status_code, result.json.get("command_response", {}).get("http_status"))
+        assert "gif" in json.dumps(result.json)
+
+    def test_render_thumbnail_scales_the_first_page(self):
+        Image = pytest.importorskip("PIL.Image")
+
+        page = MagicMock(
+            set_viewport_size=AsyncMock(),
+            emulate_media=AsyncMock(),
+            set_content=AsyncMock(),
+            screenshot=AsyncMock(return_value=_png(816, 1056)),
+        )
+        page_context = MagicMock(__aenter__=AsyncMock(return_value=page), __aexit__=AsyncMock(return_value=False))
+
+        with patch.object(artifacts.renderer, "page", return_value=page_context):
+            content_type, image = asyncio.run(artifacts._render_thumbnail("<html></html>", "webp"))
+
+        assert content_type == "image/webp"
+        with Image.open(io.BytesIO(image)) as thumbnail:
+            assert thumbnail.format == "WEBP"
+            assert thumbnail.size == (320, 414)
+        page.set_viewport_size.assert_awaited_once_with({"width": 816, "height": 1056})
+
+    def test_thumbnail_is_taken_from_the_page_the_pdf_is_printed_from(self):
+        page = MagicMock(
+            set_viewport_size=AsyncMock(),
+            emulate_media=AsyncMock(),
+            set_content=AsyncMock(),
+            pdf=AsyncMock(return_value=_pdf_with_content(b"", pages=2)),
+            screenshot=AsyncMock(return_value=_png(816, 1056)),
+        )
+        page_context = MagicMock(__aenter__=AsyncMock(return_value=page), __aexit__=AsyncMock(return_value=False))
+        sections = [("html", "<html>document</html>"), ("html", "<html>cover</html>")]
+
+        with patch.object(artifacts.renderer, "page", return_value=page_context) as new_page:
+            rendered = asyncio.run(
+                artifacts._render_sections(sections, RenderOptions(thumbnail="png"), MemoryBudget(1024 * 1024))
+            )
+
+        # One page per section, and the document is loaded only once
+        assert new_page.call_count == 2
+        assert page.screenshot.await_count == 1
+        assert rendered.page_count == 4
+        assert rendered.thumbnail[0] == "image/png"
+
+    @patch("artifacts.generate_presigned_url", return_value="https://s3.example.com/presigned")
+    @patch("artifacts.create_s3_client")
+    @patch("artifacts.get_bucket_for_storage", return_value="test-bucket")
+    def test_generate_artifact_with_thumbnail(
+        self,
+        _,
+        mock_create_s3_client,
+        _presign,
+        client,
+        mock_artifacts_env,
+        mock_artifacts_generate_pdf_with_attachments,
+    ):
+        mock_artifacts_generate_pdf_with_attachments.return_value = RenderedPdf(
+            _pdf_with_content(b"", pages=3), 3, ("image/png", b"png-bytes")
+        )
+        s3_client = mock_create_s3_client.return_value
+
+        result = client.simulate_post(
+            f"{API_ENDPOINT}GenerateArtifact",
+            json={
+                "id": "proj/doc.pdf",
+                "template": "test-template.html",
+                "data": {
+                    "name": "John Doe",
+                    "exclusionsText": "",
+                    "lupDecisions": "",
+                    "approvers": [{"name": "Approver 1", "date": "2023-09-29"}],
+                    "responsibleOfficial": "",
+                },
+                "generate_links": True,
+                "thumbnail": True,
+            },
+        )
+
+        body = result.json["command_response"]["body"]
+        assert body["page_count"] == 3
+        assert body["thumbnail_private_link"] == "s3://test-bucket/_thumbnails/proj/doc.pdf.png"
+        assert body["thumbnail_presigned_link"] == "https://s3.example.com/presigned"
+        pdf_upload, thumbnail_upload = (call.kwargs for call in s3_client.put_object.call_args_list)
+        assert pdf_upload["Metadata"]["page-count"] == "3"
+        assert thumbnail_upload["Key"] == "_thumbnails/proj/doc.pdf.png"
+        assert thumbnail_upload["Body"] == b"png-bytes"
+        assert thumbnail_upload["ContentType"] == "image/png"
+        assert thumbnail_upload["Metadata"]["page-count"] == "3"
+        assert thumbnail_upload["Metadata"]["sha256"] == hashlib.sha256(b"png-bytes").hexdigest()
+
+
+class TestMergePdfs:
+    content = b"BT /F1 12 Tf 72 712 Td (Same content on every page) Tj ET\n" * 200
+
+    def test_merge_keeps_every_page(self):
+        merged, page_count = artifacts._merge_pdfs(
+            [_pdf_with_content(self.content, 2), _pdf_with_content(self.content)]
+        )
+
+        assert len(PdfReader(io.BytesIO(merged)).pages) == page_count == 3
+
+    def test_optimized_merge_is_smaller(self):
+        inputs = [_pdf_with_content(self.content) for _ in range(4)]
+
+        plain, _ = artifacts._merge_pdfs(inputs)
+        optimized, _ = artifacts._merge_pdfs(inputs, optimize=True)
+
+        assert len(PdfReader(io.BytesIO(optimized)).pages) == 4
+        assert len(optimized) < len(plain) / 4
+
+    def test_linearize_without_pikepdf_returns_merged_pdf(self):
+        with patch.dict(sys.modules, {"pikepdf": None}):
+            merged, _ = artifacts._merge_pdfs([_pdf_with_content(self.content)], linearize=True)
+
+        assert len(PdfReader(io.BytesIO(merged)).pages) == 1
+
+
+class TestSinglePassRendering:
+    def _sections(self):
+        pdf_attachment = _pdf_with_content(b"BT ET", pages=2)
+        return [
+            ("html", "<html><head><title>Main</title><style>.a{}</style></head><body>main</body></html>"),
+            ("html", "<html><head><title>Cover 1</title><style>.a{}</style></head><body>cover 1</body></html>"),
+            ("html", "<html><head><style>.b{}</style></head><body>image</body></html>"),
+            ("html", "<html><head><style>.a{}</style></head><body>cover 2</body></html>"),
+            ("pdf", pdf_attachment),
+            ("html", "<html><head><style>.a{}</style></head><body>cover 3</body></html>"),
+        ], pdf_attachment
+
+    def test_build_sections_numbers_cover_pages(self, mock_artifacts_env):
+        pdf_data_url = "data:application/pdf;base64," + base64.b64encode(b"%PDF-fake").decode()
+        sections = list(
+            mock_artifacts_env._iter_sections(
+                "<html>main</html>", ["<html>associated</html>"], [pdf_data_url], MemoryBudget(1024)
+            )
+        )
+
+        assert [kind for kind, _ in sections] == ["html", "html", "html", "html", "pdf"]
+        assert "Attachment #1" in sections[1][1]
+        assert "Attachment #2" in sections[3][1]
+        assert sections[4][1].read() == b"%PDF-fake"
+
+    def test_attachments_are_decoded_as_their_sections_are_reached(self, mock_artifacts_env):
+        pdf_data_url = "data:application/pdf;base64," + base64.b64encode(b"%PDF-fake").decode()
+        with patch.object(mock_artifacts_env, "_load_attachment", wraps=mock_artifacts_env._load_attachment) as load:
+            sections = mock_artifacts_env._iter_sections(
+                "<html>main</html>", [], [pdf_data_url] * 2, MemoryBudget(1024)
+            )
+            assert next(sections) == ("html", "<html>main</html>")
+            load.assert_not_called()
+
+            assert [kind for kind, _ in sections] == ["html", "pdf", "html", "pdf"]
+            assert load.call_count == 2
+
+    def test_single_pass_renders_one_document_per_html_run(self):
+        sections, pdf_attachment = self._sections()
+        rendered = []
+
+        async def fake_html_to_pdf(html_content):
+            rendered.append(html_content)
+            return _pdf_with_content(b"BT ET")
+
+        with patch.object(artifacts, "_html_to_pdf", side_effect=fake_html_to_pdf):
+            pdfs, _ = asyncio.run(artifacts._render_sections_single_pass(sections, MemoryBudget(1024 * 1024)))
+
+        assert len(rendered) == 2
+        assert len(pdfs) == 3
+        assert pdfs[1] == pdf_attachment
+        assert all(body in rendered[0] for body in ("main", "cover 1", "image", "cover 2"))
+        assert "cover 3" in rendered[1]
+
+    def test_combine_html_documents_deduplicates_heads(self):
+        sections, _ = self._sections()
+        combined = artifacts._combine_html_documents([content for kind, content in sections[:4]])
+
+        assert combined.count("<style>.a{}</style>") == 1
+        assert combined.count("<style>.b{}</style>") == 1
+        assert combined.count('class="render-section"') == 4
+        assert combined.count("<title>") == 1
+        assert "<title>Main</title>" in combined
+        assert "break-after: page" in combined
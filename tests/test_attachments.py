@@ -0,0 +1,144 @@
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from botocore.exceptions import ClientError
+
+from attachments import AttachmentFetcher, AttachmentTooLarge, UploadedAttachment
+
+
+def _s3_object(body: bytes, content_type: str = "image/png", etag: str = '"abc"') -> dict:
+    stream = MagicMock()
+    stream.iter_chunks.return_value = [body]
+    return {"Body": stream, "ContentLength": len(body), "ContentType": content_type, "ETag": etag}
+
+
+class TestAttachmentFetcher:
+    @pytest.fixture(autouse=True)
+    def allowed_hosts(self):
+        with patch("attachments.artifacts_config.attachment_fetch_allowed_hosts", ["example.com"]):
+            yield
+
+    def test_non_references_are_passed_through(self):
+        data_url = "data:image/png;base64,AAAA"
+        resolved = asyncio.run(AttachmentFetcher().resolve([data_url]))
+
+        assert resolved == [data_url]
+
+    @patch("attachments.create_s3_client")
+    def test_fetch_s3_reference(self, mock_create_s3):
+        mock_s3 = MagicMock()
+        mock_s3.get_object.return_value = _s3_object(b"png-bytes")
+        mock_create_s3.return_value = mock_s3
+
+        [attachment] = asyncio.run(AttachmentFetcher().resolve(["s3://test-bucket/proj/photo.png"]))
+
+        assert isinstance(attachment, UploadedAttachment)
+        assert attachment.content_type == "image/png"
+        assert attachment.filename == "photo.png"
+        assert attachment.read() == b"png-bytes"
+        mock_create_s3.assert_called_once_with(None)
+        mock_s3.get_object.assert_called_once_with(Bucket="test-bucket", Key="proj/photo.png")
+
+    def test_fetch_https_references_in_order(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=request.url.path.encode(), headers={"Content-Type": "application/pdf"})
+
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        resolved = asyncio.run(
+            AttachmentFetcher(http_client).resolve(["https://example.com/a.pdf", "https://example.com/b.pdf"])
+        )
+
+        assert [(a.content_type, a.read()) for a in resolved] == [
+            ("application/pdf", b"/a.pdf"),
+            ("application/pdf", b"/b.pdf"),
+        ]
+
+    def test_fetch_https_too_large(self):
+        http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"x" * 32))
+        )
+
+        with patch("attachments.artifacts_config.attachment_max_bytes", 16), pytest.raises(AttachmentTooLarge):
+            asyncio.run(AttachmentFetcher(http_client).resolve(["https://example.com/big.pdf"]))
+
+    def test_fetch_https_disallowed_host(self):
+        with pytest.raises(ValueError, match="not allowed"):
+            asyncio.run(AttachmentFetcher(httpx.AsyncClient()).resolve(["https://evil.example.com/a.pdf"]))
+
+    def test_fetch_https_denied_without_allowed_hosts(self):
+        with (
+            patch("attachments.artifacts_config.attachment_fetch_allowed_hosts", []),
+            pytest.raises(ValueError, match="not allowed"),
+        ):
+            asyncio.run(AttachmentFetcher(httpx.AsyncClient()).resolve(["https://example.com/a.pdf"]))
+
+    @patch("attachments.create_s3_client")
+    def test_fetch_s3_only_from_allowed_buckets(self, mock_create_s3):
+        with pytest.raises(ValueError, match="not allowed"):
+            asyncio.run(AttachmentFetcher().resolve(["s3://other-bucket/secret.pdf"]))
+        mock_create_s3.assert_not_called()
+
+        mock_create_s3.return_value.get_object.return_value = _s3_object(b"png-bytes")
+        with patch("attachments.artifacts_config.attachment_fetch_allowed_buckets", ["other-bucket"]):
+            [attachment] = asyncio.run(AttachmentFetcher().resolve(["s3://other-bucket/photo.png"]))
+
+        assert attachment.read() == b"png-bytes"
+        mock_create_s3.assert_called_once_with("s3://other-bucket")
+
+    def test_fetch_https_uses_etag_cache(self, tmp_path):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, content=b"%PDF", headers={"Content-Type": "application/pdf", "ETag": '"v1"'})
+
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch("attachments.artifacts_config.attachment_cache_dir", str(tmp_path)):
+            fetcher = AttachmentFetcher(http_client)
+            [first] = asyncio.run(fetcher.resolve(["https://example.com/a.pdf"]))
+            [second] = asyncio.run(fetcher.resolve(["https://example.com/a.pdf"]))
+
+        assert first.read() == second.read() == b"%PDF"
+        assert second.content_type == "application/pdf"
+        assert [r.headers.get("If-None-Match") for r in requests] == [None, '"v1"']
+
+    @patch("attachments.create_s3_client")
+    def test_fetch_s3_uses_etag_cache(self, mock_create_s3, tmp_path):
+        mock_s3 = MagicMock()
+        mock_s3.get_object.side_effect = [
+            _s3_object(b"png-bytes"),
+            ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"),
+        ]
+        mock_create_s3.return_value = mock_s3
+
+        with patch("attachments.artifacts_config.attachment_cache_dir", str(tmp_path)):
+            fetcher = AttachmentFetcher()
+            asyncio.run(fetcher.resolve(["s3://test-bucket/photo.png"]))
+            [cached] = asyncio.run(fetcher.resolve(["s3://test-bucket/photo.png"]))
+
+        assert cached.read() == b"png-bytes"
+        assert mock_s3.get_object.call_args.kwargs["IfNoneMatch"] == '"abc"'
+
+    def test_cache_is_trimmed_least_recently_used_first(self, tmp_path):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=b"x" * 100, headers={"ETag": '"v1"'})
+
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with (
+            patch("attachments.artifacts_config.attachment_cache_dir", str(tmp_path)),
+            patch("attachments.artifacts_config.attachment_cache_max_bytes", 150),
+        ):
+            fetcher = AttachmentFetcher(http_client)
+            for name in ("a", "b", "c"):
+                asyncio.run(fetcher.resolve([f"https://example.com/{name}.pdf"]))
+                time.sleep(0.01)
+
+            assert fetcher._cache_lookup("https://example.com/a.pdf") is None
+            assert fetcher._cache_lookup("https://example.com/b.pdf") is None
+            assert fetcher._cache_lookup("https://example.com/c.pdf")["etag"] == '"v1"'
+        assert len(list(tmp_path.glob("*.bin"))) == len(list(tmp_path.glob("*.json"))) == 1
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import capacity
+from renderer import HostRenderBudget
+
+GiB = 1024**3
+
+
+class TestAvailableResources:
+    def test_available_cpus_reads_cgroup_v2_quota(self, tmp_path):
+        (tmp_path / "cpu.max").write_text("150000 100000\n")
+        assert capacity.available_cpus(str(tmp_path)) == min(1.5, capacity.available_cpus(str(tmp_path / "missing")))
+
+    def test_available_cpus_without_quota(self, tmp_path):
+        (tmp_path / "cpu.max").write_text("max 100000\n")
+        assert capacity.available_cpus(str(tmp_path)) == capacity.available_cpus(str(tmp_path / "missing"))
+
+    def test_available_cpus_reads_cgroup_v1_quota(self, tmp_path):
+        (tmp_path / "cpu").mkdir()
+        (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("100000\n")
+        (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+        assert capacity.available_cpus(str(tmp_path)) == 1.0
+
+    def test_available_memory_reads_cgroup_limit(self, tmp_path):
+        (tmp_path / "memory.max").write_text(f"{GiB}\n")
+        assert capacity.available_memory(str(tmp_path)) == GiB
+
+    def test_available_memory_ignores_unlimited(self, tmp_path):
+        (tmp_path / "memory.max").write_text("max\n")
+        assert capacity.available_memory(str(tmp_path)) == capacity.available_memory(str(tmp_path / "missing"))
+
+
+class TestPlan:
+    def test_plan_is_bounded_by_cpus(self):
+        assert capacity.plan(4, 64 * GiB) == {"CONNECTOR_WORKERS": 4, "RENDER_POOL_SIZE": 1, "RENDER_BUDGET": 4}
+
+    def test_plan_is_bounded_by_memory(self):
+        # 2 GiB fits two workers (256 MiB each) and three renders (512 MiB each)
+        assert capacity.plan(8, 2 * GiB) == {"CONNECTOR_WORKERS": 2, "RENDER_POOL_SIZE": 2, "RENDER_BUDGET": 3}
+
+    def test_plan_always_runs_something(self):
+        assert capacity.plan(0.5, 256 * 1024**2) == {"CONNECTOR_WORKERS": 1, "RENDER_POOL_SIZE": 1, "RENDER_BUDGET": 1}
+
+
+class TestHostRenderBudget:
+    @pytest.mark.asyncio
+    async def test_render_budget_is_shared_across_holders(self, tmp_path):
+        # Separate instances stand in for separate worker processes: flock() locks
+        # conflict between independently opened files even within one process
+        first = HostRenderBudget(1, str(tmp_path), poll_interval=0.01)
+        second = HostRenderBudget(1, str(tmp_path), poll_interval=0.01)
+        events = []
+
+        async def render(budget, name, hold):
+            async with budget.slot():
+                events.append(f"{name} start")
+                await asyncio.sleep(hold)
+                events.append(f"{name} end")
+
+        await asyncio.gather(render(first, "a", 0.1), render(second, "b", 0))
+
+        assert events == ["a start", "a end", "b start", "b end"]
+
+    @pytest.mark.asyncio
+    async def test_render_budget_allows_up_to_slots(self, tmp_path):
+        budget = HostRenderBudget(2, str(tmp_path), poll_interval=0.01)
+        running = 0
+        peak = 0
+
+        async def render():
+            nonlocal running, peak
+            async with budget.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.05)
+                running -= 1
+
+        await asyncio.gather(*(render() for _ in range(5)))
+
+        assert peak == 2
@@ -0,0 +1,97 @@
+import asyncio
+import gzip
+from unittest.mock import MagicMock, patch
+
+import pytest
+from falcon import testing
+
+from artifacts import _etag_matches
+from compression import COMPRESSORS, _immutable_bodies, decoded_etag, encoded_etag, negotiate_encoding
+from config import compression_config
+
+
+class TestNegotiateEncoding:
+    def test_no_header(self):
+        assert negotiate_encoding(None) is None
+
+    def test_gzip(self):
+        assert negotiate_encoding("gzip, deflate") == "gzip"
+
+    def test_rejected_by_q_value(self):
+        assert negotiate_encoding("gzip;q=0, identity") is None
+
+    def test_wildcard(self):
+        assert negotiate_encoding("*") is not None
+
+
+class TestCompressionMiddleware:
+    @pytest.fixture(autouse=True)
+    def _forget_compressed_bodies(self):
+        _immutable_bodies.clear()
+
+    def test_large_response_is_compressed(self, client: testing.TestClient, mock_artifacts_env):
+        result = client.simulate_get("/static/tailwind.js", headers={"Accept-Encoding": "gzip"})
+
+        assert result.status_code == 200
+        assert result.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in result.headers["Vary"]
+        assert b"tailwindcss" in gzip.decompress(result.content)
+
+    def test_response_without_accept_encoding_is_not_compressed(self, client: testing.TestClient, mock_artifacts_env):
+        result = client.simulate_get("/static/tailwind.js")
+
+        assert result.status_code == 200
+        assert "Content-Encoding" not in result.headers
+        assert "tailwindcss" in result.text
+
+    def test_small_response_is_not_compressed(self, client: testing.TestClient):
+        result = client.simulate_get("/liveness", headers={"Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in result.headers
+        assert result.json == {"status": "ok"}
+
+    def test_large_response_is_compressed_off_the_event_loop(self, client: testing.TestClient, mock_artifacts_env):
+        with (
+            patch.object(compression_config, "thread_threshold", 0),
+            patch("compression.asyncio.to_thread", wraps=asyncio.to_thread) as mock_to_thread,
+        ):
+            result = client.simulate_get("/static/tailwind.js", headers={"Accept-Encoding": "gzip"})
+
+        assert result.headers["Content-Encoding"] == "gzip"
+        mock_to_thread.assert_called_once()
+
+    def test_compressed_response_gets_its_own_etag(self, client: testing.TestClient, mock_artifacts_env):
+        identity = client.simulate_get("/static/tailwind.js")
+        compressed = client.simulate_get("/static/tailwind.js", headers={"Accept-Encoding": "gzip"})
+
+        assert compressed.headers["ETag"] == identity.headers["ETag"][:-1] + '-gzip"'
+
+        # A cache revalidating its compressed copy gets that copy's ETag back
+        revalidated = client.simulate_get(
+            "/static/tailwind.js",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]},
+        )
+        assert revalidated.status_code == 304
+        assert revalidated.headers["ETag"] == compressed.headers["ETag"]
+
+    def test_immutable_responses_are_compressed_once(self, client: testing.TestClient, mock_artifacts_env):
+        compress = MagicMock(wraps=COMPRESSORS["gzip"])
+        with patch.dict(COMPRESSORS, {"gzip": compress}):
+            first = client.simulate_get("/static/tailwind.js", headers={"Accept-Encoding": "gzip"})
+            second = client.simulate_get("/static/tailwind.js", headers={"Accept-Encoding": "gzip"})
+
+        assert first.content == second.content
+        compress.assert_called_once()
+
+
+class TestEncodedETags:
+    def test_strong_etags_get_an_encoding_suffix(self):
+        assert encoded_etag('"abc"', "br") == '"abc-br"'
+        assert encoded_etag('W/"abc"', "br") == 'W/"abc"'
+        assert decoded_etag("abc-br") == "abc"
+        assert decoded_etag("abc") == "abc"
+
+    def test_etag_matches_accepts_the_compressed_copy(self):
+        assert _etag_matches('"abc-gzip"', "abc")
+        assert _etag_matches('"other", W/"abc-zstd"', "abc")
+        assert not _etag_matches('"abcd-gzip"', "abc")
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from falcon import testing
+
+from deadline import ClientConnection, ClientDisconnected, Deadline, DeadlineExceeded
+
+
+def _request(headers: dict[str, str]) -> MagicMock:
+    return MagicMock(get_header=lambda name: headers.get(name))
+
+
+class TestDeadline:
+    def test_deadline_from_request(self):
+        assert Deadline.from_request(_request({}), {}).remaining() is None
+        assert 9 < Deadline.from_request(_request({"X-Request-Timeout": "10"}), {}).remaining() <= 10
+        assert 4 < Deadline.from_request(_request({}), {"timeout": 5}).remaining() <= 5
+        assert 19 < Deadline.from_request(_request({}), {"deadline": time.time() + 20}).remaining() <= 20
+        assert Deadline.from_request(_request({}), {"deadline": time.time() - 1}).remaining() == 0
+        with pytest.raises(ValueError, match="soon"):
+            Deadline.from_request(_request({}), {"timeout": "soon"})
+
+    def test_check_between_stages(self):
+        Deadline().check("rendering")
+        Deadline.after(10).check("rendering")
+        with pytest.raises(DeadlineExceeded, match="before upload"):
+            Deadline(time.monotonic() - 1).check("upload")
+
+    @pytest.mark.asyncio
+    async def test_run_cancels_work_when_the_deadline_passes(self):
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        assert await Deadline.after(1).run(asyncio.sleep(0, result="done")) == "done"
+        with pytest.raises(DeadlineExceeded):
+            await Deadline.after(0.01).run(slow())
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_run_cancels_work_when_the_client_disconnects(self):
+        async def receive():
+            await asyncio.sleep(0.01)
+            return {"type": "http.disconnect"}
+
+        connection = ClientConnection(receive)
+        with pytest.raises(ClientDisconnected):
+            await Deadline().run(asyncio.sleep(10), connection)
+        assert connection.disconnected
+
+
+class TestGenerateArtifactDeadline:
+    @patch("main.create_s3_client")
+    @patch("main.artifacts._render_template_html", return_value="<html></html>")
+    @patch("main.artifacts._format_template_data", side_effect=lambda name, data, task_data: data)
+    def test_generate_artifact_past_its_deadline(self, _, __, mock_create_s3, client: testing.TestClient):
+        async def slow_render(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        with patch("main.artifacts._generate_pdf_with_attachments", side_effect=slow_render):
+            result = client.simulate_post(
+                "/api/artifacts/GenerateArtifact",
+                json={"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}},
+                headers={"X-Request-Timeout": "0.05"},
+            )
+
+        assert result.status_code == 504
+        assert result.json["error"] == "deadline_exceeded"
+        mock_create_s3.return_value.put_object.assert_not_called()
+
+    @pytest.mark.parametrize("path", ["/api/artifacts/GenerateArtifact", "/v1/do/artifacts/GenerateArtifact"])
+    def test_invalid_timeout_is_a_bad_request(self, client: testing.TestClient, path):
+        result = client.simulate_post(
+            path, json={"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}, "timeout": "abc"}
+        )
+
+        assert 400 in (result.status_code, result.json.get("command_response", {}).get("http_status"))
+        assert "abc" in json.dumps(result.json)
+
+
+async def _call_app(path: str, body: dict, render_started: asyncio.Event) -> list[dict]:
+    """Drive the ASGI app with a client that disconnects once the render has started."""
+    from main import app
+
+    body_sent = False
+    sent = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+        await render_started.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    return sent
+
+
+class TestClientDisconnect:
+    @pytest.fixture
+    def slow_render(self):
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def render(*args, **kwargs):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with (
+            patch("main.artifacts_config.cancel_on_disconnect", True),
+            patch("main.artifacts._render_template_html", return_value="<html></html>"),
+            patch("main.artifacts._format_template_data", side_effect=lambda name, data, task_data: data),
+            patch("main.artifacts._generate_pdf_with_attachments", side_effect=render),
+        ):
+            yield started, cancelled
+
+    @pytest.mark.asyncio
+    async def test_direct_route_cancels_the_render(self, slow_render, caplog):
+        started, cancelled = slow_render
+        body = {"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}}
+
+        sent = await asyncio.wait_for(_call_app("/api/artifacts/GenerateArtifact", body, started), timeout=5)
+
+        assert cancelled.is_set()
+        assert sent[0]["status"] == 499
+        assert json.loads(sent[1]["body"])["error"] == "client_disconnected"
+        assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+    @pytest.mark.asyncio
+    async def test_command_cancels_the_render(self, slow_render, caplog):
+        started, cancelled = slow_render
+        body = {"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}}
+
+        sent = await asyncio.wait_for(_call_app("/v1/do/artifacts/GenerateArtifact", body, started), timeout=5)
+
+        assert cancelled.is_set()
+        assert json.loads(sent[1]["body"])["command_response"]["http_status"] == 499
+        # A client going away is logged, but not as an error with a traceback
+        assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
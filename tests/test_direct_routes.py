@@ -1,9 +1,16 @@
+import tempfile
+from datetime import UTC, datetime
 from unittest.mock import MagicMock, patch
 
+import pytest
 from falcon import testing
 
+from artifacts import RenderedPdf
+from cache import TTLCache
+
 DIRECT_GET_ENDPOINT = "/api/artifacts"
 DIRECT_POST_ENDPOINT = "/api/artifacts/GenerateArtifact"
+DIRECT_RESOLVE_ENDPOINT = "/api/artifacts/ResolveLinks"
 
 
 class TestDirectArtifactLink:
@@ -22,13 +29,44 @@ class TestDirectArtifactLink:
         mock_s3 = MagicMock()
         mock_create_s3.return_value = mock_s3
         mock_get_bucket.return_value = "test-bucket"
+        mock_s3.head_object.return_value = {"ETag": '"abc"'}
         mock_presigned_url.return_value = "https://s3.example.com/presigned/my-artifact"
 
-        result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/my-artifact")
+        # At the start of a link window
+        with patch("main.time.time", return_value=3540 * 1000):
+            result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/my-artifact")
 
         assert result.status_code == 200
         assert result.json == {"url": "https://s3.example.com/presigned/my-artifact"}
         mock_s3.head_object.assert_called_once_with(Bucket="test-bucket", Key="my-artifact")
+        assert result.headers["Cache-Control"] == "private, max-age=3540"
+        assert result.headers["ETag"].startswith('W/"')
+
+    @patch("main.generate_presigned_url", return_value="https://s3.example.com/presigned/my-artifact")
+    @patch("main.get_bucket_for_storage", return_value="test-bucket")
+    @patch("main.create_s3_client")
+    def test_get_artifact_link_etag_is_stable_within_a_window(
+        self, mock_create_s3, _, mock_presigned_url, client: testing.TestClient
+    ):
+        mock_create_s3.return_value.head_object.return_value = {"ETag": '"abc"'}
+
+        def get(now: float, **headers):
+            with patch("main.time.time", return_value=now):
+                return client.simulate_get(f"{DIRECT_GET_ENDPOINT}/my-artifact", headers=headers)
+
+        first = get(3540 * 1000 + 10)
+        later = get(3540 * 1000 + 3000)
+        revalidated = get(3540 * 1000 + 3000, **{"If-None-Match": first.headers["ETag"]})
+        next_window = get(3540 * 1001 + 10, **{"If-None-Match": first.headers["ETag"]})
+
+        assert first.headers["ETag"] == later.headers["ETag"]
+        # Cached responses don't outlive the window, so a link is never used past its expiry
+        assert first.headers["Cache-Control"] == "private, max-age=3530"
+        assert later.headers["Cache-Control"] == "private, max-age=540"
+        assert revalidated.status_code == 304
+        assert next_window.status_code == 200
+        assert next_window.headers["ETag"] != first.headers["ETag"]
+        assert mock_presigned_url.call_count == 3
 
     @patch("main.generate_presigned_url")
     @patch("main.get_bucket_for_storage")
@@ -44,6 +82,7 @@ class TestDirectArtifactLink:
         mock_s3 = MagicMock()
         mock_create_s3.return_value = mock_s3
         mock_get_bucket.return_value = "test-bucket"
+        mock_s3.head_object.return_value = {"ETag": '"abc"'}
         mock_presigned_url.return_value = "https://s3.example.com/presigned/proj-1/doc-2"
 
         result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/proj-1/doc-2")
@@ -143,7 +182,7 @@ class TestDirectArtifactPost:
         mock_get_bucket.return_value = "test-bucket"
         mock_format.return_value = {"name": "formatted"}
         mock_render.return_value = "<html>rendered</html>"
-        mock_pdf.return_value = b"fake_pdf_bytes"
+        mock_pdf.return_value = RenderedPdf(b"fake_pdf_bytes", 1)
         mock_response.return_value = {
             "private_link": "s3://test-bucket/proj/doc",
             "presigned_link": "https://s3.example.com/presigned",
@@ -161,6 +200,7 @@ class TestDirectArtifactPost:
         assert result.status_code == 200
         assert result.json["private_link"] == "s3://test-bucket/proj/doc"
         assert result.json["presigned_link"] == "https://s3.example.com/presigned"
+        assert result.headers["X-Artifact-Memory"].startswith("limit=")
         mock_s3.put_object.assert_called_once()
 
     def test_post_artifact_missing_id(self, client: testing.TestClient):
@@ -196,6 +236,15 @@ class TestDirectArtifactPost:
         assert result.status_code == 400
         assert result.json["error"] == "missing_params"
 
+    def test_post_artifact_unknown_priority(self, client: testing.TestClient):
+        payload = {"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}, "priority": "urgent"}
+
+        result = client.simulate_post(DIRECT_POST_ENDPOINT, json=payload)
+
+        assert result.status_code == 400
+        assert result.json["error"] == "invalid_request"
+        assert "urgent" in result.json["detail"]
+
     @patch("main.artifacts._format_template_data")
     def test_post_artifact_template_error(
         self,
@@ -264,7 +313,7 @@ class TestDirectArtifactPost:
         mock_get_bucket.return_value = "test-bucket"
         mock_format.return_value = {"name": "formatted"}
         mock_render.return_value = "<html>rendered</html>"
-        mock_pdf.return_value = b"fake_pdf_bytes"
+        mock_pdf.return_value = RenderedPdf(b"fake_pdf_bytes", 1)
 
         payload = {
             "id": "proj/doc",
@@ -300,7 +349,7 @@ class TestDirectArtifactPost:
         mock_get_bucket.return_value = "test-bucket"
         mock_format.return_value = {"name": "formatted"}
         mock_render.return_value = "<html>rendered</html>"
-        mock_pdf.return_value = b"fake_pdf_bytes"
+        mock_pdf.return_value = RenderedPdf(b"fake_pdf_bytes", 1)
         mock_response.side_effect = RuntimeError("link generation failed")
 
         payload = {
@@ -315,3 +364,388 @@ class TestDirectArtifactPost:
         assert result.status_code == 500
         assert result.json["error"] == "response_generation_failed"
         assert "link generation failed" in result.json["detail"]
+
+
+def _multipart_body(fields: dict[str, str], files: list[tuple[str, str, bytes]]) -> tuple[bytes, str]:
+    boundary = "----test-boundary"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for filename, content_type, content in files:
+        parts.append(
+            (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="attachments"; filename="{filename}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode()
+            + content
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class TestDirectArtifactPostMultipart:
+    """Tests for multipart/form-data uploads to POST /api/artifacts/GenerateArtifact"""
+
+    @patch("main.artifacts._generate_artifact_response")
+    @patch("main.artifacts._generate_pdf_with_attachments")
+    @patch("main.artifacts._render_template_html")
+    @patch("main.artifacts._format_template_data")
+    @patch("main.get_bucket_for_storage")
+    @patch("main.create_s3_client")
+    def test_post_artifact_multipart_attachments(
+        self,
+        mock_create_s3,
+        mock_get_bucket,
+        mock_format,
+        mock_render,
+        mock_pdf,
+        mock_response,
+        client: testing.TestClient,
+    ):
+        received = []
+
+        async def capture_attachments(document, associated_documents, attachments, **kwargs):
+            received.extend((a.content_type, a.filename, a.read()) for a in attachments)
+            return RenderedPdf(b"fake_pdf_bytes", 1)
+
+        mock_create_s3.return_value = MagicMock()
+        mock_get_bucket.return_value = "test-bucket"
+        mock_format.side_effect = lambda template_name, template_data, task_data: template_data
+        mock_render.return_value = "<html>rendered</html>"
+        mock_pdf.side_effect = capture_attachments
+        mock_response.return_value = {"private_link": "s3://test-bucket/proj/doc"}
+
+        body, content_type = _multipart_body(
+            {"id": "proj/doc", "template": "blm-ce.html", "data": '{"name": "Test"}', "generate_links": "true"},
+            [("photo.png", "image/png", b"\x89PNG fake"), ("scan.pdf", "application/pdf", b"%PDF-1.7 fake")],
+        )
+        result = client.simulate_post(DIRECT_POST_ENDPOINT, body=body, headers={"Content-Type": content_type})
+
+        assert result.status_code == 200
+        assert received == [
+            ("image/png", "photo.png", b"\x89PNG fake"),
+            ("application/pdf", "scan.pdf", b"%PDF-1.7 fake"),
+        ]
+        assert mock_format.call_args[0][1]["name"] == "Test"
+        mock_response.assert_called_once_with(mock_create_s3.return_value, "test-bucket", "proj/doc", True, None)
+
+    def test_post_artifact_multipart_attachment_too_large(self, client: testing.TestClient):
+        body, content_type = _multipart_body(
+            {"id": "proj/doc", "template": "blm-ce.html", "data": "{}"},
+            [("photo.png", "image/png", b"x" * 32)],
+        )
+
+        with patch("attachments.artifacts_config.attachment_max_bytes", 16):
+            result = client.simulate_post(DIRECT_POST_ENDPOINT, body=body, headers={"Content-Type": content_type})
+
+        assert result.status_code == 400
+        assert result.json["error"] == "invalid_request"
+        assert "maximum size" in result.json["detail"]
+
+    @pytest.mark.parametrize("path", [DIRECT_POST_ENDPOINT, "/v1/do/artifacts/GenerateArtifact"])
+    @pytest.mark.parametrize("invalid", [{"thumbnail": "gif"}, {"priority": "urgent"}, {"storage": "file:///etc"}])
+    def test_uploads_are_closed_when_the_request_is_rejected(self, client: testing.TestClient, path, invalid):
+        spools = []
+
+        def new_spool():
+            spools.append(tempfile.SpooledTemporaryFile(max_size=0))
+            return spools[-1]
+
+        body, content_type = _multipart_body(
+            {"id": "proj/doc", "template": "blm-ce.html", "data": '{"name": "Test"}', **invalid},
+            [("photo.png", "image/png", b"\x89PNG fake")],
+        )
+        with patch("attachments._new_spool", new_spool):
+            result = client.simulate_post(path, body=body, headers={"Content-Type": content_type})
+
+        assert "error" in result.json
+        assert spools and all(spool.closed for spool in spools)
+
+
+class TestDirectArtifactResolveLinks:
+    """Tests for POST /api/artifacts/ResolveLinks"""
+
+    @patch("main.generate_presigned_url")
+    @patch("main.get_bucket_for_storage")
+    @patch("main.create_s3_client")
+    def test_resolve_links_per_id_results(
+        self,
+        mock_create_s3,
+        mock_get_bucket,
+        mock_presigned_url,
+        client: testing.TestClient,
+    ):
+        mock_s3 = MagicMock()
+        mock_s3.exceptions.NoSuchKey = type("NoSuchKey", (Exception,), {})
+        missing = Exception("Not Found")
+        missing.response = {"Error": {"Code": "404"}}
+
+        def head_object(Bucket, Key):
+            if Key == "proj/missing":
+                raise missing
+            if Key == "proj/broken":
+                raise RuntimeError("connection timeout")
+
+        mock_s3.head_object.side_effect = head_object
+        mock_create_s3.return_value = mock_s3
+        mock_get_bucket.return_value = "test-bucket"
+        mock_presigned_url.side_effect = lambda s3_client, bucket, key: f"https://s3.example.com/{key}"
+
+        ids = ["proj/a", "proj/missing", "proj/broken", "proj/a"]
+        result = client.simulate_post(DIRECT_RESOLVE_ENDPOINT, json={"ids": ids})
+
+        assert result.status_code == 200
+        assert result.json["results"] == [
+            {"id": "proj/a", "url": "https://s3.example.com/proj/a"},
+            {"id": "proj/missing", "error": "not_found", "detail": "Artifact 'proj/missing' not found"},
+            {"id": "proj/broken", "error": "s3_error", "detail": "connection timeout"},
+            {"id": "proj/a", "url": "https://s3.example.com/proj/a"},
+        ]
+        # The S3 client is built once and duplicates are looked up once
+        mock_create_s3.assert_called_once_with(None)
+        assert mock_s3.head_object.call_count == 3
+
+    @patch("main.generate_presigned_url", return_value="https://s3.example.com/presigned")
+    @patch("main.create_s3_client")
+    def test_resolve_links_runs_lookups_concurrently(self, mock_create_s3, _, client: testing.TestClient):
+        import threading
+        import time
+
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def head_object(Bucket, Key):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+
+        mock_s3 = MagicMock()
+        mock_s3.head_object.side_effect = head_object
+        mock_create_s3.return_value = mock_s3
+
+        with patch("main.artifacts_config.resolve_links_concurrency", 3):
+            result = client.simulate_post(DIRECT_RESOLVE_ENDPOINT, json={"ids": [f"proj/{i}" for i in range(9)]})
+
+        assert result.status_code == 200
+        assert len(result.json["results"]) == 9
+        assert peak == 3
+
+    def test_resolve_links_requires_ids(self, client: testing.TestClient):
+        result = client.simulate_post(DIRECT_RESOLVE_ENDPOINT, json={"ids": []})
+
+        assert result.status_code == 400
+        assert result.json["error"] == "missing_params"
+
+    def test_resolve_links_limits_ids(self, client: testing.TestClient):
+        with patch("main.artifacts_config.resolve_links_max_ids", 2):
+            result = client.simulate_post(DIRECT_RESOLVE_ENDPOINT, json={"ids": ["a", "b", "c"]})
+
+        assert result.status_code == 400
+        assert result.json["error"] == "too_many_ids"
+
+
+class TestDirectArtifactList:
+    """Tests for GET /api/artifacts?prefix=..."""
+
+    @pytest.fixture
+    def mock_s3(self):
+        mock_s3 = MagicMock()
+        mock_s3.list_objects_v2.return_value = {
+            "Contents": [
+                {
+                    "Key": "proj/proc/a.pdf",
+                    "Size": 1234,
+                    "LastModified": datetime(2025, 1, 2, 3, 4, 5, tzinfo=UTC),
+                    "ETag": '"abc"',
+                }
+            ],
+            "NextContinuationToken": "token-2",
+            "IsTruncated": True,
+        }
+        with (
+            patch("main.create_s3_client", return_value=mock_s3),
+            patch("main.get_bucket_for_storage", return_value="test-bucket"),
+            patch("s3utils._listings", TTLCache(maxsize=16, ttl=60)),
+        ):
+            yield mock_s3
+
+    def test_list_artifacts_page(self, mock_s3, client: testing.TestClient):
+        result = client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/proc/", "limit": "10"})
+
+        assert result.status_code == 200
+        assert result.json == {
+            "artifacts": [
+                {"id": "proj/proc/a.pdf", "size": 1234, "last_modified": "2025-01-02T03:04:05+00:00", "etag": "abc"}
+            ],
+            "next_cursor": "token-2",
+        }
+        mock_s3.list_objects_v2.assert_called_once_with(Bucket="test-bucket", Prefix="proj/proc/", MaxKeys=10)
+
+    @patch("main.generate_presigned_url", return_value="https://s3.example.com/presigned")
+    def test_list_artifacts_with_presigned_urls_and_cursor(self, _, mock_s3, client: testing.TestClient):
+        params = {"prefix": "proj/", "cursor": "token-2", "presign": "true"}
+        result = client.simulate_get(DIRECT_GET_ENDPOINT, params=params)
+
+        assert result.json["artifacts"][0]["url"] == "https://s3.example.com/presigned"
+        mock_s3.list_objects_v2.assert_called_once_with(
+            Bucket="test-bucket", Prefix="proj/", MaxKeys=100, ContinuationToken="token-2"
+        )
+
+    def test_listings_are_cached_until_a_write_under_the_prefix(self, mock_s3, client: testing.TestClient):
+        from s3utils import invalidate_listings
+
+        client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/proc/"})
+        client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/proc/"})
+        assert mock_s3.list_objects_v2.call_count == 1
+
+        invalidate_listings("test-bucket", "proj/other/b.pdf")
+        client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/proc/"})
+        assert mock_s3.list_objects_v2.call_count == 1
+
+        invalidate_listings("test-bucket", "proj/proc/b.pdf")
+        client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/proc/"})
+        assert mock_s3.list_objects_v2.call_count == 2
+
+    def test_thumbnails_are_not_listed(self, tmp_path, client: testing.TestClient):
+        from localstorage import LocalStorageClient
+        from main import artifacts
+
+        storage = LocalStorageClient(str(tmp_path))
+        rendered = RenderedPdf(b"%PDF-1.7", 1, ("image/png", b"png-bytes"))
+        preview = artifacts._store_artifact(storage, str(tmp_path), "proj/doc.pdf", rendered, "blm-ce.html")
+
+        with (
+            patch("main.create_s3_client", return_value=storage),
+            patch("main.get_bucket_for_storage", return_value=str(tmp_path)),
+            patch("s3utils._listings", TTLCache(maxsize=16, ttl=60)),
+        ):
+            result = client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/"})
+            thumbnails = client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "_"})
+
+        assert [artifact["id"] for artifact in result.json["artifacts"]] == ["proj/doc.pdf"]
+        assert thumbnails.json["artifacts"] == []
+        assert storage.head_object(Bucket=str(tmp_path), Key=preview["thumbnail_key"])["ContentType"] == "image/png"
+
+    def test_list_artifacts_requires_prefix(self, client: testing.TestClient):
+        result = client.simulate_get(DIRECT_GET_ENDPOINT)
+
+        assert result.status_code == 400
+        assert result.json["error"] == "invalid_request"
+
+    def test_list_artifacts_rejects_bad_limit(self, client: testing.TestClient):
+        result = client.simulate_get(DIRECT_GET_ENDPOINT, params={"prefix": "proj/", "limit": "5000"})
+
+        assert result.status_code == 400
+        assert result.json["error"] == "invalid_request"
+
+
+class _FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.reads: list[int] = []
+        self.closed = False
+
+    def read(self, size: int) -> bytes:
+        self.reads.append(size)
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+def _client_error(code: str, headers: dict | None = None) -> Exception:
+    error = Exception(code)
+    error.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPHeaders": headers or {}}}
+    return error
+
+
+class TestDirectArtifactContent:
+    """Tests for GET /api/artifacts/{artifact_id:path}/content"""
+
+    @pytest.fixture
+    def mock_s3(self):
+        mock_s3 = MagicMock()
+        mock_s3.exceptions.NoSuchKey = type("NoSuchKey", (Exception,), {})
+        with (
+            patch("main.create_s3_client", return_value=mock_s3),
+            patch("main.get_bucket_for_storage", return_value="test-bucket"),
+        ):
+            yield mock_s3
+
+    def test_streams_content_in_chunks(self, mock_s3, client: testing.TestClient):
+        body = _FakeBody(b"%PDF-" + b"x" * 20)
+        mock_s3.get_object.return_value = {
+            "Body": body,
+            "ContentLength": 25,
+            "ContentType": "application/pdf",
+            "ETag": '"abc"',
+            "LastModified": datetime(2025, 1, 2, 3, 4, 5, tzinfo=UTC),
+            "CacheControl": "private, no-cache",
+        }
+
+        with patch("main.artifacts_config.download_chunk_size", 8):
+            result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/proj/proc/a.pdf/content")
+
+        assert result.status_code == 200
+        assert result.content == b"%PDF-" + b"x" * 20
+        assert result.headers["Content-Type"] == "application/pdf"
+        assert result.headers["ETag"] == '"abc"'
+        assert result.headers["Last-Modified"] == "Thu, 02 Jan 2025 03:04:05 GMT"
+        assert result.headers["Accept-Ranges"] == "bytes"
+        assert result.headers["Cache-Control"] == "private, no-cache"
+        assert body.reads == [8, 8, 8, 8, 8]
+        assert body.closed
+        mock_s3.get_object.assert_called_once_with(Bucket="test-bucket", Key="proj/proc/a.pdf")
+
+    def test_range_request(self, mock_s3, client: testing.TestClient):
+        mock_s3.get_object.return_value = {
+            "Body": _FakeBody(b"PDF-"),
+            "ContentLength": 4,
+            "ContentRange": "bytes 1-4/25",
+            "ContentType": "application/pdf",
+        }
+
+        result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/proj/a.pdf/content", headers={"Range": "bytes=1-4"})
+
+        assert result.status_code == 206
+        assert result.content == b"PDF-"
+        assert result.headers["Content-Range"] == "bytes 1-4/25"
+        assert mock_s3.get_object.call_args.kwargs["Range"] == "bytes=1-4"
+
+    def test_conditional_request_not_modified(self, mock_s3, client: testing.TestClient):
+        mock_s3.get_object.side_effect = _client_error("304", {"etag": '"abc"'})
+
+        result = client.simulate_get(
+            f"{DIRECT_GET_ENDPOINT}/proj/a.pdf/content",
+            headers={"If-None-Match": '"abc"', "If-Modified-Since": "Thu, 02 Jan 2025 03:04:05 GMT"},
+        )
+
+        assert result.status_code == 304
+        assert result.headers["ETag"] == '"abc"'
+        kwargs = mock_s3.get_object.call_args.kwargs
+        assert kwargs["IfNoneMatch"] == '"abc"'
+        assert kwargs["IfModifiedSince"] == datetime(2025, 1, 2, 3, 4, 5, tzinfo=UTC)
+
+    def test_missing_artifact(self, mock_s3, client: testing.TestClient):
+        mock_s3.get_object.side_effect = _client_error("NoSuchKey")
+
+        result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/proj/missing.pdf/content")
+
+        assert result.status_code == 404
+        assert result.json["error"] == "not_found"
+
+    def test_unsatisfiable_range(self, mock_s3, client: testing.TestClient):
+        mock_s3.get_object.side_effect = _client_error("InvalidRange")
+
+        result = client.simulate_get(f"{DIRECT_GET_ENDPOINT}/proj/a.pdf/content", headers={"Range": "bytes=999-"})
+
+        assert result.status_code == 416
+        assert result.json["error"] == "invalid_range"
@@ -0,0 +1,146 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+from falcon import testing
+
+BATCH_ENDPOINT = "/v1/do/http/BatchRequest"
+
+
+def _mock_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def _handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/slow":
+        await asyncio.sleep(1)
+    if request.url.path == "/text":
+        return httpx.Response(200, text="plain")
+    if request.url.path == "/broken":
+        raise httpx.ConnectError("connection refused", request=request)
+    return httpx.Response(200, json={"path": request.url.path, "method": request.method})
+
+
+class TestHttpConnector:
+    def test_get_request(self, client: testing.TestClient):
+        with patch("main.http_client", _mock_client(_handler)):
+            result = client.simulate_post("/v1/do/http/GetRequest", json={"url": "https://example.com/item"})
+
+        assert result.json["command_response"] == {
+            "body": {"path": "/item", "method": "GET"},
+            "mimetype": "application/json",
+            "http_status": 200,
+        }
+        assert result.json["error"] is None
+
+
+class TestHttpBatchRequest:
+    def test_results_in_request_order(self, client: testing.TestClient):
+        requests = [
+            {"url": "https://example.com/a"},
+            {"method": "post", "url": "https://example.com/b", "data": {"x": 1}},
+            {"url": "https://example.com/text"},
+            {"url": "https://example.com/broken"},
+            {"method": "TRACE", "url": "https://example.com/c"},
+        ]
+
+        with patch("main.http_client", _mock_client(_handler)):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests})
+
+        assert result.json["command_response"]["http_status"] == 200
+        results = result.json["command_response"]["body"]["results"]
+        assert [r["http_status"] for r in results] == [200, 200, 200, None, None]
+        assert results[0]["body"] == {"path": "/a", "method": "GET"}
+        assert results[1]["body"] == {"path": "/b", "method": "POST"}
+        assert results[2]["body"] == {"raw_response": "plain"}
+        assert results[3]["error"] == "connection refused"
+        assert results[4]["error"] == "Unsupported method 'TRACE'"
+
+    def test_per_item_timeout(self, client: testing.TestClient):
+        requests = [{"url": "https://example.com/slow"}, {"url": "https://example.com/fast"}]
+
+        with patch("main.http_client", _mock_client(_handler)):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests, "timeout": 0.1})
+
+        results = result.json["command_response"]["body"]["results"]
+        assert results[0]["error"] == "Timed out after 0.1s"
+        assert results[1]["http_status"] == 200
+
+    def test_concurrency_limit(self, client: testing.TestClient):
+        running = 0
+        peak = 0
+
+        async def handler(request):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return httpx.Response(200, json={})
+
+        requests = [{"url": f"https://example.com/{i}"} for i in range(8)]
+        with patch("main.http_client", _mock_client(handler)):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests, "concurrency": 3})
+
+        assert len(result.json["command_response"]["body"]["results"]) == 8
+        assert peak == 3
+
+    def test_malformed_items_fail_alone(self, client: testing.TestClient):
+        requests = [
+            {"method": "GET"},
+            {"url": 42},
+            {"url": "http://[::1"},
+            {"url": "https://example.com/a"},
+        ]
+
+        with patch("main.http_client", _mock_client(_handler)):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests})
+
+        assert result.json["command_response"]["http_status"] == 200
+        results = result.json["command_response"]["body"]["results"]
+        assert results[0]["error"] == results[1]["error"] == "url must be a non-empty string"
+        assert results[2]["http_status"] is None and results[2]["error"]
+        assert results[3] == {"body": {"path": "/a", "method": "GET"}, "http_status": 200, "error": None}
+
+    def test_unexpected_errors_do_not_abandon_the_batch(self, client: testing.TestClient):
+        async def handler(request):
+            if request.url.path == "/bug":
+                raise RuntimeError("unexpected")
+            await asyncio.sleep(0.02)
+            return httpx.Response(200, json={})
+
+        requests = [{"url": "https://example.com/bug"}, {"url": "https://example.com/a"}]
+        with patch("main.http_client", _mock_client(handler)):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests})
+
+        results = result.json["command_response"]["body"]["results"]
+        assert results[0] == {"body": None, "http_status": None, "error": "unexpected"}
+        assert results[1]["http_status"] == 200
+
+    def test_rejects_invalid_batches(self, client: testing.TestClient):
+        result = client.simulate_post(BATCH_ENDPOINT, json={"requests": "https://example.com"})
+        assert result.json["command_response"]["http_status"] == 400
+
+        with patch("main.service_config.http_batch_max_requests", 1):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": [{"url": "a"}, {"url": "b"}]})
+        assert result.json["command_response"]["http_status"] == 400
+
+    def test_timeout_cannot_exceed_the_configured_limit(self, client: testing.TestClient):
+        requests = [{"url": "https://example.com/slow"}]
+
+        with patch("main.http_client", _mock_client(_handler)), patch("main.service_config.http_batch_timeout", 0.1):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests, "timeout": 3600})
+
+        assert result.json["command_response"]["body"]["results"][0]["error"] == "Timed out after 0.1s"
+
+    def test_rejects_invalid_limits(self, client: testing.TestClient):
+        requests = [{"url": "https://example.com/a"}]
+        for limits in ({"concurrency": "many"}, {"timeout": "soon"}, {"timeout": -1}, {"concurrency": [2]}):
+            result = client.simulate_post(BATCH_ENDPOINT, json={"requests": requests, **limits})
+
+            assert result.status_code == 200
+            assert result.json["command_response"]["http_status"] == 400
+
+    def test_batch_command_is_listed(self, client: testing.TestClient):
+        command_ids = [command["id"] for command in client.simulate_get("/v1/commands").json]
+        assert "http/BatchRequest" in command_ids
@@ -0,0 +1,107 @@
+import asyncio
+import base64
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+
+import images
+from attachments import UploadedAttachment
+from main import artifacts
+from spool import MemoryBudget
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _image_bytes(size: tuple[int, int], format: str = "JPEG", mode: str = "RGB", orientation: int | None = None):
+    image = Image.new(mode, size, color="red" if mode == "RGB" else (255, 0, 0, 128))
+    exif = Image.Exif()
+    if orientation:
+        exif[images.EXIF_ORIENTATION] = orientation
+    output = BytesIO()
+    image.save(output, format=format, exif=exif.tobytes() if orientation else b"")
+    return output.getvalue()
+
+
+class TestDownscaleImage:
+    def test_large_photo_is_downscaled_to_print_dpi(self):
+        mime_type, result = images.downscale_image(_image_bytes((4000, 3000)), "image/jpeg")
+
+        with Image.open(BytesIO(result)) as image:
+            max_width, max_height = images.max_dimensions()
+            assert mime_type == "image/jpeg"
+            # Landscape images are bounded by the page's long side
+            assert image.width <= max_height
+            assert image.height <= max_width
+
+    def test_orientation_is_corrected_and_exif_stripped(self):
+        mime_type, result = images.downscale_image(_image_bytes((400, 200), orientation=6), "image/jpeg")
+
+        with Image.open(BytesIO(result)) as image:
+            assert image.size == (200, 400)
+            assert images.EXIF_ORIENTATION not in image.getexif()
+
+    def test_transparent_png_stays_png(self):
+        mime_type, result = images.downscale_image(_image_bytes((3000, 3000), "PNG", "RGBA"), "image/png")
+
+        with Image.open(BytesIO(result)) as image:
+            assert mime_type == "image/png"
+            assert image.mode == "RGBA"
+
+    def test_cmyk_photo_does_not_keep_its_cmyk_profile(self):
+        from PIL import ImageCms
+
+        # Not a valid CMYK profile, so it can't be applied and is dropped
+        srgb_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        output = BytesIO()
+        Image.new("CMYK", (4000, 3000), color=(0, 255, 255, 0)).save(output, format="JPEG", icc_profile=srgb_profile)
+
+        mime_type, result = images.downscale_image(output.getvalue(), "image/jpeg")
+
+        with Image.open(BytesIO(result)) as image:
+            assert mime_type == "image/jpeg"
+            assert image.mode == "RGB"
+            assert "icc_profile" not in image.info
+
+    def test_rgb_photo_keeps_its_profile(self):
+        from PIL import ImageCms
+
+        srgb_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        output = BytesIO()
+        Image.new("RGB", (4000, 3000), color="red").save(output, format="JPEG", icc_profile=srgb_profile)
+
+        _, result = images.downscale_image(output.getvalue(), "image/jpeg")
+
+        with Image.open(BytesIO(result)) as image:
+            assert image.info["icc_profile"] == srgb_profile
+
+    def test_small_image_without_metadata_is_unchanged(self):
+        payload = _image_bytes((10, 10), "PNG")
+
+        assert images.downscale_image(payload, "image/png") == ("image/png", payload)
+
+
+class TestPrepareImage:
+    def test_results_are_cached_by_content(self):
+        payload = _image_bytes((2000, 2000))
+        images._cache.clear()
+
+        first = asyncio.run(images.prepare_image(payload, "image/jpeg"))
+        with patch("images.downscale_image") as mock_downscale:
+            second = asyncio.run(images.prepare_image(payload, "image/jpeg"))
+
+        mock_downscale.assert_not_called()
+        assert first == second
+
+    def test_undecodable_image_is_passed_through(self):
+        assert asyncio.run(images.prepare_image(b"not an image", "image/png")) == ("image/png", b"not an image")
+
+    def test_artifacts_prepare_images_replaces_oversized_attachments(self):
+        photo = "data:image/jpeg;base64," + base64.b64encode(_image_bytes((4000, 3000))).decode()
+        pdf = "data:application/pdf;base64," + base64.b64encode(b"%PDF-fake").decode()
+
+        prepared_photo, prepared_pdf = asyncio.run(artifacts._prepare_images([photo, pdf], MemoryBudget(1024**2)))
+
+        assert isinstance(prepared_photo, UploadedAttachment)
+        assert len(prepared_photo.read()) < len(photo)
+        assert prepared_pdf == pdf
@@ -0,0 +1,161 @@
+import os
+import time
+from io import BytesIO
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import pytest
+from falcon import testing
+
+import s3utils
+from cache import LRUCache
+from localstorage import LocalStorageClient, LocalStorageError, NoSuchKey
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorageClient(str(tmp_path / "artifacts"))
+
+
+class TestLocalStorageClient:
+    def test_put_and_get_round_trip(self, storage):
+        storage.put_object(
+            Bucket="ignored", Key="proj/proc/a.pdf", Body=BytesIO(b"%PDF-1.7"), ContentType="application/pdf"
+        )
+        obj = storage.get_object(Bucket="ignored", Key="proj/proc/a.pdf")
+
+        assert obj["Body"].read() == b"%PDF-1.7"
+        assert obj["ContentType"] == "application/pdf"
+        assert obj["ContentLength"] == 8
+        # Nothing but the object and its metadata is left behind
+        assert sorted(os.listdir(os.path.join(storage.root, "proj", "proc"))) == ["a.pdf", "a.pdf.metadata.json"]
+
+    def test_range_and_conditional_requests(self, storage):
+        put = storage.put_object(Bucket="b", Key="a.pdf", Body=b"0123456789")
+
+        obj = storage.get_object(Bucket="b", Key="a.pdf", Range="bytes=2-5")
+        assert obj["Body"].read() == b"2345"
+        assert obj["ContentRange"] == "bytes 2-5/10"
+        assert storage.get_object(Bucket="b", Key="a.pdf", Range="bytes=-3")["Body"].read() == b"789"
+
+        with pytest.raises(LocalStorageError) as not_modified:
+            storage.get_object(Bucket="b", Key="a.pdf", IfNoneMatch=put["ETag"])
+        assert not_modified.value.response["Error"]["Code"] == "304"
+
+        with pytest.raises(LocalStorageError) as invalid:
+            storage.get_object(Bucket="b", Key="a.pdf", Range="bytes=20-")
+        assert invalid.value.response["Error"]["Code"] == "InvalidRange"
+
+    def test_missing_keys_and_traversal(self, storage):
+        with pytest.raises(storage.exceptions.NoSuchKey):
+            storage.head_object(Bucket="b", Key="missing.pdf")
+        with pytest.raises(LocalStorageError):
+            storage.put_object(Bucket="b", Key="../escape.pdf", Body=b"x")
+        assert issubclass(NoSuchKey, LocalStorageError)
+
+    def test_internal_files_are_not_objects(self, storage):
+        expires = int(time.time()) + 60
+        storage.sign("a.pdf", expires)
+        # The generated signing key is kept in the storage directory, but is not an object
+        assert os.path.exists(os.path.join(storage.root, ".connector", "signing-key"))
+        assert storage.list_objects_v2(Bucket="b")["KeyCount"] == 0
+
+        for key in (".connector/signing-key", "proj/../.connector/signing-key", ".signing-key", "a.pdf.tmp"):
+            with pytest.raises(LocalStorageError) as invalid:
+                storage.head_object(Bucket="b", Key=key)
+            assert invalid.value.response["Error"]["Code"] == "InvalidKey"
+
+    def test_signing_key_does_not_need_a_writable_parent(self, tmp_path):
+        parent = tmp_path / "mount"
+        parent.mkdir()
+        storage = LocalStorageClient(str(parent / "artifacts"))
+
+        expires = int(time.time()) + 60
+        assert storage.verify("a.pdf", expires, storage.sign("a.pdf", expires))
+        # Nothing is written beside the storage directory, which may be a read-only mount point
+        assert os.listdir(parent) == ["artifacts"]
+
+    def test_list_objects_pages_by_prefix(self, storage):
+        for key in ("p/1/a.pdf", "p/1/b.pdf", "p/1/c.pdf", "p/2/a.pdf"):
+            storage.put_object(Bucket="b", Key=key, Body=b"x")
+
+        first = storage.list_objects_v2(Bucket="b", Prefix="p/1/", MaxKeys=2)
+        second = storage.list_objects_v2(
+            Bucket="b", Prefix="p/1/", MaxKeys=2, ContinuationToken=first["NextContinuationToken"]
+        )
+
+        assert [obj["Key"] for obj in first["Contents"]] == ["p/1/a.pdf", "p/1/b.pdf"]
+        assert [obj["Key"] for obj in second["Contents"]] == ["p/1/c.pdf"]
+        assert "NextContinuationToken" not in second
+
+    def test_signed_links_expire_and_reject_tampering(self, storage):
+        expires = int(time.time()) + 60
+
+        assert storage.verify("a.pdf", expires, storage.sign("a.pdf", expires))
+        assert not storage.verify("b.pdf", expires, storage.sign("a.pdf", expires))
+        assert not storage.verify("a.pdf", expires - 120, storage.sign("a.pdf", expires - 120))
+        # The generated key is kept beside the data, so other workers sign identically
+        assert LocalStorageClient(storage.root).sign("a.pdf", expires) == storage.sign("a.pdf", expires)
+
+
+class TestLocalStorageRoutes:
+    @pytest.fixture(autouse=True)
+    def local_default_storage(self, tmp_path):
+        with (
+            patch("s3utils.artifacts_config.storage_url", f"file://{tmp_path}/artifacts"),
+            patch("s3utils._s3_clients", LRUCache()),
+        ):
+            s3utils.create_s3_client(None).put_object(Bucket="", Key="proj/proc/a.pdf", Body=b"%PDF-local")
+            yield
+
+    def test_link_and_download(self, client: testing.TestClient):
+        link = client.simulate_get("/api/artifacts/proj/proc/a.pdf")
+        assert link.status_code == 200
+
+        url = urlsplit(link.json["url"])
+        assert url.path == "/api/local-storage/proj/proc/a.pdf"
+        download = client.simulate_get(url.path, query_string=url.query)
+
+        assert download.status_code == 200
+        assert download.content == b"%PDF-local"
+
+    def test_download_requires_valid_signature(self, client: testing.TestClient):
+        result = client.simulate_get("/api/local-storage/proj/proc/a.pdf", params={"expires": "9999999999"})
+
+        assert result.status_code == 403
+        assert result.json["error"] == "invalid_signature"
+
+    def test_content_route_streams_local_file(self, client: testing.TestClient):
+        result = client.simulate_get("/api/artifacts/proj/proc/a.pdf/content", headers={"Range": "bytes=0-3"})
+
+        assert result.status_code == 206
+        assert result.content == b"%PDF"
+
+    def test_private_links_use_file_urls(self, tmp_path):
+        bucket = s3utils.get_bucket_for_storage(None)
+        assert s3utils.generate_private_link(bucket, "a.pdf") == f"file://{tmp_path}/artifacts/a.pdf"
+
+    def test_content_route_does_not_serve_internal_files(self, client: testing.TestClient):
+        for artifact_id in (".signing-key", ".connector/signing-key"):
+            result = client.simulate_get(f"/api/artifacts/{artifact_id}/content")
+
+            assert result.status_code == 404
+
+    def test_requests_cannot_choose_local_storage(self, client: testing.TestClient, tmp_path):
+        storage = f"file://{tmp_path}"
+        listing = client.simulate_get("/api/artifacts", params={"prefix": "proj/", "storage": storage})
+        link = client.simulate_post(
+            "/v1/do/artifacts/GetLinkToArtifact", json={"id": "proj/proc/a.pdf", "storage": storage}
+        )
+        generated = client.simulate_post(
+            "/api/artifacts/GenerateArtifact",
+            json={"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}, "storage": storage},
+        )
+        resolved = client.simulate_post(
+            "/api/artifacts/ResolveLinks", json={"ids": ["proj/proc/a.pdf"], "storage": storage}
+        )
+
+        assert listing.status_code == 400
+        assert link.json["command_response"]["http_status"] == 400
+        assert resolved.status_code == 400
+        assert generated.status_code == 400
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import stat
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from main import artifacts
+from render_cache import RenderCache
+
+
+class TestRenderCache:
+    @pytest.mark.asyncio
+    async def test_memory_tier_hit(self):
+        cache = RenderCache(memory_bytes=1024, directory=None, max_disk_bytes=0)
+
+        assert await cache.get("a") is None
+        await cache.set("a", b"%PDF-a")
+
+        assert await cache.get("a") == b"%PDF-a"
+        assert cache.stats()["memory_hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_survives_a_new_process(self, tmp_path):
+        await RenderCache(1024, str(tmp_path), 1024).set("a", b"%PDF-a")
+
+        # A fresh cache (e.g. another worker) only has the disk tier
+        cache = RenderCache(1024, str(tmp_path), 1024)
+        assert await cache.get("a") == b"%PDF-a"
+        assert cache.stats()["disk_hits"] == 1
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_trims_least_recently_used(self, tmp_path):
+        cache = RenderCache(0, str(tmp_path), max_disk_bytes=25)
+
+        await cache.set("old", b"x" * 10)
+        await cache.set("used", b"x" * 10)
+        os.utime(tmp_path / "old.pdf", (1, 1))
+        os.utime(tmp_path / "used.pdf", (2, 2))
+        assert await cache.get("used") is not None  # refreshes its last-used time
+        await cache.set("new", b"x" * 10)
+
+        assert sorted(os.listdir(tmp_path)) == ["new.pdf", "used.pdf"]
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_is_private_to_the_user(self, tmp_path):
+        directory = tmp_path / "renders"
+        await RenderCache(1024, str(directory), 1024).set("a", b"%PDF-a")
+
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(directory / "a.pdf").st_mode) == 0o600
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_ignores_expired_entries(self, tmp_path):
+        await RenderCache(1024, str(tmp_path), 1024, ttl=60).set("a", b"%PDF-a")
+        os.utime(tmp_path / "a.pdf", (time.time(), time.time() - 120))
+
+        assert await RenderCache(1024, str(tmp_path), 1024, ttl=60).get("a") is None
+        assert not os.listdir(tmp_path)
+
+    @pytest.mark.asyncio
+    async def test_memory_tier_is_bounded_by_bytes(self):
+        cache = RenderCache(memory_bytes=25, directory=None, max_disk_bytes=0)
+
+        await cache.set("a", b"x" * 10)
+        await cache.set("b", b"x" * 10)
+        await cache.set("c", b"x" * 10)
+        await cache.set("huge", b"x" * 30)
+
+        assert await cache.get("a") is None
+        assert await cache.get("b") is not None
+        assert await cache.get("huge") is None
+        assert cache.stats()["memory_bytes"] == 20
+
+    def test_key_depends_on_html_options_and_version(self):
+        cache = RenderCache(0, None, 0)
+        key = cache.key("<html></html>", {"print_background": True}, "v1")
+
+        assert key == cache.key("<html></html>", {"print_background": True}, "v1")
+        assert key != cache.key("<html>edited</html>", {"print_background": True}, "v1")
+        assert key != cache.key("<html></html>", {"print_background": False}, "v1")
+        assert key != cache.key("<html></html>", {"print_background": True}, "v2")
+
+
+class TestCachedRendering:
+    def test_html_to_pdf_reuses_cached_render(self, tmp_path):
+        page = MagicMock(set_content=AsyncMock(), pdf=AsyncMock(return_value=b"%PDF-rendered"))
+        page_context = MagicMock(__aenter__=AsyncMock(return_value=page), __aexit__=AsyncMock(return_value=False))
+
+        with (
+            patch.object(artifacts, "render_cache", RenderCache(1024, str(tmp_path), 1024)),
+            patch.object(artifacts.renderer, "page", return_value=page_context),
+        ):
+            first = asyncio.run(artifacts._html_to_pdf("<html>same</html>"))
+            second = asyncio.run(artifacts._html_to_pdf("<html>same</html>"))
+            asyncio.run(artifacts._html_to_pdf("<html>changed</html>"))
+
+            assert first == second == b"%PDF-rendered"
+            assert page.pdf.await_count == 2
+            assert artifacts.metrics()["render_cache"]["memory_hits"] == 1
+
+    def test_metrics_endpoint(self, client):
+        result = client.simulate_get("/metrics")
+
+        assert result.status_code == 200
+        assert set(result.json["preview_cache"]) == {"hits", "misses"}
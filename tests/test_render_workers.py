@@ -0,0 +1,128 @@
+import asyncio
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from artifacts import RenderOptions
+from render_workers import RenderError, RenderWorkerCrashed, RenderWorkerPool, process_tree_rss
+from spool import MemoryBudget
+
+
+def fake_serve(conn):
+    """Stands in for render_workers.serve without Chromium: answers with its pid and the first section."""
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+
+        sections, _options = job
+        kind, content = sections[0]
+        if kind == "crash":
+            os._exit(1)
+        if kind == "crash-once" and not os.path.exists(content):
+            open(content, "w").close()
+            os._exit(1)
+        if kind == "fail":
+            conn.send(("error", content))
+            continue
+        conn.send(("ok", f"{os.getpid()}:{content}".encode()))
+
+
+async def _render_all(pool: RenderWorkerPool, jobs: list[tuple[str, str]]) -> list[bytes]:
+    try:
+        return [await pool.render([job], RenderOptions()) for job in jobs]
+    finally:
+        await pool.stop()
+
+
+def _pid(result: bytes) -> str:
+    return result.decode().split(":")[0]
+
+
+class TestRenderWorkerPool:
+    @pytest.mark.asyncio
+    async def test_renders_in_worker_process(self):
+        results = await _render_all(RenderWorkerPool(1, target=fake_serve), [("html", "a"), ("html", "b")])
+
+        assert [result.decode().split(":")[1] for result in results] == ["a", "b"]
+        assert _pid(results[0]) != str(os.getpid())
+        assert _pid(results[0]) == _pid(results[1])
+
+    @pytest.mark.asyncio
+    async def test_recycles_after_max_renders(self):
+        pool = RenderWorkerPool(1, max_renders=2, target=fake_serve)
+        results = await _render_all(pool, [("html", "a"), ("html", "b"), ("html", "c")])
+
+        assert _pid(results[0]) == _pid(results[1]) != _pid(results[2])
+        assert pool.recycled == 1
+
+    @pytest.mark.asyncio
+    async def test_recycles_above_max_rss(self):
+        pool = RenderWorkerPool(1, max_rss=1, target=fake_serve)
+        results = await _render_all(pool, [("html", "a"), ("html", "b")])
+
+        assert _pid(results[0]) != _pid(results[1])
+
+    @pytest.mark.asyncio
+    async def test_retries_crashed_job_on_fresh_worker(self, tmp_path):
+        pool = RenderWorkerPool(1, retries=1, target=fake_serve)
+        (result,) = await _render_all(pool, [("crash-once", str(tmp_path / "crashed"))])
+
+        assert result.decode().endswith(str(tmp_path / "crashed"))
+        assert pool.crashed == 1
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_retries(self):
+        pool = RenderWorkerPool(1, retries=1, target=fake_serve)
+        with pytest.raises(RenderWorkerCrashed):
+            await _render_all(pool, [("crash", "")])
+        assert pool.crashed == 2
+
+    @pytest.mark.asyncio
+    async def test_render_errors_are_not_retried(self):
+        pool = RenderWorkerPool(1, target=fake_serve)
+        with pytest.raises(RenderError, match="bad template"):
+            await _render_all(pool, [("fail", "bad template"), ("html", "a")])
+        assert pool.crashed == 0
+
+    @pytest.mark.asyncio
+    async def test_real_worker_merges_pdf_sections(self):
+        # PDF-only sections need no Chromium, so this runs the real worker end to end
+        from io import BytesIO
+
+        from pypdf import PdfReader, PdfWriter
+
+        writer = PdfWriter()
+        writer.add_blank_page(width=612, height=792)
+        pdf = BytesIO()
+        writer.write(pdf)
+
+        pool = RenderWorkerPool(1)
+        try:
+            result = await pool.render([("pdf", pdf.getvalue()), ("pdf", pdf.getvalue())], RenderOptions())
+        finally:
+            await pool.stop()
+
+        assert len(PdfReader(BytesIO(result.pdf)).pages) == result.page_count == 2
+
+    def test_process_tree_rss_includes_the_process(self):
+        assert process_tree_rss(os.getpid()) > 0
+
+
+class TestArtifactsRenderPool:
+    def test_artifacts_render_through_pool(self, mock_artifacts_env):
+        render_pool = MagicMock(render=AsyncMock(return_value=b"%PDF-pooled"))
+        with (
+            patch.object(mock_artifacts_env, "render_pool", render_pool),
+            patch.object(mock_artifacts_env, "_render_sections", AsyncMock()) as render_sections,
+        ):
+            result = asyncio.run(
+                mock_artifacts_env._render_pdf_with_attachments(
+                    "<html></html>", [], [], RenderOptions(), MemoryBudget(0)
+                )
+            )
+
+        assert result == b"%PDF-pooled"
+        render_pool.render.assert_awaited_once_with([("html", "<html></html>")], RenderOptions())
+        render_sections.assert_not_awaited()
@@ -0,0 +1,56 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from main import artifacts
+from renderer import Renderer
+
+TAILWIND_CDN = "https://cdn.jsdelivr.net/npm/@tailwindcss/browser@4"
+
+
+def _route(url: str) -> MagicMock:
+    return MagicMock(request=MagicMock(url=url), fulfill=AsyncMock(), abort=AsyncMock(), continue_=AsyncMock())
+
+
+class TestRenderer:
+    def test_known_assets_are_served_from_memory(self):
+        renderer = Renderer(resolve_asset=lambda url: ("text/css", b"body {}") if url.endswith(".css") else None)
+        route = _route("https://example.com/static/base-styles.css")
+
+        asyncio.run(renderer._route(route))
+
+        route.fulfill.assert_awaited_once_with(status=200, content_type="text/css", body=b"body {}")
+        assert renderer.stats() == {"served_assets": 1, "blocked_requests": 0}
+
+    def test_other_requests_are_blocked(self):
+        renderer = Renderer(resolve_asset=lambda url: None)
+        route = _route("https://fonts.example.com/font.woff2")
+
+        asyncio.run(renderer._route(route))
+
+        route.abort.assert_awaited_once_with("blockedbyclient")
+        route.continue_.assert_not_awaited()
+        assert renderer.stats() == {"served_assets": 0, "blocked_requests": 1}
+
+    def test_other_requests_go_out_when_allowed(self):
+        renderer = Renderer(resolve_asset=lambda url: None)
+        route = _route("https://fonts.example.com/font.woff2")
+
+        with patch("renderer.render_config.block_external_requests", False):
+            asyncio.run(renderer._route(route))
+
+        route.continue_.assert_awaited_once()
+        route.abort.assert_not_awaited()
+
+
+class TestRenderAssets:
+    def test_templates_resolve_to_bundled_assets(self):
+        content_type, body = artifacts._render_asset(TAILWIND_CDN)
+        assert content_type.startswith("text/javascript")
+        assert body == artifacts.static_assets()["tailwind.js"][1]
+        assert not body.lstrip().startswith(b"<script")
+
+        content_type, _ = artifacts._render_asset("https://connector.example.com/static/base-styles.css?v=abc")
+        assert content_type.startswith("text/css")
+
+        assert artifacts._render_asset("https://cdn.example.com/other.js") is None
+        assert artifacts._render_asset("https://connector.example.com/static/missing.css") is None
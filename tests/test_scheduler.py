@@ -0,0 +1,133 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from falcon import testing
+
+from main import artifacts
+from scheduler import DEFAULT_TENANT, FairScheduler, UnknownPriority
+
+
+async def _run_jobs(scheduler: FairScheduler, jobs: list[tuple[str, str]], started: list[str], hold: asyncio.Event):
+    async def job(name: str, tenant: str, priority: str):
+        async with scheduler.slot(tenant, priority):
+            started.append(name)
+            await hold.wait()
+
+    tasks = [
+        asyncio.create_task(job(f"{tenant}-{priority}-{i}", tenant, priority))
+        for i, (tenant, priority) in enumerate(jobs)
+    ]
+    # Let every job reach the scheduler
+    await asyncio.sleep(0)
+    return tasks
+
+
+class TestFairScheduler:
+    @pytest.mark.asyncio
+    async def test_tenants_take_turns(self):
+        scheduler = FairScheduler(slots=1)
+        started: list[str] = []
+        hold = asyncio.Event()
+        hold.set()
+
+        # One tenant submits a bulk backlog just before another tenant's jobs arrive
+        async with scheduler.slot("warmup"):
+            tasks = await _run_jobs(scheduler, [("bulky", "bulk")] * 4 + [("other", "bulk")] * 2, started, hold)
+        await asyncio.gather(*tasks)
+
+        tenants = [name.split("-")[0] for name in started]
+        assert tenants == ["bulky", "other", "bulky", "other", "bulky", "bulky"]
+
+    @pytest.mark.asyncio
+    async def test_interactive_jobs_overtake_bulk_backlog(self):
+        scheduler = FairScheduler(slots=1)
+        started: list[str] = []
+        hold = asyncio.Event()
+        hold.set()
+
+        async with scheduler.slot("warmup"):
+            tasks = await _run_jobs(scheduler, [("batch", "bulk")] * 5, started, hold)
+            tasks += await _run_jobs(scheduler, [("user", "interactive")], started, hold)
+        await asyncio.gather(*tasks)
+
+        # Queued behind a backlog of bulk jobs, the interactive job still runs next
+        stats = scheduler.stats()
+        assert started[0] == "user-interactive-0"
+        assert all(name.startswith("batch") for name in started[1:])
+        assert stats["queued"] == 0
+        assert stats["running"] == 0
+        assert stats["tenants"]["batch"]["completed"] == 5
+        assert stats["priorities"]["interactive"]["samples"] == 2
+        assert stats["priorities"]["bulk"]["samples"] == 5
+
+    @pytest.mark.asyncio
+    async def test_at_most_slots_jobs_run_at_once(self):
+        scheduler = FairScheduler(slots=2)
+        started: list[str] = []
+        hold = asyncio.Event()
+        tasks = await _run_jobs(scheduler, [("a", "bulk")] * 5, started, hold)
+        await asyncio.sleep(0)
+
+        assert len(started) == 2
+        assert scheduler.stats()["running"] == 2
+        assert scheduler.stats()["tenants"]["a"]["queued"] == 3
+
+        hold.set()
+        await asyncio.gather(*tasks)
+        assert len(started) == 5
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiters_give_up_their_place(self):
+        scheduler = FairScheduler(slots=1)
+        started: list[str] = []
+        hold = asyncio.Event()
+        tasks = await _run_jobs(scheduler, [("a", "bulk")] * 3, started, hold)
+        tasks[1].cancel()
+        hold.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        stats = scheduler.stats()
+        assert started == ["a-bulk-0", "a-bulk-2"]
+        assert isinstance(results[1], asyncio.CancelledError)
+        assert stats["running"] == 0
+        assert stats["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unknown_priority(self):
+        with pytest.raises(UnknownPriority, match="Unknown priority"):
+            async with FairScheduler(slots=1).slot("a", "urgent"):
+                pass
+
+    @pytest.mark.asyncio
+    async def test_idle_tenants_are_forgotten(self):
+        scheduler = FairScheduler(slots=2, idle_tenants=2)
+        for tenant in ("a", "b", "c", "a"):
+            async with scheduler.slot(tenant):
+                pass
+
+        # Least recently active first, and never while the tenant has jobs
+        assert list(scheduler.stats()["tenants"]) == ["c", "a"]
+        async with scheduler.slot("busy"):
+            async with scheduler.slot("b"):
+                pass
+            assert "busy" in scheduler.stats()["tenants"]
+
+
+class TestRenderSlot:
+    @pytest.mark.asyncio
+    async def test_tenant_is_the_artifact_id_prefix(self):
+        req = MagicMock(get_header=lambda name: None)
+
+        for artifact_id, tenant in (("proj/doc", "proj"), ("doc", DEFAULT_TENANT), ("/doc", DEFAULT_TENANT)):
+            async with artifacts._render_slot(req, {"id": artifact_id}):
+                assert tenant in artifacts.scheduler.stats()["tenants"]
+
+    def test_unknown_priority_is_a_bad_request(self, client: testing.TestClient):
+        result = client.simulate_post(
+            "/v1/do/artifacts/GenerateArtifact",
+            json={"id": "proj/doc", "template": "blm-ce.html", "data": {"name": "Test"}, "priority": "urgent"},
+        )
+
+        assert result.json["command_response"]["http_status"] == 400
+        assert "urgent" in result.json["error"]
@@ -0,0 +1,77 @@
+import asyncio
+import base64
+from io import BytesIO
+from unittest.mock import AsyncMock, patch
+
+from pypdf import PdfReader, PdfWriter
+
+from main import artifacts
+from spool import MemoryBudget, buffer_size, read_buffer
+
+
+def _blank_pdf() -> bytes:
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class TestMemoryBudget:
+    def test_buffers_stay_in_memory_within_budget(self):
+        budget = MemoryBudget(10)
+        buffer = budget.store(b"12345")
+
+        assert not buffer._rolled
+        assert read_buffer(buffer) == b"12345"
+        assert budget.stats() == {"limit": 10, "peak": 5, "spilled": 0, "spilled_buffers": 0}
+
+    def test_buffers_beyond_budget_are_spooled_to_disk(self, tmp_path):
+        budget = MemoryBudget(10, spool_dir=str(tmp_path))
+        in_memory = budget.store(b"1234567")
+        spilled = budget.store(b"abcdef")
+
+        assert not in_memory._rolled
+        assert spilled._rolled
+        assert read_buffer(spilled) == b"abcdef"
+        assert buffer_size(spilled) == 6
+        assert budget.stats() == {"limit": 10, "peak": 7, "spilled": 6, "spilled_buffers": 1}
+        assert budget.header_value() == "limit=10, peak=7, spilled=6, spilled_buffers=1"
+
+        budget.close()
+        assert spilled.closed
+
+    def test_merge_reads_spooled_sections(self):
+        budget = MemoryBudget(0)
+        pdf = _blank_pdf()
+        merged, page_count = artifacts._merge_pdfs([budget.store(pdf), pdf, budget.store(pdf)])
+
+        assert len(PdfReader(BytesIO(merged)).pages) == page_count == 3
+        assert budget.stats()["spilled_buffers"] == 2
+        budget.close()
+
+    def test_held_data_counts_until_released(self):
+        budget = MemoryBudget(10)
+        with budget.hold(8):
+            spilled = budget.store(b"abc")
+        in_memory = budget.store(b"abc")
+
+        assert spilled._rolled
+        assert not in_memory._rolled
+        # peak is the most held at once, not the running total
+        assert budget.stats()["peak"] == 8
+        budget.close()
+
+    def test_attachment_data_urls_count_against_the_budget(self):
+        pdf = _blank_pdf()
+        data_url = "data:application/pdf;base64," + base64.b64encode(pdf).decode()
+        # Room for the three PDFs the artifact is merged from, but not for the data URL as well
+        budget = MemoryBudget(3 * len(pdf))
+
+        with patch.object(artifacts, "_html_to_pdf", AsyncMock(return_value=pdf)):
+            rendered = asyncio.run(
+                artifacts._generate_pdf_with_attachments("<html></html>", [], [data_url], budget=budget)
+            )
+
+        assert len(PdfReader(BytesIO(rendered.pdf)).pages) == rendered.page_count == 3
+        assert budget.stats()["spilled_buffers"] > 0
@@ -0,0 +1,268 @@
+"""
+Lightweight tracing with OpenTelemetry-shaped spans and W3C trace context.
+
+Incoming requests continue the caller's trace (the traceparent header) and outbound
+http/* requests carry it on. Spans are handed to an exporter: "stdout" and "file" write
+one JSON object per line and need no collector; any other TRACING_EXPORTER value is
+imported as "module:attribute" and called to build the exporter, which only needs an
+export(span: dict) method. With the default "none", span() does nothing.
+"""
+
+import importlib
+import json
+import logging
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache, wraps
+from typing import Any
+from urllib.parse import urlsplit, urlunsplit
+
+from config import tracing_config
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None = None,
+        kind: str = "INTERNAL",
+        attributes: dict[str, Any] | None = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.status = "OK"
+        self.status_message: str | None = None
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "ERROR"
+        self.status_message = str(error) or type(error).__name__
+        self.attributes["exception.type"] = type(error).__name__
+
+    def end(self) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        exporter = get_exporter()
+        if exporter is not None:
+            try:
+                exporter.export(self.to_dict())
+            except Exception:
+                logger.warning("Failed to export span %s", self.name, exc_info=True)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message},
+            "resource": {"service.name": tracing_config.service_name},
+        }
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class StdoutExporter:
+    def export(self, span: dict[str, Any]) -> None:
+        sys.stdout.write(json.dumps(span) + "\n")
+        sys.stdout.flush()
+
+
+class FileExporter:
+    """Appends spans to a JSON-lines file; short appends from several worker processes don't interleave."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: dict[str, Any]) -> None:
+        line = json.dumps(span) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+class MemoryExporter:
+    """Keeps spans in a list, e.g. for tests."""
+
+    def __init__(self):
+        self.spans: list[dict[str, Any]] = []
+
+    def export(self, span: dict[str, Any]) -> None:
+        self.spans.append(span)
+
+
+_exporter_override: list[Any] = []
+
+
+@cache
+def _configured_exporter():
+    name = tracing_config.exporter
+    if name in ("", "none"):
+        return None
+    if name == "stdout":
+        return StdoutExporter()
+    if name == "file":
+        return FileExporter(tracing_config.file)
+
+    module_name, _, attribute = name.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+def get_exporter():
+    if _exporter_override:
+        return _exporter_override[-1]
+    return _configured_exporter()
+
+
+@contextmanager
+def use_exporter(exporter):
+    """Send spans to exporter for the duration of the block."""
+    _exporter_override.append(exporter)
+    try:
+        yield exporter
+    finally:
+        _exporter_override.remove(exporter)
+
+
+def is_enabled() -> bool:
+    return get_exporter() is not None
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    """(trace id, parent span id) from a W3C traceparent header, or None if it's missing or invalid."""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2)
+
+
+def start_span(
+    name: str, parent: tuple[str, str] | None = None, kind: str = "INTERNAL", **attributes: Any
+) -> Span | None:
+    """A span that is a child of parent, or of the current span, or the root of a new trace."""
+    if not is_enabled():
+        return None
+
+    if parent is None and (current := _current_span.get()) is not None:
+        parent = (current.trace_id, current.span_id)
+    trace_id, parent_id = parent if parent else (secrets.token_hex(16), None)
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Record the block as a span, nested under the current one. Yields None when tracing is off."""
+    current = start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def inject(headers: dict[str, str] | None) -> dict[str, str] | None:
+    """headers plus the current trace context, for an outbound request."""
+    current = _current_span.get()
+    if current is None:
+        return headers
+    return {**(headers or {}), "traceparent": current.traceparent}
+
+
+def url_attribute(url: Any) -> str | None:
+    """A URL as recorded on a span: without its query string or credentials, which often carry secrets."""
+    try:
+        parts = urlsplit(str(url))
+    except ValueError:
+        return None
+    return urlunsplit((parts.scheme, parts.netloc.rpartition("@")[2], parts.path, "", ""))
+
+
+class TracedClient:
+    """Wraps an S3 (or compatible) client so that every API call is recorded as a span."""
+
+    # Computed locally, without a round trip to storage
+    _untraced = frozenset({"generate_presigned_url", "sign", "verify"})
+
+    def __init__(self, client, prefix: str = "s3"):
+        self._client = client
+        self._prefix = prefix
+
+    def __getattr__(self, name: str):
+        value = getattr(self._client, name)
+        if name.startswith("_") or name in self._untraced or not callable(value) or isinstance(value, type):
+            return value
+
+        @wraps(value)
+        def traced(*args, **kwargs):
+            with span(f"{self._prefix}.{name}", **{"s3.bucket": kwargs.get("Bucket"), "s3.key": kwargs.get("Key")}):
+                return value(*args, **kwargs)
+
+        return traced
+
+
+class TracingMiddleware:
+    """Continues the caller's trace (or starts one) for every request."""
+
+    async def process_request(self, req, resp):
+        # Paths hold ids, so the span is only named after the route once it is known
+        current = start_span(
+            req.method,
+            parent=parse_traceparent(req.get_header("traceparent")),
+            kind="SERVER",
+            **{"http.method": req.method, "http.target": req.path},
+        )
+        if current is not None:
+            req.context.trace_span = current
+            req.context.trace_token = _current_span.set(current)
+
+    async def process_response(self, req, resp, resource, req_succeeded):
+        current = getattr(req.context, "trace_span", None)
+        if current is None:
+            return
+
+        if req.uri_template:
+            current.name = f"{req.method} {req.uri_template}"
+        status = int(str(resp.status).split()[0])
+        current.set_attribute("http.status_code", status)
+        if status >= 500 or not req_succeeded:
+            current.status = "ERROR"
+        _current_span.reset(req.context.trace_token)
+        current.end()
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from config import service_config
+from s3utils import create_s3_client, get_bucket_for_storage
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Prepares the connector's dependencies ahead of the first request (templates, S3 clients
+    and connections, the shared Chromium instance) and reports readiness.
+    """
+
+    def __init__(self, artifacts):
+        self.artifacts = artifacts
+        self.status = "pending"
+        self.checks: dict[str, dict[str, Any]] = {}
+        self._task: asyncio.Task | None = None
+        self._last_run = 0.0
+
+    @property
+    def steps(self):
+        return {
+            "templates": self._warm_templates,
+            "storage": self._warm_storage,
+            "renderer": self._warm_renderer,
+        }
+
+    def start(self, only: list[str] | None = None) -> None:
+        """Run warm-up in the background so the server can accept liveness probes meanwhile."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(only))
+
+    async def run(self, only: list[str] | None = None) -> None:
+        self.status = "warming"
+        self._last_run = time.monotonic()
+
+        for name, step in self.steps.items():
+            if only is not None and name not in only:
+                continue
+
+            started = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                logger.warning("Warm-up step %s failed: %s", name, e)
+                self.checks[name] = {"ok": False, "error": str(e)}
+            else:
+                self.checks[name] = {"ok": True}
+            self.checks[name]["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        self.status = "ready" if all(check["ok"] for check in self.checks.values()) else "degraded"
+        logger.info("Warm-up finished: %s", self.status)
+
+    def report(self) -> dict[str, Any]:
+        """The readiness report. Failed checks are retried in the background, at most once per interval."""
+        failed = [name for name, check in self.checks.items() if not check["ok"]]
+        idle = self._task is None or self._task.done()
+        if failed and idle and time.monotonic() - self._last_run >= service_config.readiness_retry_interval:
+            self.start(only=failed)
+
+        render_pool = self.artifacts.render_pool
+        return {
+            "status": self.status,
+            "checks": self.checks,
+            "renderer": render_pool.stats()
+            if render_pool is not None
+            else {"running": self.artifacts.renderer.is_running},
+        }
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.artifacts.renderer.stop()
+        if self.artifacts.render_pool is not None:
+            await self.artifacts.render_pool.stop()
+
+    async def _warm_templates(self) -> None:
+        env = self.artifacts.env
+        for name in env.list_templates(extensions=["html"]):
+            env.get_template(name)
+        self.artifacts.static_assets()
+
+    async def _warm_storage(self) -> None:
+        # Builds the cached client and opens a pooled connection to the bucket
+        s3_client = await asyncio.to_thread(create_s3_client, None)
+        await asyncio.to_thread(s3_client.head_bucket, Bucket=get_bucket_for_storage(None))
+
+    async def _warm_renderer(self) -> None:
+        if self.artifacts.render_pool is not None:
+            # Chromium runs in the workers, which launch it on their first render
+            await self.artifacts.render_pool.start()
+            return
+
+        await self.artifacts.renderer.start()
+        # The first page and the first print are noticeably slower than the rest
+        async with self.artifacts.renderer.page() as page:
+            await page.set_content("<!doctype html><html><body></body></html>")
+            await page.pdf()
+
+
+class LifespanMiddleware:
+    """Hooks warm-up and cleanup into the ASGI lifespan events."""
+
+    def __init__(self, warmup: Warmup):
+        self.warmup = warmup
+
+    async def process_startup(self, scope, event):
+        if service_config.warmup:
+            self.warmup.start()
+        else:
+            # Everything is loaded lazily on first use instead
+            self.warmup.status = "ready"
+
+    async def process_shutdown(self, scope, event):
+        await self.warmup.stop()